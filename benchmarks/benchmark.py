@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Benchmark Suite
+===========================
+Measures the speed and memory use of the main TableFS operations
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+Usage:
+  python benchmarks/benchmark.py [--rows N] [--save] [--tolerance 0.25]
+
+Each operation is timed as the best of a number of repeats, and its
+peak memory is measured with tracemalloc. The results are compared to
+the stored baseline, and the script exits with status 1 if any
+operation is slower, or uses more memory, than the baseline by more
+than the tolerance. Use --save to store the results as a new baseline.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+
+from madxtools import TableFS  # noqa: E402
+from generate import writeTrackFile, writeTwissFile  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+
+def benchTwiss(fileName, nRows):
+    """Yield the name, row count and function of each twiss benchmark.
+    """
+    def readSlow():
+        TableFS(fileName)
+
+    def readFast():
+        TableFS(fileName, fastParse=True)
+
+    def readCols():
+        TableFS(fileName, useCols=["NAME", "S"])
+
+    tfsSlow = TableFS(fileName)
+
+    def convert():
+        tfsObj = TableFS()
+        tfsObj.varNames, tfsObj.varTypes = tfsSlow.varNames, tfsSlow.varTypes
+        tfsObj.Data = {vN: list(tfsSlow.Data[vN]) for vN in tfsSlow.varNames}
+        tfsObj.convertToNumpy()
+
+    tfsFast = TableFS(fileName, fastParse=True)
+    midName = tfsFast.Data["NAME"][nRows//2]
+
+    def findIndex():
+        tfsFast._searchCache = {}
+        tfsFast.findDataIndex("KEYWORD", "QUAD")
+
+    def shiftSeq():
+        tfsFast.shiftSeq(midName, inPlace=True)
+        tfsFast.shiftSeq(tfsFast.Data["NAME"][nRows - nRows//2], inPlace=True)
+
+    yield "twiss.readFile", nRows, readSlow
+    yield "twiss.readFile.fastParse", nRows, readFast
+    yield "twiss.readFile.useCols", nRows, readCols
+    yield "twiss.convertToNumpy", nRows, convert
+    yield "twiss.findDataIndex", nRows, findIndex
+    yield "twiss.shiftSeq", 2*nRows, shiftSeq
+
+def benchTrack(fileName, nRows):
+    """Yield the name, row count and function of each trackone
+    benchmark.
+    """
+    def readSlow():
+        TableFS(fileName)
+
+    def readFast():
+        TableFS(fileName, fastParse=True)
+
+    yield "trackone.readFile", nRows, readSlow
+    yield "trackone.readFile.fastParse", nRows, readFast
+
+def runBench(theFunc, nRepeat):
+    """Return the best wall time and the peak traced memory of a
+    function. The peak memory is measured in a separate run, since
+    tracing slows down the code.
+    """
+    bestTime = None
+    for _ in range(nRepeat):
+        tStart = time.perf_counter()
+        theFunc()
+        tElapsed = time.perf_counter() - tStart
+        bestTime = tElapsed if bestTime is None else min(bestTime, tElapsed)
+
+    tracemalloc.start()
+    try:
+        theFunc()
+        _, peakMem = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return bestTime, peakMem
+
+def compareResults(theResults, theBaseline, tolerance):
+    """Return a list of messages for each result that is worse than
+    the baseline by more than the tolerance.
+    """
+    theIssues = []
+    for benchName, theResult in theResults.items():
+        baseResult = theBaseline.get(benchName)
+        if baseResult is None:
+            continue
+        if theResult["rowsPerSec"] < baseResult["rowsPerSec"]*(1.0 - tolerance):
+            theIssues.append("%s: %.0f rows/s is below the baseline of %.0f rows/s" % (
+                benchName, theResult["rowsPerSec"], baseResult["rowsPerSec"]
+            ))
+        if theResult["peakMem"] > baseResult["peakMem"]*(1.0 + tolerance):
+            theIssues.append("%s: %.1f MB peak memory is above the baseline of %.1f MB" % (
+                benchName, theResult["peakMem"]/1e6, baseResult["peakMem"]/1e6
+            ))
+
+    return theIssues
+
+def main(cliArgs=None):
+    """Generate the data files, run the benchmarks, and compare the
+    results to the baseline.
+    """
+    argParser = argparse.ArgumentParser(description="MadXTools benchmark suite")
+    argParser.add_argument("--rows", type=int, default=200000, help="Rows of the twiss table")
+    argParser.add_argument("--cols", type=int, default=10, help="Columns of the twiss table")
+    argParser.add_argument("--part", type=int, default=100, help="Particles in trackone file")
+    argParser.add_argument("--turns", type=int, default=500, help="Turns in trackone file")
+    argParser.add_argument("--repeat", type=int, default=3, help="Repeats of each benchmark")
+    argParser.add_argument("--data", default=os.path.join(BENCH_DIR, "data"),
+                           help="Folder for the generated files")
+    argParser.add_argument("--baseline", default=BASELINE_FILE, help="The baseline file")
+    argParser.add_argument("--tolerance", type=float, default=0.25,
+                           help="Allowed fractional regression")
+    argParser.add_argument("--save", action="store_true", help="Save results as the baseline")
+    theArgs = argParser.parse_args(cliArgs)
+
+    logging.getLogger("madxtools").setLevel(logging.WARNING)
+
+    if not os.path.isdir(theArgs.data):
+        os.makedirs(theArgs.data)
+
+    twissFile = os.path.join(theArgs.data, "twiss_%d_%d.tfs" % (theArgs.rows, theArgs.cols))
+    trackFile = os.path.join(theArgs.data, "track_%d_%d.one" % (theArgs.part, theArgs.turns))
+    if not os.path.isfile(twissFile):
+        print("Generating %s" % twissFile)
+        writeTwissFile(twissFile, theArgs.rows, theArgs.cols)
+    if not os.path.isfile(trackFile):
+        print("Generating %s" % trackFile)
+        writeTrackFile(trackFile, theArgs.part, theArgs.turns)
+
+    allBench = [(twissFile, b) for b in benchTwiss(twissFile, theArgs.rows)]
+    allBench += [(trackFile, b) for b in benchTrack(trackFile, theArgs.part*theArgs.turns*2)]
+
+    theResults = {}
+    print("%-30s %12s %10s %10s %10s" % ("Benchmark", "Rows/s", "MB/s", "Time [s]", "Peak [MB]"))
+    for fileName, (benchName, nRows, theFunc) in allBench:
+        bestTime, peakMem = runBench(theFunc, theArgs.repeat)
+        fileSize = os.path.getsize(fileName)
+        theResults[benchName] = {
+            "rows": nRows,
+            "bytes": fileSize,
+            "seconds": bestTime,
+            "rowsPerSec": nRows/bestTime,
+            "mbPerSec": fileSize/bestTime/1e6,
+            "peakMem": peakMem,
+        }
+        print("%-30s %12.0f %10.1f %10.4f %10.1f" % (
+            benchName, nRows/bestTime, fileSize/bestTime/1e6, bestTime, peakMem/1e6
+        ))
+
+    theConfig = {
+        "rows": theArgs.rows, "cols": theArgs.cols, "part": theArgs.part, "turns": theArgs.turns,
+        "python": platform.python_version(), "numpy": np.__version__,
+        "machine": platform.machine(),
+    }
+
+    if theArgs.save:
+        with open(theArgs.baseline, mode="w") as outFile:
+            json.dump({"config": theConfig, "results": theResults}, outFile, indent=2)
+        print("Baseline saved to %s" % theArgs.baseline)
+        return 0
+
+    if not os.path.isfile(theArgs.baseline):
+        print("No baseline found, run with --save to create one")
+        return 0
+
+    with open(theArgs.baseline, mode="r") as inFile:
+        theBaseline = json.load(inFile)
+    if theBaseline["config"] != theConfig:
+        print("Warning: The baseline was recorded with a different configuration")
+
+    theIssues = compareResults(theResults, theBaseline["results"], theArgs.tolerance)
+    for theIssue in theIssues:
+        print("REGRESSION %s" % theIssue)
+    if theIssues:
+        return 1
+
+    print("No regressions beyond %.0f%% of the baseline" % (100*theArgs.tolerance))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
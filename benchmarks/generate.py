@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Benchmark Data Generator
+====================================
+Writes synthetic twiss and trackone TFS files of a given size
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+KEYWORDS = ("MARKER", "DRIFT", "QUADRUPOLE", "SBEND", "SEXTUPOLE", "MONITOR", "MULTIPOLE")
+TRACK_COLUMNS = ("NUMBER", "TURN", "X", "PX", "Y", "PY", "T", "PT", "S", "E")
+
+def writeTwissFile(fileName, nRows, nCols=10, seed=42):
+    """Write a twiss table with nRows elements. The table has quoted
+    NAME and KEYWORD columns, the S and L columns, and random float
+    columns up to a total of nCols columns.
+    """
+    rndGen = np.random.default_rng(seed)
+    nFloat = max(nCols - 4, 1)
+
+    elemLen = np.where(rndGen.random(nRows) < 0.5, 0.0, rndGen.uniform(0.1, 5.0, nRows))
+    elemLen[0] = 0.0
+    sData = np.cumsum(elemLen)
+    keyWords = np.array(KEYWORDS)[rndGen.integers(0, len(KEYWORDS), nRows)]
+    floatData = rndGen.normal(0.0, 50.0, (nRows, nFloat))
+
+    colNames = ["NAME", "KEYWORD", "S", "L"] + ["COL%03d" % i for i in range(nFloat)]
+    colTypes = ["%s", "%s"] + ["%le"]*(nFloat + 2)
+    rowFmt = " %-18s %-14s " + " ".join(["%18.10g"]*(nFloat + 2)) + "\n"
+    with open(fileName, mode="w") as outFile:
+        _writeHeader(outFile, {
+            "NAME": "TWISS", "TYPE": "TWISS", "SEQUENCE": "SYNTHETIC",
+            "LENGTH": float(sData[-1]), "NROWS": nRows,
+        }, colNames, colTypes)
+        for i in range(nRows):
+            outFile.write(rowFmt % (
+                ('"E%07d"' % i, '"%s"' % keyWords[i], sData[i], elemLen[i]) + tuple(floatData[i])
+            ))
+
+    return
+
+def writeTrackFile(fileName, nPart, nTurns, nObs=2, seed=42):
+    """Write a trackone file of nPart particles tracked for nTurns
+    turns and recorded at nObs observation points, with a '#segment'
+    block for each turn and observation point.
+    """
+    rndGen = np.random.default_rng(seed)
+    colTypes = ["%le"]*len(TRACK_COLUMNS)
+    rowFmt = " " + " ".join(["%18.10g"]*len(TRACK_COLUMNS)) + "\n"
+    partNums = np.arange(1, nPart + 1, dtype="float")
+    obsPos = np.linspace(0.0, 100.0, nObs + 1)[:-1]
+
+    with open(fileName, mode="w") as outFile:
+        _writeHeader(outFile, {"NAME": "TRACKONE", "TYPE": "TRACKONE"}, TRACK_COLUMNS, colTypes)
+        iSeg = 0
+        for iTurn in range(nTurns):
+            for iObs in range(nObs):
+                iSeg += 1
+                outFile.write("#segment %7d %7d %7d %7d %s\n" % (
+                    iSeg, nTurns*nObs, nPart, iObs, "obs%d" % iObs if iObs else "start"
+                ))
+                theBlock = np.empty((nPart, len(TRACK_COLUMNS)))
+                theBlock[:, 0] = partNums
+                theBlock[:, 1] = iTurn
+                theBlock[:, 2:8] = rndGen.normal(0.0, 1e-3, (nPart, 6))
+                theBlock[:, 8] = obsPos[iObs]
+                theBlock[:, 9] = 7000.0
+                outFile.writelines(rowFmt % tuple(theRow) for theRow in theBlock)
+
+    return
+
+##
+#  Internal Functions
+##
+
+def _writeHeader(outFile, metaData, colNames, colTypes):
+    """Write the metadata and column header lines.
+    """
+    for mName, mValue in metaData.items():
+        if isinstance(mValue, int):
+            outFile.write("@ %-16s %-5s %d\n" % (mName, "%d", mValue))
+        elif isinstance(mValue, float):
+            outFile.write("@ %-16s %-5s %r\n" % (mName, "%le", mValue))
+        else:
+            outFile.write('@ %-16s %%%02ds "%s"\n' % (mName, len(mValue), mValue))
+
+    outFile.write("* " + " ".join("%18s" % vN for vN in colNames) + "\n")
+    outFile.write("$ " + " ".join("%18s" % vT for vT in colTypes) + "\n")
+
+    return
@@ -23,12 +23,50 @@ along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 import os
 import logging
-
-from .tablefs import TableFS
+import importlib
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["TableFS"]
+# The public classes and functions, and their modules. They are
+# imported on first access, so that importing the package, for instance
+# by the command line tool, does not load NumPy and the other modules.
+_LAZY_IMPORTS = {
+    "TableLoader":  ".aio",
+    "gatherTables": ".aio",
+    "fftTunes":     ".analysis",
+    "groupTurns":   ".analysis",
+    "naffTunes":    ".analysis",
+    "trackTensor":  ".analysis",
+    "trackTunes":   ".analysis",
+    "TableCache":   ".cache",
+    "TableCatalog": ".catalog",
+    "scanHeaders":  ".catalog",
+    "SharedTable":  ".shared",
+    "attachTable":  ".shared",
+    "TableStats":   ".stats",
+    "TableFS":      ".tablefs",
+    "TrackSet":     ".trackset",
+    "loadTrackSet": ".trackset",
+    "TFSWriter":    ".writer",
+}
+
+__all__ = [
+    "SharedTable", "TableCache", "TableCatalog", "TableFS", "TableLoader", "TableStats",
+    "TFSWriter", "TrackSet", "attachTable", "fftTunes", "gatherTables", "groupTurns",
+    "loadTrackSet", "naffTunes", "scanHeaders", "trackTensor", "trackTunes",
+]
+
+def __getattr__(attrName):
+    if attrName not in _LAZY_IMPORTS:
+        raise AttributeError("module '%s' has no attribute '%s'" % (__name__, attrName))
+
+    attrValue = getattr(importlib.import_module(_LAZY_IMPORTS[attrName], __name__), attrName)
+    globals()[attrName] = attrValue
+
+    return attrValue
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
 
 # Package Meta
 __author__     = "Veronica Berglyd Olsen"
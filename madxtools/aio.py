@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Asyncio Table Loading
+=================================
+Loads TFS tables in an executor without blocking the event loop
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import logging
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .tablefs import TableFS
+
+logger = logging.getLogger(__name__)
+
+class TableLoader:
+    """Loads tables in an executor from asyncio code, with at most
+    maxConcurrent loads submitted to the executor at a time. Waiting
+    loads can be cancelled. A load that has started runs to the end in
+    the executor, but its result is discarded if it was cancelled.
+
+    The default executor is a pool of maxConcurrent threads, owned by
+    the loader. The parser holds the GIL for much of a load, so for
+    large files a ProcessPoolExecutor keeps the event loop more
+    responsive. Its worker processes return the tables by pickling, so
+    a statsHook must then be a module level function, and lazy tables
+    can not be returned.
+    """
+
+    def __init__(self, maxConcurrent=4, executor=None):
+
+        if maxConcurrent < 1:
+            raise ValueError("The number of concurrent loads must be positive")
+
+        self.maxConcurrent = maxConcurrent
+
+        self._ownExecutor = executor is None
+        self._theExecutor = executor or ThreadPoolExecutor(max_workers=maxConcurrent)
+        self._theLimit    = None
+        self._limitLoop   = None
+
+        return
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, excType, excValue, excTrace):
+        self.close()
+        return False
+
+    async def read(self, fileName, **readArgs):
+        """Load a single table. The keyword arguments are passed to the
+        TableFS constructor.
+        """
+        theLoop = asyncio.get_running_loop()
+        async with self._getLimit(theLoop):
+            return await theLoop.run_in_executor(
+                self._theExecutor, functools.partial(_loadTable, fileName, readArgs)
+            )
+
+    async def gather(self, fileNames, returnExceptions=False, **readArgs):
+        """Load several tables, and return them in the order of
+        fileNames. With returnExceptions, a failed load returns its
+        exception in place of the table, otherwise the first error is
+        raised and the remaining loads are cancelled.
+        """
+        allTasks = [asyncio.ensure_future(self.read(fN, **readArgs)) for fN in fileNames]
+        try:
+            return await asyncio.gather(*allTasks, return_exceptions=returnExceptions)
+        finally:
+            for theTask in allTasks:
+                theTask.cancel()
+
+    def close(self):
+        """Shut down the executor if it is owned by the loader, without
+        waiting for running loads.
+        """
+        if self._ownExecutor:
+            self._theExecutor.shutdown(wait=False)
+
+        return
+
+    ##
+    #  Internal Functions
+    ##
+
+    def _getLimit(self, theLoop):
+        """Return the semaphore of the running event loop.
+        """
+        if self._theLimit is None or self._limitLoop is not theLoop:
+            self._theLimit = asyncio.Semaphore(self.maxConcurrent)
+            self._limitLoop = theLoop
+
+        return self._theLimit
+
+## End Class TableLoader
+
+_defaultLoader = None
+
+def defaultLoader():
+    """Return the shared loader used by TableFS.aread and gatherTables.
+    """
+    global _defaultLoader
+    if _defaultLoader is None:
+        _defaultLoader = TableLoader()
+
+    return _defaultLoader
+
+async def gatherTables(fileNames, loader=None, returnExceptions=False, **readArgs):
+    """Load several tables concurrently, see TableLoader.gather. The
+    shared default loader is used if loader is None.
+    """
+    if loader is None:
+        loader = defaultLoader()
+
+    return await loader.gather(fileNames, returnExceptions=returnExceptions, **readArgs)
+
+##
+#  Internal Functions
+##
+
+def _loadTable(fileName, readArgs):
+    """Load a table in the executor.
+    """
+    return TableFS(fileName, **readArgs)
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Tracking Analysis
+=============================
+Regrouping of tracking data by particle and turn, and tune analysis
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# The number of (particle, turn) elements processed at a time by the
+# tune functions when no chunkSize is given. The NAFF refinement keeps
+# a few complex arrays of this size.
+CHUNK_ELEMENTS = 2**21
+
+TUNE_WINDOWS = ("hann", None)
+
+def groupTurns(tfsObj, columnNames=("X", "PX", "Y", "PY"), obsNumber=None):
+    """Regroup the rows of a tracking table into arrays of shape
+    (particle, turn), using the NUMBER and TURN columns. Returns the
+    sorted particle numbers, the sorted turn numbers, and a dictionary
+    of the arrays. Turns missing for a particle, for instance after it
+    was lost, are NaN. For trackone files with several observation
+    points, obsNumber selects one of them.
+    """
+    if isinstance(columnNames, str):
+        columnNames = [columnNames]
+
+    rowData, partNumbers, turnNumbers, partIdx, turnIdx = _turnIndex(
+        tfsObj, columnNames, obsNumber
+    )
+    nPart, nTurn = len(partNumbers), len(turnNumbers)
+    flatIdx = partIdx*nTurn + turnIdx
+    if len(np.unique(flatIdx)) != len(flatIdx):
+        raise ValueError("The table has more than one row for some particle and turn")
+
+    turnData = {}
+    for colName in columnNames:
+        colArr = np.full(nPart*nTurn, np.nan)
+        colArr[flatIdx] = rowData[colName]
+        turnData[colName] = colArr.reshape(nPart, nTurn)
+
+    logger.debug("Grouped %d rows into %d particles and %d turns" % (
+        len(flatIdx), nPart, nTurn
+    ))
+
+    return partNumbers, turnNumbers, turnData
+
+def trackTensor(tfsObj, columnNames=("X", "PX", "Y", "PY", "T", "PT"), obsNumber=None,
+                outArr=None, fillValue=np.nan):
+    """Scatter the rows of a tracking table into a dense array of shape
+    (particle, turn, column), using the NUMBER and TURN columns. Returns
+    the sorted particle numbers, the sorted turn numbers, the array, a
+    boolean mask of shape (particle, turn) that is True where a row was
+    recorded, and the loss turn of each particle. The loss turn is the
+    first turn of the table after the last turn the particle was seen,
+    or -1 if it was seen on the last turn. Missing entries are set to
+    fillValue.
+
+    The array can be written straight into outArr, for instance a
+    preallocated array, or a memory-mapped file from open_memmap in
+    numpy.lib.format, which must have the shape of the result.
+    """
+    if isinstance(columnNames, str):
+        columnNames = [columnNames]
+
+    rowData, partNumbers, turnNumbers, partIdx, turnIdx = _turnIndex(
+        tfsObj, columnNames, obsNumber
+    )
+    nPart, nTurn, nCol = len(partNumbers), len(turnNumbers), len(columnNames)
+
+    validMask = np.zeros((nPart, nTurn), dtype=bool)
+    validMask[partIdx, turnIdx] = True
+    if np.count_nonzero(validMask) != len(partIdx):
+        raise ValueError("The table has more than one row for some particle and turn")
+
+    if outArr is None:
+        outArr = np.empty((nPart, nTurn, nCol))
+    elif outArr.shape != (nPart, nTurn, nCol):
+        raise ValueError("The output array has shape %s, but the table needs %s" % (
+            str(outArr.shape), str((nPart, nTurn, nCol))
+        ))
+
+    outArr[~validMask] = fillValue
+    for iCol, colName in enumerate(columnNames):
+        outArr[partIdx, turnIdx, iCol] = rowData[colName]
+
+    lastIdx = nTurn - 1 - np.argmax(validMask[:, ::-1], axis=1)
+    lossTurn = np.full(nPart, -1, dtype="int64")
+    isLost = lastIdx < nTurn - 1
+    lossTurn[isLost] = turnNumbers[lastIdx[isLost] + 1]
+
+    logger.debug("Scattered %d rows into a tensor of %d particles, %d turns and %d columns" % (
+        len(partIdx), nPart, nTurn, nCol
+    ))
+
+    return partNumbers, turnNumbers, outArr, validMask, lossTurn
+
+def fftTunes(turnData, window="hann", chunkSize=None):
+    """Compute the tune of each row of an array of shape (particle,
+    turn) from the peak of its windowed FFT, interpolated between the
+    neighbouring bins. A real signal gives tunes between 0 and 0.5, a
+    complex signal like x - 1j*px gives tunes between 0 and 1. Rows
+    with NaN values give NaN. The rows are processed chunkSize at a
+    time to bound the memory use.
+    """
+    return _batchTunes(turnData, window, chunkSize, 0)
+
+def naffTunes(turnData, window="hann", nIter=3, chunkSize=None):
+    """Compute the tune of each row of an array of shape (particle,
+    turn) like fftTunes, and refine it by maximising the amplitude of
+    the windowed Fourier integral, as in NAFF. The maximum is found by
+    nIter Newton steps for all rows at once, starting from the
+    interpolated FFT peak.
+    """
+    if nIter < 0:
+        raise ValueError("The number of iterations can not be negative")
+
+    return _batchTunes(turnData, window, chunkSize, nIter)
+
+def trackTunes(tfsObj, columnNames=("X", "Y"), method="naff", obsNumber=None, chunkSize=None):
+    """Compute the tunes of all particles of a tracking table from the
+    given columns, see groupTurns. Returns the particle numbers and a
+    dictionary of tune arrays. The method is either 'fft' or 'naff'.
+    """
+    tuneFuncs = {"fft": fftTunes, "naff": naffTunes}
+    if method not in tuneFuncs:
+        raise ValueError("Unknown tune method '%s'" % method)
+
+    partNumbers, _, turnData = groupTurns(tfsObj, columnNames, obsNumber=obsNumber)
+    theTunes = {
+        colName: tuneFuncs[method](colArr, chunkSize=chunkSize)
+        for colName, colArr in turnData.items()
+    }
+
+    return partNumbers, theTunes
+
+##
+#  Internal Functions
+##
+
+def _turnIndex(tfsObj, columnNames, obsNumber):
+    """Select the rows of an observation point, check the columns, and
+    return the rows, the sorted particle and turn numbers, and the
+    particle and turn index of each row.
+    """
+    obsNumbers = sorted(set(theSeg["obsNumber"] for theSeg in tfsObj.segments))
+    if obsNumber is None and len(obsNumbers) > 1:
+        raise ValueError(
+            "The table has %d observation points, select one with obsNumber" % len(obsNumbers)
+        )
+    if obsNumber is None and obsNumbers:
+        obsNumber = obsNumbers[0]
+
+    if obsNumber is None:
+        rowData = tfsObj.Data
+    else:
+        rowData = tfsObj.getObservation(obsNumber)
+
+    for colName in ["NUMBER", "TURN"] + list(columnNames):
+        if colName not in tfsObj.varNames:
+            raise KeyError("No column named '%s' in the table" % colName)
+    for colName in columnNames:
+        if tfsObj.varTypes[tfsObj.varNames.index(colName)] not in ("%le", "%d"):
+            raise ValueError("Column '%s' is not numeric" % colName)
+
+    partNumbers, partIdx = np.unique(
+        np.asarray(rowData["NUMBER"]).astype("int64"), return_inverse=True
+    )
+    turnNumbers, turnIdx = np.unique(
+        np.asarray(rowData["TURN"]).astype("int64"), return_inverse=True
+    )
+
+    return rowData, partNumbers, turnNumbers, partIdx, turnIdx
+
+def _batchTunes(turnData, window, chunkSize, nIter):
+    """Compute the tunes of the rows of turnData in chunks.
+    """
+    if window not in TUNE_WINDOWS:
+        raise ValueError("Unknown window '%s'" % window)
+
+    turnData = np.asarray(turnData)
+    if turnData.ndim != 2:
+        raise ValueError("The turn data must be an array of shape (particle, turn)")
+
+    nPart, nTurn = turnData.shape
+    if nTurn < 4:
+        raise ValueError("At least 4 turns are needed to compute tunes")
+
+    if chunkSize is None:
+        chunkSize = max(1, CHUNK_ELEMENTS//nTurn)
+
+    if window == "hann":
+        winArr = 1.0 - np.cos(2.0*np.pi*np.arange(nTurn)/nTurn)
+    else:
+        winArr = np.ones(nTurn)
+
+    theTunes = np.full(nPart, np.nan)
+    for iStart in range(0, nPart, chunkSize):
+        theChunk = turnData[iStart:iStart+chunkSize]
+        isGood = np.isfinite(theChunk).all(axis=1)
+        if not isGood.any():
+            continue
+
+        theChunk = theChunk[isGood]
+        theChunk = (theChunk - theChunk.mean(axis=1, keepdims=True))*winArr
+
+        chunkTunes = _peakTunes(theChunk, window)
+        if nIter > 0:
+            chunkTunes = _refineTunes(theChunk, chunkTunes, nIter)
+
+        if not np.iscomplexobj(theChunk):
+            chunkTunes = np.abs(chunkTunes)
+        theTunes[iStart:iStart+chunkSize][isGood] = chunkTunes % 1.0
+
+    return theTunes
+
+def _peakTunes(winData, window):
+    """Find the peak of the spectrum of each row of windowed data, and
+    interpolate between the peak bin and its largest neighbour. The
+    interpolation is exact for a pure tone.
+    """
+    nRows, nTurn = winData.shape
+    if np.iscomplexobj(winData):
+        theSpec = np.abs(np.fft.fft(winData, axis=1))
+    else:
+        theSpec = np.abs(np.fft.rfft(winData, axis=1))
+    theSpec[:, 0] = 0.0
+
+    nBins = theSpec.shape[1]
+    rowIdx = np.arange(nRows)
+    peakBin = np.argmax(theSpec, axis=1)
+    peakAmp = theSpec[rowIdx, peakBin]
+    ampLeft = theSpec[rowIdx, (peakBin - 1) % nBins]
+    ampRight = theSpec[rowIdx, (peakBin + 1) % nBins]
+    if not np.iscomplexobj(winData):
+        ampLeft[peakBin == 0] = 0.0
+        ampRight[peakBin == nBins - 1] = 0.0
+
+    useRight = ampRight >= ampLeft
+    binRatio = np.where(useRight, ampRight, ampLeft)/np.where(peakAmp > 0.0, peakAmp, 1.0)
+    if window == "hann":
+        binShift = (2.0*binRatio - 1.0)/(binRatio + 1.0)
+    else:
+        binShift = binRatio/(binRatio + 1.0)
+    binShift = np.clip(binShift, 0.0, 1.0)
+
+    return (peakBin + np.where(useRight, binShift, -binShift))/nTurn
+
+def _refineTunes(winData, theTunes, nIter):
+    """Refine the tunes with Newton steps on the squared amplitude of
+    the Fourier integral of each row at its tune. The turn index is
+    centred to keep the derivatives well conditioned. Steps are limited
+    to half a bin.
+    """
+    nTurn = winData.shape[1]
+    turnIdx = np.arange(nTurn) - 0.5*(nTurn - 1)
+    maxStep = 0.5/nTurn
+    theTunes = theTunes.copy()
+
+    for _ in range(nIter):
+        thePhase = np.exp(np.outer(-2j*np.pi*theTunes, turnIdx))
+        thePhase *= winData
+        theSum0 = thePhase.sum(axis=1)
+        theSum1 = -2j*np.pi*(thePhase @ turnIdx)
+        theSum2 = -4.0*np.pi**2*(thePhase @ turnIdx**2)
+
+        gradOne = 2.0*np.real(np.conj(theSum0)*theSum1)
+        gradTwo = 2.0*(np.abs(theSum1)**2 + np.real(np.conj(theSum0)*theSum2))
+        theStep = np.where(gradTwo < 0.0, -gradOne/np.where(gradTwo < 0.0, gradTwo, -1.0), 0.0)
+        theTunes += np.clip(theStep, -maxStep, maxStep)
+
+    return theTunes
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : TFS Table Cache
+===========================
+On-disk binary cache of parsed TFS tables
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class TableCache:
+    """Stores parsed TFS tables as one .npy file per column plus a JSON
+    header in a cache folder. Entries are keyed by the absolute path of
+    the source file, and are invalid if its size or modification time
+    has changed. When the cache grows beyond maxBytes, the least
+    recently used entries are removed.
+    """
+
+    HEADER_FILE = "header.json"
+
+    def __init__(self, cacheDir, maxBytes=4*1024**3):
+
+        self.cacheDir = os.path.abspath(cacheDir)
+        self.maxBytes = maxBytes
+
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir)
+
+        return
+
+    def load(self, fileName):
+        """Look up a file in the cache. Returns a tuple of metadata,
+        variable names, variable types, a dictionary of read-only
+        memory-mapped columns and the segment list, or None if there is
+        no valid entry.
+        """
+        entryDir = self._entryDir(fileName)
+        headFile = os.path.join(entryDir, self.HEADER_FILE)
+        try:
+            with open(headFile, mode="r") as inFile:
+                theHead = json.load(inFile)
+            fileStat = os.stat(fileName)
+        except (OSError, ValueError):
+            return None
+
+        if theHead["size"] != fileStat.st_size or theHead["mtime"] != fileStat.st_mtime_ns:
+            logger.debug("Cache entry for '%s' is out of date" % fileName)
+            return None
+
+        colData = {}
+        try:
+            for i, vN in enumerate(theHead["varNames"]):
+                colData[vN] = np.load(os.path.join(entryDir, "col%04d.npy" % i), mmap_mode="r")
+        except (OSError, ValueError):
+            logger.warning("Cache entry for '%s' is damaged" % fileName)
+            return None
+
+        # Record the access for the eviction order
+        try:
+            os.utime(headFile)
+        except OSError:
+            pass
+        logger.debug("Loaded '%s' from cache" % fileName)
+
+        return (
+            theHead["metaData"], theHead["varNames"], theHead["varTypes"], colData,
+            theHead["segments"]
+        )
+
+    def store(self, fileName, metaData, varNames, varTypes, colData, segments=None):
+        """Write a parsed table to the cache. The columns must already
+        be NumPy arrays.
+        """
+        fileStat = os.stat(fileName)
+        entryDir = self._entryDir(fileName)
+        tempDir = tempfile.mkdtemp(prefix=".tmp", dir=self.cacheDir)
+        try:
+            for i, vN in enumerate(varNames):
+                np.save(os.path.join(tempDir, "col%04d.npy" % i), colData[vN])
+            with open(os.path.join(tempDir, self.HEADER_FILE), mode="w") as outFile:
+                json.dump({
+                    "fileName": os.path.abspath(fileName),
+                    "size": fileStat.st_size,
+                    "mtime": fileStat.st_mtime_ns,
+                    "metaData": metaData,
+                    "varNames": varNames,
+                    "varTypes": varTypes,
+                    "segments": segments or [],
+                }, outFile)
+            if os.path.isdir(entryDir):
+                shutil.rmtree(entryDir)
+            os.rename(tempDir, entryDir)
+        except OSError:
+            logger.warning("Could not write cache entry for '%s'" % fileName)
+            shutil.rmtree(tempDir, ignore_errors=True)
+            return
+
+        self.evict()
+
+        return
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is
+        within its size limit.
+        """
+        if self.maxBytes is None:
+            return
+
+        allEntries = []
+        totBytes = 0
+        for entryName in os.listdir(self.cacheDir):
+            entryDir = os.path.join(self.cacheDir, entryName)
+            if entryName.startswith(".") or not os.path.isdir(entryDir):
+                continue
+            try:
+                lastUse = os.stat(os.path.join(entryDir, self.HEADER_FILE)).st_mtime_ns
+                entrySize = sum(e.stat().st_size for e in os.scandir(entryDir))
+            except OSError:
+                continue
+            allEntries.append((lastUse, entrySize, entryDir))
+            totBytes += entrySize
+
+        for lastUse, entrySize, entryDir in sorted(allEntries):
+            if totBytes <= self.maxBytes:
+                break
+            logger.debug("Evicting cache entry '%s'" % entryDir)
+            shutil.rmtree(entryDir, ignore_errors=True)
+            totBytes -= entrySize
+
+        return
+
+    def clear(self):
+        """Remove all entries from the cache.
+        """
+        for entryName in os.listdir(self.cacheDir):
+            entryDir = os.path.join(self.cacheDir, entryName)
+            if os.path.isdir(entryDir):
+                shutil.rmtree(entryDir, ignore_errors=True)
+
+        return
+
+    ##
+    #  Internal Functions
+    ##
+
+    def _entryDir(self, fileName):
+        """The cache folder for a given source file.
+        """
+        pathHash = hashlib.sha1(os.path.abspath(fileName).encode("utf-8"))
+        return os.path.join(self.cacheDir, pathHash.hexdigest())
+
+## End Class TableCache
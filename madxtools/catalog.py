@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : TFS File Catalog
+============================
+Fast scanning of the headers of many TFS files, and an SQLite catalog
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import glob
+import sqlite3
+import fnmatch
+import logging
+import itertools
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .fileio import openTableFile
+from .header import readHeader, readTableHeader
+from .parser import iterDataChunks
+
+logger = logging.getLogger(__name__)
+
+# The number of rows of tracking files parsed at a time by the scan
+SCAN_CHUNK_ROWS = 100000
+
+def scanHeaders(filePaths, nWorkers=None, filePattern="*"):
+    """Read the headers of a set of TFS files in parallel. The files can
+    be given as a list, a glob pattern, or a folder which is searched
+    recursively for files matching filePattern. Returns a dictionary of
+    metadata, variable names and variable types, keyed by file name and
+    sorted by it. Files that can not be read, or that have no column
+    names, are skipped.
+
+    Reading headers is dominated by file system latency, so the files
+    are read by a pool of nWorkers threads, which defaults to the
+    default size of a ThreadPoolExecutor.
+    """
+    filePaths = _expandPaths(filePaths, filePattern)
+    with ThreadPoolExecutor(max_workers=nWorkers) as executor:
+        allHeaders = list(executor.map(_scanHeader, filePaths))
+
+    theHeaders = {}
+    for fileName, fileHeader in zip(filePaths, allHeaders):
+        if fileHeader is not None:
+            theHeaders[fileName] = fileHeader
+
+    logger.info("Read the headers of %d of %d files" % (len(theHeaders), len(filePaths)))
+
+    return theHeaders
+
+class TableCatalog:
+    """An SQLite index of TFS files. Each file is recorded with its size,
+    modification time, metadata, columns and number of rows, and for
+    tracking files with NUMBER and TURN columns, the range of particle
+    numbers and turns. The catalog is updated incrementally, so only new
+    and changed files are read, and can be queried without opening any
+    TFS file.
+    """
+
+    FILE_FIELDS = (
+        "path", "size", "mtime", "nRows", "minPart", "maxPart", "minTurn", "maxTurn"
+    )
+
+    def __init__(self, dbFile):
+
+        self.dbFile = dbFile
+        self._theDB = sqlite3.connect(dbFile)
+        self._theDB.execute("PRAGMA foreign_keys = ON")
+        with self._theDB:
+            self._theDB.executescript("""
+                CREATE TABLE IF NOT EXISTS files (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT UNIQUE NOT NULL,
+                    size INTEGER, mtime INTEGER, nRows INTEGER,
+                    minPart INTEGER, maxPart INTEGER, minTurn INTEGER, maxTurn INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    fileId INTEGER REFERENCES files(id) ON DELETE CASCADE,
+                    name TEXT, value, PRIMARY KEY (fileId, name)
+                );
+                CREATE TABLE IF NOT EXISTS columns (
+                    fileId INTEGER REFERENCES files(id) ON DELETE CASCADE,
+                    position INTEGER, name TEXT, type TEXT, PRIMARY KEY (fileId, position)
+                );
+                CREATE INDEX IF NOT EXISTS metaValue ON meta (name, value);
+                CREATE INDEX IF NOT EXISTS columnName ON columns (name);
+            """)
+
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTrace):
+        self.close()
+        return False
+
+    def update(self, filePaths, nWorkers=None, filePattern="*", removeMissing=True):
+        """Add or update a set of files, given like for scanHeaders.
+        Files that are already recorded with the same size and
+        modification time are skipped. The files are read in a pool of
+        nWorkers processes, or in the calling process if nWorkers is 1.
+        With removeMissing, entries of files that no longer exist are
+        removed. Returns the number of files added or updated, and the
+        number removed.
+        """
+        filePaths = [os.path.abspath(fN) for fN in _expandPaths(filePaths, filePattern)]
+        knownFiles = {
+            fPath: (fSize, fTime) for fPath, fSize, fTime in self._theDB.execute(
+                "SELECT path, size, mtime FROM files"
+            )
+        }
+
+        newFiles = []
+        for filePath in filePaths:
+            try:
+                fileStat = os.stat(filePath)
+            except OSError:
+                continue
+            if knownFiles.get(filePath) != (fileStat.st_size, fileStat.st_mtime_ns):
+                newFiles.append(filePath)
+
+        if nWorkers == 1 or len(newFiles) < 2:
+            allEntries = [_scanFile(filePath) for filePath in newFiles]
+        else:
+            with ProcessPoolExecutor(max_workers=nWorkers) as executor:
+                allEntries = list(executor.map(_scanFile, newFiles, chunksize=16))
+
+        nUpdated = 0
+        nRemoved = 0
+        with self._theDB:
+            for theEntry in allEntries:
+                if theEntry is None:
+                    continue
+                self._storeEntry(theEntry)
+                nUpdated += 1
+            if removeMissing:
+                for filePath in knownFiles:
+                    if not os.path.isfile(filePath):
+                        self._theDB.execute("DELETE FROM files WHERE path = ?", (filePath,))
+                        nRemoved += 1
+
+        logger.info("Catalog updated with %d files, and %d removed" % (nUpdated, nRemoved))
+
+        return nUpdated, nRemoved
+
+    def query(self, hasColumns=None, **metaFilters):
+        """Return the sorted paths of the files whose metadata match all
+        the keyword filters, and that have all the columns in hasColumns.
+        A filter value can be a value to compare to, or a tuple of the
+        lower and upper bound of a range.
+        """
+        sqlWhere = []
+        sqlArgs = []
+        for mName, mValue in metaFilters.items():
+            if isinstance(mValue, tuple):
+                sqlWhere.append(
+                    "EXISTS (SELECT 1 FROM meta WHERE fileId = files.id "
+                    "AND name = ? AND value BETWEEN ? AND ?)"
+                )
+                sqlArgs += [mName, mValue[0], mValue[1]]
+            else:
+                sqlWhere.append(
+                    "EXISTS (SELECT 1 FROM meta WHERE fileId = files.id "
+                    "AND name = ? AND value = ?)"
+                )
+                sqlArgs += [mName, mValue]
+        for vN in hasColumns or []:
+            sqlWhere.append(
+                "EXISTS (SELECT 1 FROM columns WHERE fileId = files.id AND name = ?)"
+            )
+            sqlArgs.append(vN)
+
+        sqlQuery = "SELECT path FROM files"
+        if sqlWhere:
+            sqlQuery += " WHERE " + " AND ".join(sqlWhere)
+        sqlQuery += " ORDER BY path"
+
+        return [fPath for fPath, in self._theDB.execute(sqlQuery, sqlArgs)]
+
+    def getEntry(self, fileName):
+        """Return the catalog entry of a file as a dictionary of the
+        FILE_FIELDS, metaData, varNames and varTypes, or None if the
+        file is not in the catalog.
+        """
+        theRow = self._theDB.execute(
+            "SELECT id, %s FROM files WHERE path = ?" % ", ".join(self.FILE_FIELDS),
+            (os.path.abspath(fileName),)
+        ).fetchone()
+        if theRow is None:
+            return None
+
+        theEntry = dict(zip(self.FILE_FIELDS, theRow[1:]))
+        theEntry["metaData"] = dict(self._theDB.execute(
+            "SELECT name, value FROM meta WHERE fileId = ?", (theRow[0],)
+        ))
+        allColumns = self._theDB.execute(
+            "SELECT name, type FROM columns WHERE fileId = ? ORDER BY position", (theRow[0],)
+        ).fetchall()
+        theEntry["varNames"] = [vN for vN, _ in allColumns]
+        theEntry["varTypes"] = [vT for _, vT in allColumns]
+
+        return theEntry
+
+    def close(self):
+        """Close the database.
+        """
+        self._theDB.close()
+        return
+
+    ##
+    #  Internal Functions
+    ##
+
+    def _storeEntry(self, theEntry):
+        """Replace the records of a file with a new entry.
+        """
+        self._theDB.execute("DELETE FROM files WHERE path = ?", (theEntry["path"],))
+        fileId = self._theDB.execute(
+            "INSERT INTO files (%s) VALUES (%s)" % (
+                ", ".join(self.FILE_FIELDS), ", ".join(["?"]*len(self.FILE_FIELDS))
+            ), [theEntry[fN] for fN in self.FILE_FIELDS]
+        ).lastrowid
+        self._theDB.executemany(
+            "INSERT INTO meta (fileId, name, value) VALUES (?, ?, ?)",
+            [(fileId, mName, mValue) for mName, mValue in theEntry["metaData"].items()]
+        )
+        self._theDB.executemany(
+            "INSERT INTO columns (fileId, position, name, type) VALUES (?, ?, ?, ?)",
+            [(fileId, i, vN, vT) for i, (vN, vT) in enumerate(
+                zip(theEntry["varNames"], theEntry["varTypes"])
+            )]
+        )
+
+        return
+
+## End Class TableCatalog
+
+##
+#  Internal Functions
+##
+
+def _expandPaths(filePaths, filePattern):
+    """Expand a folder or glob pattern to a sorted list of files.
+    """
+    if isinstance(filePaths, str):
+        if os.path.isdir(filePaths):
+            filePaths = _findFiles(filePaths, filePattern)
+        else:
+            filePaths = glob.glob(filePaths)
+
+    return sorted(filePaths)
+
+def _findFiles(rootDir, filePattern):
+    """Find all files below a folder that match a pattern.
+    """
+    theFiles = []
+    for dirPath, _, fileNames in os.walk(rootDir):
+        for fileName in fnmatch.filter(fileNames, filePattern):
+            theFiles.append(os.path.join(dirPath, fileName))
+
+    return theFiles
+
+def _scanHeader(fileName):
+    """Read a header for scanHeaders, or return None if it fails.
+    """
+    try:
+        metaData, varNames, varTypes = readTableHeader(fileName)
+    except (OSError, EOFError, IndexError, ValueError) as e:
+        logger.warning("Could not read header of '%s': %s" % (fileName, str(e)))
+        return None
+
+    if not varNames:
+        logger.debug("Skipping file '%s' with no columns" % fileName)
+        return None
+
+    return metaData, varNames, varTypes
+
+def _scanFile(fileName):
+    """Read a file for TableCatalog, or return None if it fails. Only
+    the NUMBER and TURN columns of tracking files are parsed, in chunks
+    of SCAN_CHUNK_ROWS rows, otherwise the data lines are only counted.
+    """
+    try:
+        fileStat = os.stat(fileName)
+        with openTableFile(fileName) as tfsFile:
+            metaData, varNames, varTypes, firstLine = readHeader(tfsFile)
+            if not varNames:
+                logger.debug("Skipping file '%s' with no columns" % fileName)
+                return None
+
+            theEntry = {
+                "path": fileName, "size": fileStat.st_size, "mtime": fileStat.st_mtime_ns,
+                "nRows": 0, "minPart": None, "maxPart": None, "minTurn": None, "maxTurn": None,
+                "metaData": metaData, "varNames": varNames, "varTypes": varTypes,
+            }
+            if firstLine is None:
+                return theEntry
+
+            tfsLines = itertools.chain([firstLine], tfsFile)
+            if "NUMBER" in varNames and "TURN" in varNames:
+                for colData in iterDataChunks(
+                    tfsLines, varNames, varTypes, SCAN_CHUNK_ROWS, useCols=["NUMBER", "TURN"]
+                ):
+                    theEntry["nRows"] += len(colData["NUMBER"])
+                    for colName, entryKey in (("NUMBER", "Part"), ("TURN", "Turn")):
+                        minValue = int(colData[colName].min())
+                        maxValue = int(colData[colName].max())
+                        if theEntry["min" + entryKey] is not None:
+                            minValue = min(minValue, theEntry["min" + entryKey])
+                            maxValue = max(maxValue, theEntry["max" + entryKey])
+                        theEntry["min" + entryKey] = minValue
+                        theEntry["max" + entryKey] = maxValue
+            else:
+                theEntry["nRows"] = sum(
+                    1 for tfsLine in tfsLines
+                    if not (tfsLine.startswith("#") or tfsLine.isspace())
+                )
+
+    except (OSError, EOFError, IndexError, ValueError) as e:
+        logger.warning("Could not read '%s': %s" % (fileName, str(e)))
+        return None
+
+    return theEntry
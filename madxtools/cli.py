@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Command Line Tool
+=============================
+Streaming header summaries, filtering and conversion of TFS files
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+Usage:
+  madxtools header FILE [FILE ...] [--meta]
+  madxtools convert INPUT OUTPUT [--columns NAME,S,...] [filters] [--format tfs|npy]
+  madxtools summary FILE [--columns NAME,S,...] [filters]
+
+The files are read in chunks of rows, so memory use does not depend on
+the size of the file. NumPy and the rest of the package are only loaded
+once a command runs.
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+def main(cliArgs=None):
+    """Run the command line tool, and return the exit status.
+    """
+    theArgs = _buildParser().parse_args(cliArgs)
+
+    if "MADXTOOLS_LOGLEVEL" not in os.environ:
+        logLevel = logging.INFO if theArgs.verbose else logging.WARNING
+        logging.getLogger("madxtools").setLevel(logLevel)
+        for logHandler in logging.getLogger("madxtools").handlers:
+            logHandler.setLevel(logLevel)
+
+    try:
+        return theArgs.runCommand(theArgs)
+    except BrokenPipeError:
+        sys.stderr.close()
+        return 1
+    except (OSError, KeyError, ValueError, IndexError, ImportError) as e:
+        sys.stderr.write("madxtools: error: %s\n" % str(e).strip("'\""))
+        return 1
+
+def runHeader(theArgs):
+    """Print a summary of the header of each file.
+    """
+    from .header import readTableHeader
+
+    for fileName in theArgs.files:
+        metaData, varNames, varTypes = readTableHeader(fileName)
+        print("%s: %s table, %d columns, %d metadata entries" % (
+            fileName, metaData.get("TYPE", "unknown"), len(varNames), len(metaData)
+        ))
+        for vN, vT in zip(varNames, varTypes):
+            print("  %-20s %s" % (vN, vT))
+        if theArgs.meta:
+            for mName, mValue in metaData.items():
+                print("  @ %-18s %s" % (mName, mValue))
+
+    return 0
+
+def runConvert(theArgs):
+    """Filter a file and write the selected rows and columns to a TFS
+    file, or to a NumPy .npy file of a structured array.
+    """
+    from .tablefs import TableFS
+    from .writer import TFSWriter
+
+    outFormat = theArgs.format
+    if outFormat is None:
+        outFormat = "npy" if theArgs.output.endswith(".npy") else "tfs"
+    if outFormat == "npy" and theArgs.output == "-":
+        raise ValueError("The npy format can not be written to standard output")
+
+    tfsObj = TableFS()
+    tfsObj.readFile(theArgs.input, headerOnly=True)
+    outCols, readCols = _selectColumns(tfsObj, theArgs)
+    outTypes = [tfsObj.varTypes[tfsObj.varNames.index(vN)] for vN in outCols]
+
+    if outFormat == "npy":
+        return _writeRecords(tfsObj, theArgs, outCols, outTypes, readCols)
+
+    if theArgs.output == "-":
+        outFile = sys.stdout.buffer
+    else:
+        outFile = theArgs.output
+
+    nRows = 0
+    lastSeg = -1
+    with TFSWriter(outFile, tfsObj.metaData, outCols, outTypes) as tfsWriter:
+        for colData, rowIdx in _iterRows(tfsObj, theArgs, readCols):
+            insertLines, lastSeg = _segmentLines(tfsObj.segments, rowIdx, lastSeg)
+            tfsWriter.writeChunk(
+                {vN: colData[vN] for vN in outCols}, insertLines=insertLines
+            )
+            nRows += len(rowIdx)
+
+    logger.info("Wrote %d rows to %s" % (nRows, theArgs.output))
+
+    return 0
+
+def runSummary(theArgs):
+    """Print the number of rows, and the range and mean of each numeric
+    column of the selected rows.
+    """
+    import numpy as np
+    from .tablefs import TableFS
+
+    tfsObj = TableFS()
+    tfsObj.readFile(theArgs.input, headerOnly=True)
+    outCols, readCols = _selectColumns(tfsObj, theArgs)
+
+    nRows = 0
+    colStats = {}
+    for colData, rowIdx in _iterRows(tfsObj, theArgs, readCols):
+        nRows += len(rowIdx)
+        for vN in outCols:
+            colArr = colData[vN]
+            if colArr.dtype.kind not in "iuf" or len(colArr) == 0:
+                continue
+            chunkStats = (colArr.min(), colArr.max(), np.sum(colArr, dtype="float"))
+            if vN in colStats:
+                prevStats = colStats[vN]
+                chunkStats = (
+                    min(prevStats[0], chunkStats[0]), max(prevStats[1], chunkStats[1]),
+                    prevStats[2] + chunkStats[2]
+                )
+            colStats[vN] = chunkStats
+
+    print("%s: %d rows" % (theArgs.input, nRows))
+    print("  %-20s %16s %16s %16s" % ("Column", "Min", "Max", "Mean"))
+    for vN in outCols:
+        if vN in colStats:
+            minVal, maxVal, sumVal = colStats[vN]
+            print("  %-20s %16.8g %16.8g %16.8g" % (vN, minVal, maxVal, sumVal/nRows))
+        else:
+            print("  %-20s %16s %16s %16s" % (vN, "-", "-", "-"))
+
+    return 0
+
+##
+#  Internal Functions
+##
+
+def _buildParser():
+    """Build the argument parser.
+    """
+    argParser = argparse.ArgumentParser(
+        prog="madxtools", description="Summarise, filter and convert MAD-X TFS files"
+    )
+    argParser.add_argument("-v", "--verbose", action="store_true", help="Log progress")
+    cmdParsers = argParser.add_subparsers(dest="command", metavar="COMMAND")
+    cmdParsers.required = True
+
+    headParser = cmdParsers.add_parser("header", help="Print the header of TFS files")
+    headParser.add_argument("files", nargs="+", metavar="FILE", help="The TFS files")
+    headParser.add_argument("--meta", action="store_true", help="Print the metadata values")
+    headParser.set_defaults(runCommand=runHeader)
+
+    convParser = cmdParsers.add_parser("convert", help="Filter and convert a TFS file")
+    convParser.add_argument("input", metavar="INPUT", help="The TFS file to read")
+    convParser.add_argument("output", metavar="OUTPUT", help="The output file, or - for stdout")
+    convParser.add_argument("--format", choices=("tfs", "npy"), default=None,
+                            help="The output format, by default npy for .npy files, else tfs")
+    convParser.add_argument("--str-len", type=int, default=None, dest="strLen",
+                            help="Characters of npy string fields, by default the longest value")
+    _addRowArgs(convParser)
+    convParser.set_defaults(runCommand=runConvert)
+
+    sumParser = cmdParsers.add_parser("summary", help="Print column statistics of a TFS file")
+    sumParser.add_argument("input", metavar="FILE", help="The TFS file to read")
+    _addRowArgs(sumParser)
+    sumParser.set_defaults(runCommand=runSummary)
+
+    return argParser
+
+def _addRowArgs(cmdParser):
+    """Add the column selection and row filter arguments.
+    """
+    cmdParser.add_argument("--columns", default=None,
+                           help="Comma separated list of the columns to keep")
+    cmdParser.add_argument("--name", default=None, metavar="REGEX",
+                           help="Keep rows where NAME matches the regular expression")
+    cmdParser.add_argument("--s-range", type=float, nargs=2, default=None, dest="sRange",
+                           metavar=("MIN", "MAX"), help="Keep rows with S in the range")
+    cmdParser.add_argument("--turn-range", type=float, nargs=2, default=None, dest="turnRange",
+                           metavar=("MIN", "MAX"), help="Keep rows with TURN in the range")
+    cmdParser.add_argument("--chunk-rows", type=int, default=100000, dest="chunkRows",
+                           help="Rows parsed at a time")
+    return
+
+def _selectColumns(tfsObj, theArgs):
+    """Return the output columns, and the columns to parse, which also
+    include the columns that the filters need.
+    """
+    if theArgs.columns is None:
+        outCols = list(tfsObj.varNames)
+    else:
+        outCols = [vN.strip() for vN in theArgs.columns.split(",") if vN.strip()]
+        for vN in outCols:
+            if vN not in tfsObj.varNames:
+                raise KeyError("No column named '%s' in %s" % (vN, theArgs.input))
+
+    readCols = list(outCols)
+    for vN in _rowFilter(theArgs):
+        if vN not in tfsObj.varNames:
+            raise KeyError("No column named '%s' to filter on in %s" % (vN, theArgs.input))
+        if vN not in readCols:
+            readCols.append(vN)
+
+    return outCols, readCols
+
+def _iterRows(tfsObj, theArgs, readCols):
+    """Read a file in chunks, and yield the columns of the rows that
+    pass the filters, with the row indices of those rows in the file.
+    """
+    import numpy as np
+    from .parser import filterMask
+
+    rowFilter = _rowFilter(theArgs)
+    rowStart = 0
+    for colData in tfsObj.iterChunks(
+        theArgs.input, chunkRows=theArgs.chunkRows, useCols=readCols
+    ):
+        rowMask = filterMask(colData, rowFilter)
+        rowIdx = rowStart + np.flatnonzero(rowMask)
+        rowStart += len(rowMask)
+        yield {vN: colData[vN][rowMask] for vN in readCols}, rowIdx
+
+    return
+
+def _rowFilter(theArgs):
+    """Build the row filter of the filter arguments, see
+    parser.rowFilterColumns.
+    """
+    rowFilter = {}
+    if theArgs.name is not None:
+        rowFilter["NAME"] = ("match", theArgs.name)
+    if theArgs.sRange is not None:
+        rowFilter["S"] = ("range", theArgs.sRange[0], theArgs.sRange[1])
+    if theArgs.turnRange is not None:
+        rowFilter["TURN"] = ("range", theArgs.turnRange[0], theArgs.turnRange[1])
+
+    return rowFilter
+
+def _segmentLines(theSegments, rowIdx, lastSeg):
+    """Return the '#segment' lines to insert before the rows of a
+    chunk, and the index of the segment of its last row. A segment line
+    is only written before the first kept row of the segment.
+    """
+    import numpy as np
+    from .writer import segmentLine
+
+    if not theSegments or len(rowIdx) == 0:
+        return [], lastSeg
+
+    segStarts = np.array([theSeg["rowStart"] for theSeg in theSegments])
+    rowSegs = np.searchsorted(segStarts, rowIdx, side="right") - 1
+    newSegs = np.flatnonzero(np.diff(rowSegs, prepend=lastSeg) != 0)
+    insertLines = [
+        (int(i), segmentLine(theSegments[rowSegs[i]])) for i in newSegs if rowSegs[i] >= 0
+    ]
+
+    return insertLines, int(rowSegs[-1])
+
+def _writeRecords(tfsObj, theArgs, outCols, outTypes, readCols):
+    """Write the filtered rows to a .npy file of a structured array.
+    The row count is written to the header at the end. String fields
+    are as long as the longest value, found in a first pass over the
+    string columns, unless the length is given.
+    """
+    import numpy as np
+    from .parser import recordDType
+
+    strCols = [vN for vN, vT in zip(outCols, outTypes) if not vT.endswith(("d", "le"))]
+    strLen = theArgs.strLen
+    if strCols and strLen is None:
+        strLen = 1
+        for colData, _ in _iterRows(tfsObj, theArgs, readCols):
+            for vN in strCols:
+                strLen = max(strLen, int(np.char.str_len(colData[vN]).max(initial=0)))
+
+    recType = recordDType(outCols, outTypes, strLen=strLen)
+    headSize = len(_npyHeader(recType, 10**19))
+
+    nRows = 0
+    with open(theArgs.output, mode="wb") as outFile:
+        outFile.write(b" "*headSize)
+        for colData, rowIdx in _iterRows(tfsObj, theArgs, readCols):
+            outRecords = np.empty(len(rowIdx), dtype=recType)
+            for vN in outCols:
+                if vN in strCols and np.char.str_len(colData[vN]).max(initial=0) > strLen:
+                    raise ValueError("Values of column '%s' are longer than %d characters" % (
+                        vN, strLen
+                    ))
+                outRecords[vN] = colData[vN]
+            outFile.write(outRecords.tobytes())
+            nRows += len(rowIdx)
+        outFile.seek(0)
+        outFile.write(_npyHeader(recType, nRows, headSize))
+
+    logger.info("Wrote %d rows to %s" % (nRows, theArgs.output))
+
+    return 0
+
+def _npyHeader(recType, nRows, headSize=None):
+    """Build a version 1.0 .npy header for a 1D structured array. The
+    header is padded to headSize bytes, or to a multiple of 64 bytes.
+    """
+    import numpy as np
+
+    headDict = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(recType), nRows
+    )
+    if headSize is None:
+        headSize = 64*((len(headDict) + 11)//64 + 1)
+
+    padSize = headSize - len(headDict) - 11
+    if padSize < 0 or headSize - 10 > 65535:
+        raise ValueError("The npy header does not fit in %d bytes" % headSize)
+
+    headText = (headDict + " "*padSize + "\n").encode("latin1")
+
+    return b"\x93NUMPY\x01\x00" + (headSize - 10).to_bytes(2, "little") + headText
+
+if __name__ == "__main__":
+    sys.exit(main())
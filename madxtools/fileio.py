@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : TFS File Input
+==========================
+Opens plain and compressed TFS files for reading
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import io
+import bz2
+import gzip
+import lzma
+import zlib
+import queue
+import functools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_MAGIC = {
+    "gz":  b"\x1f\x8b",
+    "bz2": b"BZh",
+    "xz":  b"\xfd7zXZ\x00",
+}
+COMPRESS_OPEN = {
+    "gz":  gzip.open,
+    "bz2": bz2.open,
+    "xz":  lzma.open,
+}
+COMPRESS_DECOMP = {
+    "gz":  functools.partial(zlib.decompressobj, zlib.MAX_WBITS | 16),
+    "bz2": bz2.BZ2Decompressor,
+    "xz":  lzma.LZMADecompressor,
+}
+
+def compressionType(fileName):
+    """Return the compression of a file, 'gz', 'bz2' or 'xz', from its
+    magic bytes, or from its suffix if the file is too short to tell.
+    Returns None for plain files.
+    """
+    with open(fileName, mode="rb") as inFile:
+        fileHead = inFile.read(6)
+
+    for compType, compMagic in COMPRESS_MAGIC.items():
+        if fileHead.startswith(compMagic):
+            return compType
+
+    if len(fileHead) < 6:
+        for compType in COMPRESS_MAGIC:
+            if fileName.endswith("." + compType):
+                return compType
+
+    return None
+
+def openTableFile(fileName, threaded=True):
+    """Open a TFS file for reading as text. Compressed files are
+    decompressed as a stream. With threaded, the decompression runs on
+    a reader thread ahead of the caller, so that it overlaps with the
+    parsing. The threaded stream can not seek, so use threaded=False if
+    tell and seek are needed.
+    """
+    compType = compressionType(fileName)
+    if compType is None:
+        return open(fileName, mode="r")
+
+    logger.debug("Reading '%s' with %s decompression" % (fileName, compType))
+    if not threaded:
+        return COMPRESS_OPEN[compType](fileName, mode="rt")
+
+    theBlocks = decompressBlocks(fileName, compType)
+    return io.TextIOWrapper(io.BufferedReader(ThreadedReader(theBlocks)))
+
+def decompressBlocks(fileName, compType, blockSize=262144):
+    """Decompress a file block by block, and yield the decompressed
+    blocks. The decompressor objects are used directly, rather than the
+    file objects of the codec modules, since they release the GIL for a
+    whole block. Files of several concatenated streams are supported.
+    """
+    with open(fileName, mode="rb") as inFile:
+        theDecomp = COMPRESS_DECOMP[compType]()
+        hasInput = False
+        for compData in iter(lambda: inFile.read(blockSize), b""):
+            while compData:
+                hasInput = True
+                theBlock = theDecomp.decompress(compData)
+                if theBlock:
+                    yield theBlock
+                compData = b""
+                if theDecomp.eof:
+                    compData = theDecomp.unused_data
+                    theDecomp = COMPRESS_DECOMP[compType]()
+                    hasInput = False
+
+        if hasInput:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+
+    return
+
+def findTailStart(fileName, dataPos, turnCol, nTurns, blockSize=1048576):
+    """Find the byte offset in a plain tracking file where its last
+    nTurns turns start, by reading blocks backwards from the end of the
+    file, from which the last turn is taken. The data section starts at
+    dataPos, and the turn is in column turnCol of the data lines. The
+    offset is just after the last data line of an earlier turn, so any
+    '#segment' lines of the first kept turn are included. Returns
+    dataPos if the file has no more than nTurns turns.
+    """
+    with open(fileName, mode="rb") as inFile:
+        blockEnd = inFile.seek(0, io.SEEK_END)
+        lastTurn = None
+        lineTail = b""
+        while blockEnd > dataPos:
+            blockStart = max(dataPos, blockEnd - blockSize)
+            inFile.seek(blockStart)
+            theBlock = inFile.read(blockEnd - blockStart) + lineTail
+            theLines = theBlock.split(b"\n")
+            lineEnd = blockStart + len(theBlock)
+            if blockStart > dataPos:
+                lineTail = theLines.pop(0)
+            for theLine in reversed(theLines):
+                lineStart = lineEnd - len(theLine)
+                lineEnd = lineStart - 1
+                if theLine[:1] in (b"#", b"@", b"*", b"$") or theLine.isspace() or not theLine:
+                    continue
+                theTurn = int(float(theLine.split()[turnCol]))
+                if lastTurn is None:
+                    lastTurn = theTurn
+                elif theTurn <= lastTurn - nTurns:
+                    return lineStart + len(theLine) + 1
+            blockEnd = blockStart
+
+    return dataPos
+
+class ThreadedReader(io.RawIOBase):
+    """A read-only binary stream of the blocks from an iterator of bytes,
+    which runs on a background thread. At most nBlocks blocks are read
+    ahead. Errors on the thread are raised in the reading thread.
+    """
+
+    def __init__(self, theBlocks, nBlocks=8):
+        super().__init__()
+
+        self._theBlocks = theBlocks
+        self._theQueue  = queue.Queue(maxsize=nBlocks)
+        self._doStop    = threading.Event()
+        self._theBlock  = b""
+        self._blockPos  = 0
+        self._atEnd     = False
+
+        self._theThread = threading.Thread(target=self._readBlocks, daemon=True)
+        self._theThread.start()
+
+        return
+
+    def readable(self):
+        return True
+
+    def readinto(self, theBuffer):
+        """Fill a buffer from the blocks read by the thread.
+        """
+        while self._blockPos >= len(self._theBlock):
+            if self._atEnd:
+                return 0
+            theBlock = self._theQueue.get()
+            if isinstance(theBlock, Exception):
+                self._atEnd = True
+                raise theBlock
+            if not theBlock:
+                self._atEnd = True
+                return 0
+            self._theBlock = theBlock
+            self._blockPos = 0
+
+        nBytes = min(len(theBuffer), len(self._theBlock) - self._blockPos)
+        theBuffer[:nBytes] = self._theBlock[self._blockPos:self._blockPos+nBytes]
+        self._blockPos += nBytes
+
+        return nBytes
+
+    def close(self):
+        """Stop the thread and close the block iterator.
+        """
+        if not self.closed:
+            self._doStop.set()
+            while self._theThread.is_alive():
+                try:
+                    self._theQueue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        super().close()
+
+        return
+
+    ##
+    #  Internal Functions
+    ##
+
+    def _readBlocks(self):
+        """Pass blocks from the iterator to the queue until it ends, an
+        error occurs, or the stream is closed. The end is marked by an
+        empty block.
+        """
+        theBlocks = iter(self._theBlocks)
+        while not self._doStop.is_set():
+            try:
+                theBlock = next(theBlocks, b"")
+            except Exception as e:
+                theBlock = e
+            while not self._doStop.is_set():
+                try:
+                    self._theQueue.put(theBlock, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if not theBlock or isinstance(theBlock, Exception):
+                break
+
+        if hasattr(theBlocks, "close"):
+            theBlocks.close()
+
+        return
+
+## End Class ThreadedReader
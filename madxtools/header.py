@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : TFS Header Reading
+==============================
+Reading of the metadata and column header of TFS files
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import logging
+
+from .fileio import openTableFile
+
+logger = logging.getLogger(__name__)
+
+def stripQuotes(sVar):
+    """Remove wrapping quotes from string.
+    """
+    if (sVar[0] == sVar[-1]) and sVar.startswith(("'", '"')):
+        return sVar[1:-1]
+
+    return sVar
+
+def parseMetaLine(tfsLine):
+    """Parse a single '@' metadata line. Returns a tuple of name and
+    value, or None if the type is not known.
+    """
+    spLines = tfsLine.lstrip().split(None, maxsplit=3)[1:]
+    if spLines[1].endswith("d"):
+        return spLines[0], int(spLines[2])
+    elif spLines[1].endswith("le"):
+        return spLines[0], float(spLines[2])
+    elif spLines[1].endswith("s"):
+        return spLines[0], stripQuotes(spLines[2].strip())
+
+    logger.warning(
+        "Unknown type '%s' for metadata variable '%s'" % (
+            spLines[1], spLines[2].strip()
+        )
+    )
+
+    return None
+
+def readHeader(tfsFile):
+    """Read the '@', '*' and '$' header lines from an open TFS file.
+    Returns the metadata, variable names and variable types, as well
+    as the first line after the header, which is None if the file has
+    no data section. The file is read line by line, so its position
+    can be recorded with tell after the header has been read.
+    """
+    metaData = {}
+    varNames = []
+    varTypes = []
+
+    for tfsLine in iter(tfsFile.readline, ""):
+        if tfsLine[0] == "@":
+            metaValue = parseMetaLine(tfsLine)
+            if metaValue is not None:
+                metaData[metaValue[0]] = metaValue[1]
+        elif tfsLine[0] == "*":
+            varNames += tfsLine.split()[1:]
+        elif tfsLine[0] == "$":
+            varTypes += tfsLine.split()[1:]
+        else:
+            return metaData, varNames, varTypes, tfsLine
+
+    return metaData, varNames, varTypes, None
+
+def readTableHeader(fileName):
+    """Read only the header of a TFS file, stopping at the first line
+    that is not a header line. Returns the metadata, variable names and
+    variable types.
+    """
+    with openTableFile(fileName, threaded=False) as tfsFile:
+        metaData, varNames, varTypes, _ = readHeader(tfsFile)
+
+    return metaData, varNames, varTypes
@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : TFS Data Parser
+===========================
+Vectorised parsing of TFS headers and data blocks into NumPy columns
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+import itertools
+import logging
+import warnings
+
+import numpy as np
+
+from .stats import TableStats
+
+logger = logging.getLogger(__name__)
+
+# The operators of row filter conditions, and their number of arguments
+ROW_FILTER_OPS = {"in": (1, 1), "range": (2, 2), "every": (1, 2), "match": (1, 1)}
+
+def columnDType(varType):
+    """Return the NumPy type used for parsing a TFS column type. String
+    and unknown types are parsed as Python objects.
+    """
+    if varType.endswith("d"):
+        return np.dtype("int")
+    elif varType.endswith("le"):
+        return np.dtype("float")
+
+    return np.dtype("object")
+
+def selectColumns(varNames, useCols=None):
+    """Return the sorted indices of the columns in useCols. All columns
+    are selected if useCols is None.
+    """
+    if useCols is None:
+        return list(range(len(varNames)))
+
+    colIdx = []
+    for vN in useCols:
+        if vN not in varNames:
+            raise KeyError("No column named '%s' found" % vN)
+        colIdx.append(varNames.index(vN))
+
+    if not colIdx:
+        raise ValueError("No columns selected")
+
+    return sorted(set(colIdx))
+
+def parseDataLines(tfsLines, varNames, varTypes, useCols=None, tfsStats=None):
+    """Parse an iterable of TFS data lines into a dictionary of typed
+    NumPy columns in a single pass. Comment lines are skipped, and
+    quoted strings are unquoted like stripQuotes does. If useCols is
+    given, only those columns are converted and returned. The columns
+    are contiguous arrays. The time of each phase is added to tfsStats,
+    if given.
+    """
+    colIdx = selectColumns(varNames, useCols)
+    recType = np.dtype([(varNames[i], columnDType(varTypes[i])) for i in colIdx])
+
+    if tfsStats is None:
+        tfsStats = TableStats("parse")
+    phaseStart = tfsStats.startPhase()
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=".*input contained no data")
+        try:
+            recData = np.loadtxt(
+                tfsLines, dtype=recType, comments="#", quotechar='"', ndmin=1,
+                usecols=None if useCols is None else colIdx
+            )
+        except ValueError as e:
+            if "columns but" in str(e):
+                raise IndexError("Mismatch between data lines and variable names") from e
+            raise
+    tfsStats.endPhase("tokenize", phaseStart)
+
+    colData = {}
+    for i in colIdx:
+        vN, vT = varNames[i], varTypes[i]
+        phaseStart = tfsStats.startPhase()
+        if recType[vN].kind == "O":
+            strData = np.asarray(recData[vN], dtype="str")
+            tfsStats.endPhase("convert", phaseStart)
+            phaseStart = tfsStats.startPhase()
+            colData[vN] = _stripQuotesColumn(strData)
+            tfsStats.endPhase("quotes", phaseStart)
+            if not vT.endswith("s"):
+                logger.error("Unknown type '%s' for variable '%s'" % (vT, vN))
+        else:
+            colData[vN] = np.ascontiguousarray(recData[vN])
+            tfsStats.endPhase("convert", phaseStart)
+
+    tfsStats.nRows += len(recData)
+    tfsStats.updateColBytes(colData)
+
+    return colData
+
+def parseSegmentLine(tfsLine, rowStart):
+    """Parse a '#segment' line from a MAD-X trackone file. The line
+    holds the segment number, the total number of segments, the number
+    of particles, and the index and name of the observation element.
+    """
+    spLines = tfsLine.split(None, maxsplit=5)
+    return {
+        "segment":    int(spLines[1]),
+        "nSegments":  int(spLines[2]),
+        "nPart":      int(spLines[3]),
+        "elemIndex":  int(spLines[4]),
+        "elemName":   spLines[5].strip() if len(spLines) > 5 else "",
+        "obsNumber":  None,
+        "turn":       None,
+        "rowStart":   rowStart,
+        "rowEnd":     None,
+    }
+
+def trackSegments(tfsLines, segments, turnCol=None, rowStart=0):
+    """Pass through an iterable of TFS data lines while recording the
+    '#segment' lines and their row ranges in the segments list. If the
+    index of the TURN column is given, the turn of each segment is read
+    from its first data line.
+    """
+    nRows = rowStart
+    for tfsLine in tfsLines:
+        if tfsLine.startswith("#"):
+            if tfsLine.startswith("#segment"):
+                if segments and segments[-1]["rowEnd"] is None:
+                    segments[-1]["rowEnd"] = nRows
+                segments.append(parseSegmentLine(tfsLine, nRows))
+        elif not tfsLine.isspace():
+            if turnCol is not None and segments and segments[-1]["turn"] is None:
+                segments[-1]["turn"] = int(float(tfsLine.split()[turnCol]))
+            nRows += 1
+        yield tfsLine
+
+    return
+
+def closeSegments(segments, nRows, turnData=None, obsNumbers=None):
+    """Close the row ranges of the segments, and number the
+    observation points in order of first appearance. Turns that were
+    not recorded while parsing are looked up in turnData if given. To
+    continue the numbering of earlier segments, pass their dictionary
+    of observation numbers in obsNumbers, which is updated.
+    """
+    if obsNumbers is None:
+        obsNumbers = {}
+    for i, theSeg in enumerate(segments):
+        if theSeg["rowEnd"] is None:
+            theSeg["rowEnd"] = segments[i+1]["rowStart"] if i+1 < len(segments) else nRows
+        obsKey = (theSeg["elemIndex"], theSeg["elemName"])
+        if obsKey not in obsNumbers:
+            obsNumbers[obsKey] = len(obsNumbers) + 1
+        theSeg["obsNumber"] = obsNumbers[obsKey]
+        if theSeg["turn"] is None and turnData is not None and theSeg["rowStart"] < nRows:
+            theSeg["turn"] = int(float(turnData[theSeg["rowStart"]]))
+
+    return
+
+def scanObsNumbers(tfsLines):
+    """Number the observation points of a trackone file in order of
+    first appearance, like closeSegments, from its data lines. Reading
+    stops at the first observation point that appears a second time,
+    which is in the second recorded turn. Returns the dictionary of
+    observation numbers used by closeSegments.
+    """
+    obsNumbers = {}
+    for tfsLine in tfsLines:
+        if tfsLine.startswith("#segment"):
+            theSeg = parseSegmentLine(tfsLine, 0)
+            obsKey = (theSeg["elemIndex"], theSeg["elemName"])
+            if obsKey in obsNumbers:
+                break
+            obsNumbers[obsKey] = len(obsNumbers) + 1
+
+    return obsNumbers
+
+def iterDataChunks(tfsLines, varNames, varTypes, chunkRows, useCols=None, tfsStats=None):
+    """Parse an iterable of TFS data lines in blocks of at most
+    chunkRows lines, and yield a dictionary of typed NumPy columns for
+    each block that contains data.
+    """
+    if chunkRows < 1:
+        raise ValueError("The number of rows per chunk must be positive")
+
+    tfsLines = iter(tfsLines)
+    while True:
+        lineBlock = list(itertools.islice(tfsLines, chunkRows))
+        if not lineBlock:
+            break
+
+        colData = parseDataLines(
+            lineBlock, varNames, varTypes, useCols=useCols, tfsStats=tfsStats
+        )
+        if len(next(iter(colData.values()))) > 0:
+            yield colData
+
+    return
+
+def recordDType(varNames, varTypes, useCols=None, strLen=None):
+    """Return the dtype of a structured array holding the columns in
+    useCols, or all columns. String columns are Unicode strings of
+    strLen characters, or Python objects if strLen is None.
+    """
+    recFields = []
+    for i in selectColumns(varNames, useCols):
+        colType = columnDType(varTypes[i])
+        if colType.kind == "O" and strLen is not None:
+            colType = np.dtype("U%d" % strLen)
+        recFields.append((varNames[i], colType))
+
+    return np.dtype(recFields)
+
+def fillRecords(tfsLines, outRecords, varNames, varTypes, chunkRows=65536, tfsStats=None):
+    """Parse an iterable of TFS data lines into a preallocated NumPy
+    structured array, whose field names select the columns to parse.
+    The lines are parsed chunkRows at a time, so the only full size
+    copy of the data is outRecords itself. Returns the number of rows
+    written.
+    """
+    fieldNames = outRecords.dtype.names
+    if fieldNames is None:
+        raise TypeError("The output array must be a structured array")
+
+    nRows = 0
+    for colData in iterDataChunks(
+        tfsLines, varNames, varTypes, chunkRows, useCols=fieldNames, tfsStats=tfsStats
+    ):
+        nChunk = len(colData[fieldNames[0]])
+        if nRows + nChunk > len(outRecords):
+            raise IndexError("The record array has room for only %d rows" % len(outRecords))
+        for vN in fieldNames:
+            fieldType = outRecords.dtype[vN]
+            if fieldType.kind == "U" and colData[vN].dtype.kind == "U":
+                maxLen = np.char.str_len(colData[vN]).max(initial=0)
+                if maxLen > fieldType.itemsize//4:
+                    raise ValueError("Strings of %d characters do not fit field '%s' of %s" % (
+                        maxLen, vN, fieldType
+                    ))
+            outRecords[vN][nRows:nRows+nChunk] = colData[vN]
+        nRows += nChunk
+
+    return nRows
+
+def rowFilterColumns(rowFilter, varNames):
+    """Check a row filter, and return the names of the columns it needs.
+    A row filter is a dictionary of column names and conditions. Each
+    condition is a tuple of an operator and its arguments, or a list of
+    such tuples that must all hold:
+
+    ('in', values)        the value is one of values
+    ('range', lo, hi)     lo <= value <= hi, where None is unbounded
+    ('every', k[, off])   (value - off) is a multiple of k
+    ('match', pattern)    a regular expression matches the start of a
+                          string value
+    """
+    for vN, theConds in rowFilter.items():
+        if vN not in varNames:
+            raise KeyError("No column named '%s' found" % vN)
+        for theCond in _filterConditions(theConds):
+            if not theCond or theCond[0] not in ROW_FILTER_OPS:
+                raise ValueError("Unknown row filter condition %r on column '%s'" % (
+                    theCond, vN
+                ))
+            minArgs, maxArgs = ROW_FILTER_OPS[theCond[0]]
+            if not minArgs <= len(theCond) - 1 <= maxArgs:
+                raise ValueError("Wrong number of arguments in row filter condition %r" % (
+                    theCond,
+                ))
+            if theCond[0] == "every" and theCond[1] < 1:
+                raise ValueError("The step of an 'every' condition must be positive")
+
+    return list(rowFilter)
+
+def filterMask(colData, rowFilter):
+    """Evaluate a row filter on a dictionary of columns, and return a
+    boolean array that is True for the rows that pass all conditions.
+    See rowFilterColumns.
+    """
+    rowMask = None
+    for vN, theConds in rowFilter.items():
+        colArr = np.asarray(colData[vN])
+        for theCond in _filterConditions(theConds):
+            condMask = _conditionMask(colArr, vN, theCond)
+            rowMask = condMask if rowMask is None else rowMask & condMask
+
+    if rowMask is None:
+        rowMask = np.ones(len(next(iter(colData.values()))), dtype="bool")
+
+    return rowMask
+
+def parseFilteredLines(
+    tfsLines, varNames, varTypes, rowFilter, useCols=None, chunkRows=65536, tfsStats=None
+):
+    """Parse an iterable of TFS data lines like parseDataLines, but
+    keep only the rows that pass a row filter, see rowFilterColumns.
+    The lines are parsed chunkRows at a time, and each chunk is filtered
+    before it is kept, so the peak memory depends on the number of kept
+    rows. The columns used by the filter are parsed even if they are
+    not in useCols. Returns the columns, and the indices of the kept
+    rows among the data rows of the file.
+    """
+    outIdx = selectColumns(varNames, useCols)
+    outCols = [varNames[i] for i in outIdx]
+    parseCols = outCols + [vN for vN in rowFilterColumns(rowFilter, varNames) if vN not in outCols]
+
+    keptChunks = []
+    keptIdx = []
+    rowStart = 0
+    for colData in iterDataChunks(
+        tfsLines, varNames, varTypes, chunkRows, useCols=parseCols, tfsStats=tfsStats
+    ):
+        phaseStart = tfsStats.startPhase() if tfsStats is not None else None
+        rowMask = filterMask(colData, rowFilter)
+        keptIdx.append(rowStart + np.flatnonzero(rowMask))
+        keptChunks.append({vN: colData[vN][rowMask] for vN in outCols})
+        rowStart += len(rowMask)
+        if tfsStats is not None:
+            tfsStats.endPhase("filter", phaseStart)
+
+    if not keptChunks:
+        return parseDataLines([], varNames, varTypes, useCols=outCols), np.zeros(0, dtype="int")
+
+    colData = {
+        vN: np.concatenate([theChunk[vN] for theChunk in keptChunks]) for vN in outCols
+    }
+    keptIdx = np.concatenate(keptIdx)
+    if tfsStats is not None:
+        tfsStats.updateColBytes(colData)
+    logger.debug("Kept %d of %d rows" % (len(keptIdx), rowStart))
+
+    return colData, keptIdx
+
+def filterSegments(segments, keptIdx):
+    """Map the row ranges of closed segments to the rows that were kept
+    by a row filter, given by their original indices. Segments without
+    kept rows are removed. Returns the new list of segments.
+    """
+    newSegments = []
+    for theSeg in segments:
+        rowStart, rowEnd = np.searchsorted(keptIdx, [theSeg["rowStart"], theSeg["rowEnd"]])
+        if rowEnd > rowStart:
+            newSegments.append(dict(theSeg, rowStart=int(rowStart), rowEnd=int(rowEnd)))
+
+    return newSegments
+
+class LazyColumns(dict):
+    """A dictionary of data columns where each column is loaded on
+    first access by calling loadColumns with a list of column names.
+    Membership and iteration cover all columns, loaded or not.
+    """
+
+    def __init__(self, varNames, loadColumns):
+        super().__init__()
+        self._varNames = list(varNames)
+        self._loadColumns = loadColumns
+        return
+
+    def __missing__(self, vN):
+        if vN not in self._varNames:
+            raise KeyError(vN)
+        self.materialize([vN])
+        return dict.__getitem__(self, vN)
+
+    def __contains__(self, vN):
+        return vN in self._varNames
+
+    def __iter__(self):
+        return iter(self._varNames)
+
+    def __len__(self):
+        return len(self._varNames)
+
+    def get(self, vN, default=None):
+        return self[vN] if vN in self._varNames else default
+
+    def keys(self):
+        return list(self._varNames)
+
+    def values(self):
+        self.materialize()
+        return [dict.__getitem__(self, vN) for vN in self._varNames]
+
+    def items(self):
+        return list(zip(self._varNames, self.values()))
+
+    def isLoaded(self, vN):
+        """Check if a column has been loaded.
+        """
+        return dict.__contains__(self, vN)
+
+    def materialize(self, useCols=None):
+        """Load several columns in a single scan. All missing columns
+        are loaded if useCols is None.
+        """
+        if useCols is None:
+            useCols = self._varNames
+        useCols = [vN for vN in useCols if not dict.__contains__(self, vN)]
+        if useCols:
+            self.update(self._loadColumns(useCols))
+        return
+
+## End Class LazyColumns
+
+##
+#  Internal Functions
+##
+
+def _stripQuotesColumn(strData):
+    """Remove wrapping single quotes from a string column. Double
+    quotes are already handled by the tokenizer.
+    """
+    if strData.size == 0:
+        return strData
+
+    isQuoted = np.char.startswith(strData, "'") & np.char.endswith(strData, "'")
+    if np.any(isQuoted):
+        strData = strData.copy()
+        strData[isQuoted] = [sVar[1:-1] for sVar in strData[isQuoted]]
+
+    return strData
+
+def _filterConditions(theConds):
+    """Return the conditions on a column of a row filter as a list.
+    """
+    return theConds if isinstance(theConds, list) else [theConds]
+
+def _conditionMask(colArr, vN, theCond):
+    """Evaluate a single row filter condition on a column.
+    """
+    condOp, condArgs = theCond[0], theCond[1:]
+    if condOp == "match":
+        if colArr.dtype.kind not in "UO":
+            raise ValueError("Column '%s' is not a string column" % vN)
+        uniqVals, uniqInv = np.unique(colArr, return_inverse=True)
+        filterRx = re.compile(condArgs[0])
+        uniqMatch = np.fromiter(
+            (filterRx.match(uVal) is not None for uVal in uniqVals),
+            dtype="bool", count=len(uniqVals)
+        )
+        return uniqMatch[uniqInv.ravel()]
+
+    if condOp == "in":
+        return np.isin(colArr, np.asarray(list(condArgs[0])))
+
+    if condOp == "range":
+        condMask = np.ones(len(colArr), dtype="bool")
+        if condArgs[0] is not None:
+            condMask &= colArr >= condArgs[0]
+        if condArgs[1] is not None:
+            condMask &= colArr <= condArgs[1]
+        return condMask
+
+    colStep = condArgs[0]
+    colOffset = condArgs[1] if len(condArgs) > 1 else 0
+    return (colArr - colOffset) % colStep == 0
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Shared Memory Tables
+================================
+Publishes tables in shared memory for other processes to attach to
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import copy
+import inspect
+import logging
+import weakref
+
+import numpy as np
+
+from multiprocessing import parent_process, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from .tablefs import TableFS
+
+logger = logging.getLogger(__name__)
+
+# Columns are placed in the block at offsets aligned to this many bytes
+BLOCK_ALIGN = 64
+
+# Names of the blocks published by this process, or by the process it
+# was forked from, which share the same resource tracker
+_publishedNames = set()
+
+class SharedTable:
+    """Publishes the NumPy data of a table in a single shared memory
+    block. The descriptor is a small picklable dictionary that holds
+    the metadata, column names, types and layout, and is passed to
+    worker processes, which call attachTable on it. The block is
+    removed when close is called, when the SharedTable is garbage
+    collected, or when the publishing process exits. Only the process
+    that created the block removes it, so a forked worker that closes
+    its copy of the SharedTable does not affect the others. Workers
+    that are still attached keep their views until they release them.
+    """
+
+    def __init__(self, tfsObj):
+
+        colLayout = {}
+        blockSize = 0
+        for vN in tfsObj.varNames:
+            colData = tfsObj.Data[vN]
+            if not isinstance(colData, np.ndarray) or colData.dtype.hasobject:
+                raise ValueError(
+                    "Column '%s' is not a NumPy array of fixed size values, "
+                    "use fastParse or convertToNumpy" % vN
+                )
+            blockSize = -(-blockSize//BLOCK_ALIGN)*BLOCK_ALIGN
+            colLayout[vN] = (colData.dtype.str, colData.shape, blockSize)
+            blockSize += colData.nbytes
+
+        self._sharedMem = SharedMemory(create=True, size=max(blockSize, 1))
+        self._finalizer = weakref.finalize(self, _releaseBlock, self._sharedMem, os.getpid())
+        _publishedNames.add(self._sharedMem._name)
+
+        for vN, (colType, colShape, colOffset) in colLayout.items():
+            colView = np.ndarray(colShape, colType, buffer=self._sharedMem.buf, offset=colOffset)
+            colView[...] = tfsObj.Data[vN]
+            del colView
+
+        self.blockName  = self._sharedMem.name
+        self.descriptor = {
+            "blockName": self.blockName,
+            "fileName":  tfsObj.fileName,
+            "metaData":  dict(tfsObj.metaData),
+            "varNames":  list(tfsObj.varNames),
+            "varTypes":  list(tfsObj.varTypes),
+            "columns":   colLayout,
+            "segments":  copy.deepcopy(tfsObj.segments),
+            "strVocab":  {vN: np.array(vocab) for vN, vocab in tfsObj.strVocab.items()},
+        }
+        logger.debug("Published %d columns in shared memory block '%s' of %d bytes" % (
+            len(colLayout), self.blockName, blockSize
+        ))
+
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTrace):
+        self.close()
+        return False
+
+    def close(self):
+        """Remove the shared memory block. Processes that are attached
+        keep their views, but no new process can attach. In any other
+        process than the publisher, the block is only closed.
+        """
+        self._finalizer()
+        return
+
+## End Class SharedTable
+
+def attachTable(tableDesc):
+    """Attach to a table published by a SharedTable, from its
+    descriptor, and return a TableFS with read-only NumPy views of the
+    shared memory as its data. Nothing is copied. The shared memory
+    stays mapped for as long as any of the views exist.
+
+    The block is not left registered with the resource tracker of the
+    attaching process, since the tracker would otherwise remove it when
+    the worker exits, while the publisher is still using it.
+    """
+    sharedMem = _attachBlock(tableDesc["blockName"])
+    blockBuffer = np.frombuffer(sharedMem.buf, dtype="uint8")
+
+    tfsObj = TableFS()
+    tfsObj.fileName = tableDesc["fileName"]
+    tfsObj.metaData = dict(tableDesc["metaData"])
+    tfsObj.varNames = list(tableDesc["varNames"])
+    tfsObj.varTypes = list(tableDesc["varTypes"])
+    tfsObj.segments = copy.deepcopy(tableDesc["segments"])
+    tfsObj.strVocab = dict(tableDesc["strVocab"])
+    tfsObj.Data = {
+        vN: np.asarray(_BlockView(sharedMem, blockBuffer, colType, colShape, colOffset))
+        for vN, (colType, colShape, colOffset) in tableDesc["columns"].items()
+    }
+    tfsObj.nLines = len(tfsObj.Data[tfsObj.varNames[0]]) if tfsObj.varNames else 0
+    tfsObj.hasNAME = "NAME" in tfsObj.Data
+
+    return tfsObj
+
+##
+#  Internal Functions
+##
+
+class _BlockView:
+    """A read-only array interface to part of a shared memory block.
+    Arrays made from it keep it as their base, so the block stays
+    mapped, and is only closed when the last array is gone.
+    """
+
+    def __init__(self, sharedMem, blockBuffer, colType, colShape, colOffset):
+        self._sharedMem   = sharedMem
+        self._blockBuffer = blockBuffer
+        self.__array_interface__ = {
+            "version": 3,
+            "typestr": np.dtype(colType).str,
+            "descr":   np.dtype(colType).descr,
+            "shape":   tuple(colShape),
+            "data":    (blockBuffer.ctypes.data + colOffset, True),
+        }
+        return
+
+    def __del__(self):
+        # The buffer must be released before the block can be closed
+        self._blockBuffer = None
+        self._sharedMem = None
+
+## End Class _BlockView
+
+def _attachBlock(blockName):
+    """Open an existing shared memory block without leaving it
+    registered with the resource tracker. Python 3.13 and later support
+    this directly. On earlier versions, the block is unregistered again
+    after it is opened, unless the tracker is the one of the publisher,
+    which is shared with the processes it starts.
+    """
+    if "track" in inspect.signature(SharedMemory).parameters:
+        return SharedMemory(name=blockName, track=False)
+
+    sharedMem = SharedMemory(name=blockName)
+    if sharedMem._name not in _publishedNames and parent_process() is None:
+        resource_tracker.unregister(sharedMem._name, "shared_memory")
+
+    return sharedMem
+
+def _releaseBlock(sharedMem, ownerPid):
+    """Close a published shared memory block, and remove it if this is
+    the process that created it.
+    """
+    try:
+        sharedMem.close()
+    except BufferError:
+        logger.warning("Shared memory block '%s' is still in use" % sharedMem.name)
+    if os.getpid() != ownerPid:
+        return
+
+    _publishedNames.discard(sharedMem._name)
+    try:
+        sharedMem.unlink()
+    except FileNotFoundError:
+        pass
+
+    return
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Table Statistics
+============================
+Timing and throughput statistics for reading and converting tables
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class TableStats:
+    """Statistics of a single read or convert operation. The wall time
+    of each phase is kept in phaseTimes. Phases do not overlap, so time
+    spent reading the file during tokenizing is counted as 'io' only.
+    The peak column memory is the largest total size of the NumPy data
+    columns seen at the end of any phase.
+    """
+
+    def __init__(self, operation, fileName=None):
+
+        self.operation    = operation
+        self.fileName     = fileName
+        self.phaseTimes   = {}
+        self.nBytes       = 0
+        self.nRows        = 0
+        self.peakColBytes = 0
+        self.wallTime     = 0.0
+
+        self._tStart = time.perf_counter()
+
+        return
+
+    def __str__(self):
+        return "%s of %d rows and %d bytes in %.3f s (%.0f rows/s) [%s]" % (
+            self.operation, self.nRows, self.nBytes, self.wallTime, self.rowsPerSec(),
+            ", ".join("%s: %.3f s" % (pN, pT) for pN, pT in self.phaseTimes.items())
+        )
+
+    def addTime(self, phaseName, tElapsed):
+        """Add time to a phase.
+        """
+        self.phaseTimes[phaseName] = self.phaseTimes.get(phaseName, 0.0) + tElapsed
+        return
+
+    def startPhase(self):
+        """Return a start time for endPhase.
+        """
+        return time.perf_counter(), self.phaseTimes.get("io", 0.0)
+
+    def endPhase(self, phaseName, phaseStart):
+        """Add the time since startPhase to a phase, minus the time that
+        was added to 'io' in the meantime.
+        """
+        tStart, ioStart = phaseStart
+        tElapsed = time.perf_counter() - tStart
+        if phaseName != "io":
+            tElapsed -= self.phaseTimes.get("io", 0.0) - ioStart
+        self.addTime(phaseName, tElapsed)
+        return
+
+    def updateColBytes(self, colData):
+        """Update the peak column memory from a dictionary of columns.
+        Only NumPy arrays are counted, and only loaded lazy columns.
+        """
+        colBytes = sum(
+            colArr.nbytes for colArr in dict.values(colData) if isinstance(colArr, np.ndarray)
+        )
+        self.peakColBytes = max(self.peakColBytes, colBytes)
+        return
+
+    def finish(self):
+        """Record the total wall time of the operation.
+        """
+        self.wallTime = time.perf_counter() - self._tStart
+        return
+
+    def rowsPerSec(self):
+        """The number of rows processed per second.
+        """
+        return self.nRows/self.wallTime if self.wallTime > 0.0 else 0.0
+
+    def bytesPerSec(self):
+        """The number of bytes read per second.
+        """
+        return self.nBytes/self.wallTime if self.wallTime > 0.0 else 0.0
+
+    def asDict(self):
+        """Return the statistics as a dictionary of plain values.
+        """
+        return {
+            "operation":    self.operation,
+            "fileName":     self.fileName,
+            "phaseTimes":   dict(self.phaseTimes),
+            "nBytes":       self.nBytes,
+            "nRows":        self.nRows,
+            "peakColBytes": self.peakColBytes,
+            "wallTime":     self.wallTime,
+            "rowsPerSec":   self.rowsPerSec(),
+            "bytesPerSec":  self.bytesPerSec(),
+        }
+
+## End Class TableStats
+
+def timedLines(tfsFile, tfsStats=None, blockSize=1048576):
+    """Iterate over the lines of an open file, reading blocks of about
+    blockSize bytes at a time. The time spent reading is added to the
+    'io' phase of tfsStats, if given.
+    """
+    while True:
+        tStart = time.perf_counter()
+        lineBlock = tfsFile.readlines(blockSize)
+        if tfsStats is not None:
+            tfsStats.addTime("io", time.perf_counter() - tStart)
+        if not lineBlock:
+            break
+        yield from lineBlock
+
+    return
@@ -21,18 +21,48 @@ You should have received a copy of the GNU General Public License
 along with this program. If not, see <https://www.gnu.org/licenses/>.
 """
 
+import io
+import bisect
+import itertools
 import logging
+import os
 import re
 
 import numpy as np
 
+from .fileio import compressionType, findTailStart, openTableFile
+from .header import parseMetaLine, readHeader, readTableHeader, stripQuotes
+from .stats import TableStats, timedLines
+from .writer import TFSWriter, segmentLine
+from .parser import (
+    LazyColumns, closeSegments, fillRecords, filterMask, filterSegments, iterDataChunks,
+    parseDataLines, parseFilteredLines, parseSegmentLine, recordDType, rowFilterColumns,
+    scanObsNumbers, selectColumns, trackSegments
+)
+
 logger = logging.getLogger(__name__)
 
 class TableFS:
 
-    def __init__(self, fileName=None):
+    # Columns of %le type that hold integers in MAD-X tracking output
+    INT_COLUMNS = ("NUMBER", "TURN")
+
+    # The largest fraction of distinct values for dictionary encoding
+    VOCAB_FRACTION = 0.5
+
+    def __init__(
+        self, fileName=None, fastParse=False, cache=None, useCols=None, lazy=False, statsHook=None,
+        rowFilter=None
+    ):
 
         self.fileName  = fileName
+        self.fastParse = fastParse
+        self.cache     = cache
+        self.useCols   = useCols
+        self.lazy      = lazy
+        self.statsHook = statsHook
+        self.rowFilter = rowFilter
+        self.stats     = None
         self.metaData  = {}
         self.varNames  = []
         self.varTypes  = []
@@ -40,12 +70,34 @@ class TableFS:
         self.nLines    = 0
         self.sliceElem = {}
         self.hasNAME   = False
+        self.segments  = []
+        self.seqShift  = 0
+        self.strVocab  = {}
+
+        self._nameIndex   = None
+        self._searchCache = {}
+        self._followState = None
+        self._sIndex      = None
+        self._recData     = None
 
         if fileName is not None:
             self.readFile()
 
         return
 
+    @classmethod
+    async def aread(cls, fileName, loader=None, **readArgs):
+        """Load a table from asyncio code without blocking the event
+        loop. The keyword arguments are passed to the constructor. The
+        load runs in the executor of a TableLoader, or of the shared
+        default loader if loader is None.
+        """
+        if loader is None:
+            from .aio import defaultLoader
+            loader = defaultLoader()
+
+        return await loader.read(fileName, **readArgs)
+
     def clearData(self):
         """Clear the data arrays.
         """
@@ -56,35 +108,146 @@ class TableFS:
         self.nLines    = 0
         self.sliceElem = {}
         self.hasNAME   = False
+        self.segments  = []
+        self.seqShift  = 0
+        self.strVocab  = {}
+
+        self._nameIndex   = None
+        self._searchCache = {}
+        self._followState = None
+        self._sIndex      = None
+        self._recData     = None
 
         return
 
-    def readFile(self, fileName=None):
+    def readFile(
+        self, fileName=None, fastParse=None, useCols=None, lazy=None, headerOnly=False,
+        outRecords=None, rowFilter=None
+    ):
         """Parse a file and save the data in the data arrays. If a file
         name is not specified, the one specified in the contructor will
         be used instead.
+
+        With fastParse, the data block is parsed in a single pass
+        directly into typed NumPy arrays, so convertToNumpy is not
+        needed. If not specified, the constructor setting is used.
+
+        With useCols, only the listed columns are parsed and stored,
+        and varNames and varTypes only hold those columns. With lazy,
+        the file is only scanned for its header, line count and
+        segments, and each column is parsed on first access to Data.
+        Both imply fastParse. If not specified, the constructor
+        settings are used.
+
+        With headerOnly, reading stops at the first data line, so only
+        metaData, varNames and varTypes are set. See also scanHeaders.
+
+        With outRecords, a preallocated NumPy structured array, the
+        columns named by its fields are parsed directly into it, and
+        Data holds views of the fields. The array must have room for
+        all rows. See recordDType and toRecords. This implies fastParse
+        and bypasses the cache.
+
+        With rowFilter, only the rows that pass a set of conditions on
+        their values are stored, for instance
+        {'NUMBER': ('in', [1, 5]), 'TURN': ('every', 10)}. The file is
+        parsed in chunks, and each chunk is filtered before it is kept.
+        Segments are mapped to the kept rows, and segments without kept
+        rows are dropped. See parser.rowFilterColumns for the conditions.
+        This implies fastParse, and can not be used with lazy or
+        outRecords. If not specified, the constructor setting is used.
+
+        The '#segment' lines of MAD-X trackone files are recorded in
+        the segments list, see getSegment and getObservation.
+
+        Files compressed with gzip, bzip2 or xz are decompressed as a
+        stream on a reader thread while they are parsed. Lazy columns
+        of compressed files are decompressed again on each access.
+
+        If the object has a TableCache, the table is loaded as read-only
+        memory-mapped arrays from the cache when the file is unchanged.
+        Otherwise it is parsed with fastParse and added to the cache.
+
+        The timing of each phase of the read is recorded in a TableStats
+        object in stats, which is also logged at debug level and passed
+        to statsHook if it is set.
         """
         if fileName is not None:
             self.fileName = fileName
+        if fastParse is None:
+            fastParse = self.fastParse
+        if useCols is None:
+            useCols = self.useCols
+        if lazy is None:
+            lazy = self.lazy
+        if rowFilter is None:
+            rowFilter = self.rowFilter
+        if rowFilter is not None and (lazy or outRecords is not None) and not headerOnly:
+            raise ValueError("A row filter can not be used with lazy or outRecords")
 
         self.clearData()
-        with open(self.fileName, "r") as tfsFile:
-            for tfsLine in tfsFile:
+        tfsStats = TableStats("readFile", self.fileName)
+        if headerOnly:
+            phaseStart = tfsStats.startPhase()
+            self.metaData, self.varNames, self.varTypes = readTableHeader(self.fileName)
+            self.hasNAME = "NAME" in self.varNames
+            tfsStats.endPhase("header", phaseStart)
+            self._emitStats(tfsStats)
+            return
+
+        if outRecords is not None:
+            self._readFileFast(tfsStats=tfsStats, outRecords=outRecords)
+            self._emitStats(tfsStats)
+            return
+
+        if self.cache is not None:
+            phaseStart = tfsStats.startPhase()
+            cacheEntry = self.cache.load(self.fileName)
+            tfsStats.endPhase("cache", phaseStart)
+            if cacheEntry is None:
+                self._readFileFast(tfsStats=tfsStats)
+                phaseStart = tfsStats.startPhase()
+                self.cache.store(
+                    self.fileName, self.metaData, self.varNames, self.varTypes, self.Data,
+                    segments=self.segments
+                )
+                tfsStats.endPhase("store", phaseStart)
+            else:
+                (
+                    self.metaData, self.varNames, self.varTypes, self.Data, self.segments
+                ) = cacheEntry
+                tfsStats.nBytes = sum(colData.nbytes for colData in self.Data.values())
+            if rowFilter is not None:
+                phaseStart = tfsStats.startPhase()
+                rowFilterColumns(rowFilter, self.varNames)
+                rowMask = filterMask(self.Data, rowFilter)
+                self.Data = {vN: colData[rowMask] for vN, colData in self.Data.items()}
+                self.segments = filterSegments(self.segments, np.flatnonzero(rowMask))
+                tfsStats.endPhase("filter", phaseStart)
+            self._selectVars(useCols)
+            self._updateLines()
+            self._emitStats(tfsStats)
+            return
+
+        if lazy:
+            self._readFileLazy(useCols, tfsStats=tfsStats)
+            self._emitStats(tfsStats)
+            return
+
+        if fastParse or useCols is not None or rowFilter is not None:
+            self._readFileFast(useCols, tfsStats=tfsStats, rowFilter=rowFilter)
+            self._emitStats(tfsStats)
+            return
+
+        tfsStats.nBytes = os.path.getsize(self.fileName)
+        phaseStart = tfsStats.startPhase()
+        with openTableFile(self.fileName) as tfsFile:
+            for tfsLine in timedLines(tfsFile, tfsStats):
                 # Metadata
                 if tfsLine[0] == "@":
-                    spLines = tfsLine.lstrip().split(None, maxsplit=3)[1:]
-                    if spLines[1].endswith("d"):
-                        self.metaData[spLines[0]] = int(spLines[2])
-                    elif spLines[1].endswith("le"):
-                        self.metaData[spLines[0]] = float(spLines[2])
-                    elif spLines[1].endswith("s"):
-                        self.metaData[spLines[0]] = self._stripQuotes(spLines[2].strip())
-                    else:
-                        logger.warning(
-                            "Unknown type '%s' for metadata variable '%s'" % (
-                                spLines[1], spLines[2].strip()
-                            )
-                        )
+                    metaValue = parseMetaLine(tfsLine)
+                    if metaValue is not None:
+                        self.metaData[metaValue[0]] = metaValue[1]
 
                 # Header/Variable Names
                 elif tfsLine[0] == "*":
@@ -99,6 +262,10 @@ class TableFS:
                     for spLine in spLines:
                         self.varTypes.append(spLine)
 
+                # Segment
+                elif tfsLine.startswith("#segment"):
+                    self.segments.append(parseSegmentLine(tfsLine, self.nLines))
+
                 # Comment
                 elif tfsLine.strip()[0] == "#":
                     pass
@@ -116,6 +283,11 @@ class TableFS:
                     self.nLines += 1
 
             logger.info("%d lines of data read" % self.nLines)
+        tfsStats.endPhase("parse", phaseStart)
+
+        phaseStart = tfsStats.startPhase()
+        closeSegments(self.segments, self.nLines, self.Data.get("TURN"))
+        tfsStats.endPhase("segments", phaseStart)
 
         if "NAME" in self.Data:
             dataLines = len(self.Data["NAME"])
@@ -129,17 +301,284 @@ class TableFS:
                 self.nLines, dataLines
             ))
 
+        self._emitStats(tfsStats)
+
+        return
+
+    def iterChunks(self, fileName=None, chunkRows=100000, useCols=None):
+        """Parse a file in blocks of at most chunkRows data lines, and
+        yield each block as a dictionary of typed NumPy arrays. The
+        header is parsed once into the metadata and variable arrays,
+        while the data arrays are left empty, so memory use does not
+        depend on the size of the file. With useCols, only the listed
+        columns are parsed, and varNames and varTypes only hold those
+        columns, like for readFile.
+        """
+        if fileName is not None:
+            self.fileName = fileName
+
+        self.clearData()
+        tfsStats = TableStats("iterChunks", self.fileName)
+        tfsStats.nBytes = os.path.getsize(self.fileName)
+        with openTableFile(self.fileName) as tfsFile:
+            phaseStart = tfsStats.startPhase()
+            self.metaData, self.varNames, self.varTypes, firstLine = readHeader(tfsFile)
+            self.hasNAME = "NAME" in self.varNames
+            tfsStats.endPhase("header", phaseStart)
+            varNames, varTypes = self.varNames, self.varTypes
+            self._selectVars(useCols)
+            if firstLine is None or not self.varNames:
+                self._emitStats(tfsStats)
+                return
+
+            tfsLines = self._trackSegments(
+                itertools.chain([firstLine], timedLines(tfsFile, tfsStats))
+            )
+            for colData in iterDataChunks(
+                tfsLines, varNames, varTypes, chunkRows, useCols=useCols, tfsStats=tfsStats
+            ):
+                self.nLines += len(next(iter(colData.values())))
+                yield colData
+
+        closeSegments(self.segments, self.nLines)
+        logger.info("%d lines of data read" % self.nLines)
+        self._emitStats(tfsStats)
+
+        return
+
+    def readTurns(
+        self, fileName=None, turnStep=None, turnList=None, lastTurns=None, useCols=None
+    ):
+        """Read a subset of the turns of a trackone or per particle
+        tracking file. Exactly one of the selections must be given:
+        turnStep keeps the turns that are a multiple of the step,
+        turnList keeps the listed turns, for instance a logarithmically
+        spaced set, and lastTurns keeps the last turns of the file.
+
+        The stride and list selections are row filters on TURN, see
+        readFile. For lastTurns, the file is read backwards from its end
+        until the start of the window is found, and only the window is
+        parsed. The turns must then be in increasing order through the
+        file, as MAD-X writes them, and observation points are numbered
+        from the first turns of the file. Compressed files can not be
+        read backwards, so the TURN column is first streamed to find the
+        last turn, and the window is then filtered while parsing.
+        """
+        if sum(tSel is not None for tSel in (turnStep, turnList, lastTurns)) != 1:
+            raise ValueError("Exactly one of turnStep, turnList or lastTurns must be given")
+        if fileName is not None:
+            self.fileName = fileName
+
+        if turnStep is not None:
+            self.readFile(useCols=useCols, rowFilter={"TURN": ("every", turnStep)})
+            return
+        if turnList is not None:
+            self.readFile(useCols=useCols, rowFilter={"TURN": ("in", turnList)})
+            return
+
+        if lastTurns < 1:
+            raise ValueError("The number of turns must be positive")
+
+        if compressionType(self.fileName) is not None:
+            lastTurn = self._readLastTurn()
+            firstTurn = None if lastTurn is None else lastTurn - lastTurns + 1
+            self.readFile(useCols=useCols, rowFilter={"TURN": ("range", firstTurn, None)})
+            return
+
+        self.clearData()
+        tfsStats = TableStats("readTurns", self.fileName)
+        with openTableFile(self.fileName, threaded=False) as tfsFile:
+            phaseStart = tfsStats.startPhase()
+            self.metaData, self.varNames, self.varTypes, firstLine = readHeader(tfsFile)
+            self.hasNAME = "NAME" in self.varNames
+            tfsStats.endPhase("header", phaseStart)
+            if "TURN" not in self.varNames:
+                raise KeyError("No column named 'TURN' found")
+            if firstLine is None:
+                self.Data = parseDataLines([], self.varNames, self.varTypes, useCols=useCols)
+                self._selectVars(useCols)
+                self._emitStats(tfsStats)
+                return
+
+            dataPos = tfsFile.tell() - len(firstLine.encode("utf-8"))
+            obsNumbers = {}
+            if firstLine.startswith("#segment"):
+                phaseStart = tfsStats.startPhase()
+                obsNumbers = scanObsNumbers(itertools.chain([firstLine], tfsFile))
+                tfsStats.endPhase("segments", phaseStart)
+
+        phaseStart = tfsStats.startPhase()
+        tailPos = findTailStart(self.fileName, dataPos, self.varNames.index("TURN"), lastTurns)
+        tfsStats.endPhase("seek", phaseStart)
+
+        tfsStats.nBytes = os.path.getsize(self.fileName) - tailPos
+        with open(self.fileName, mode="rb") as binFile:
+            binFile.seek(tailPos)
+            with io.TextIOWrapper(binFile) as tfsFile:
+                self.Data = parseDataLines(
+                    self._trackSegments(timedLines(tfsFile, tfsStats)), self.varNames,
+                    self.varTypes, useCols=useCols, tfsStats=tfsStats
+                )
+
+        self._selectVars(useCols)
+        self._updateLines()
+        closeSegments(self.segments, self.nLines, obsNumbers=obsNumbers)
+        logger.info("%d lines of data read from the last %d turns" % (self.nLines, lastTurns))
+        self._emitStats(tfsStats)
+
+        return
+
+    def follow(self, fileName=None, useCols=None):
+        """Start following a file that is being written, like the
+        tracking output of a running MAD-X job. The complete lines
+        written so far are read, and each call to refresh reads only
+        the lines appended since. The data arrays are views of buffers
+        that grow in steps of doubling size. With useCols, only the
+        listed columns are parsed. Compressed files can not be followed.
+        Returns the number of lines read.
+        """
+        if fileName is not None:
+            self.fileName = fileName
+
+        self.clearData()
+        self._followState = {
+            "offset": 0, "useCols": useCols, "buffers": {}, "obsNumbers": {},
+        }
+
+        return self.refresh()
+
+    def refresh(self):
+        """Read the complete lines appended to a followed file since
+        the last call, see follow. An incomplete last line is left for
+        the next call. If the file has shrunk, it is read again from the
+        start. Returns the number of new lines.
+        """
+        theState = self._followState
+        if theState is None:
+            raise ValueError("No file is being followed, see follow()")
+
+        tfsStats = TableStats("refresh", self.fileName)
+        phaseStart = tfsStats.startPhase()
+        with open(self.fileName, mode="rb") as inFile:
+            inFile.seek(0, os.SEEK_END)
+            if inFile.tell() < theState["offset"]:
+                logger.warning("File '%s' has shrunk, reading it again" % self.fileName)
+                return self.follow(useCols=theState["useCols"])
+            inFile.seek(theState["offset"])
+            newBytes = inFile.read()
+        tfsStats.endPhase("io", phaseStart)
+
+        lineEnd = newBytes.rfind(b"\n") + 1
+        tfsLines = io.StringIO(newBytes[:lineEnd].decode("utf-8"))
+        if not self.varNames:
+            phaseStart = tfsStats.startPhase()
+            metaData, varNames, varTypes, firstLine = readHeader(tfsLines)
+            tfsStats.endPhase("header", phaseStart)
+            if not varTypes:
+                # The header is not complete until the '$' line
+                self._emitStats(tfsStats, nRows=0)
+                return 0
+
+            self.metaData, self.varNames, self.varTypes = metaData, varNames, varTypes
+            self.hasNAME = "NAME" in self.varNames
+            if firstLine is not None:
+                tfsLines = itertools.chain([firstLine], tfsLines)
+            if theState["useCols"] is not None:
+                theState["allNames"] = (self.varNames, self.varTypes)
+                self._selectVars(theState["useCols"])
+
+        theState["offset"] += lineEnd
+        tfsStats.nBytes = lineEnd
+
+        # Parse the new lines, reopening the last segment
+        nSegs = len(self.segments)
+        if nSegs > 0:
+            self.segments[-1]["rowEnd"] = None
+        varNames, varTypes = theState.get("allNames", (self.varNames, self.varTypes))
+        turnCol = varNames.index("TURN") if "TURN" in varNames else None
+        colData = parseDataLines(
+            trackSegments(tfsLines, self.segments, turnCol=turnCol, rowStart=self.nLines),
+            varNames, varTypes, useCols=theState["useCols"], tfsStats=tfsStats
+        )
+        nNew = len(next(iter(colData.values()))) if colData else 0
+
+        phaseStart = tfsStats.startPhase()
+        for vN, newData in colData.items():
+            self.Data[vN] = self._appendBuffer(theState["buffers"], vN, newData, self.nLines)
+        tfsStats.endPhase("append", phaseStart)
+
+        self.nLines += nNew
+        closeSegments(
+            self.segments[max(nSegs - 1, 0):], self.nLines, obsNumbers=theState["obsNumbers"]
+        )
+        self._nameIndex = None
+        self._searchCache = {}
+        self._sIndex = None
+        self._emitStats(tfsStats, nRows=nNew)
+        if nNew > 0:
+            logger.debug("%d new lines of data read" % nNew)
+
+        return nNew
+
+    def writeFile(self, fileName, chunkRows=100000):
+        """Write the table to a TFS file, formatting blocks of at most
+        chunkRows rows at a time. The data may be either NumPy arrays or
+        the string lists from readFile. Segments of trackone files are
+        written as '#segment' lines.
+        """
+        self._loadLazy()
+        strWidths = {}
+        for vN, vT in zip(self.varNames, self.varTypes):
+            if not (vT.endswith("d") or vT.endswith("le")) and self.nLines > 0:
+                strWidths[vN] = int(np.max(np.char.str_len(
+                    np.asarray(self.getColumn(vN), dtype="str")
+                ))) + 2
+
+        with TFSWriter(
+            fileName, self.metaData, self.varNames, self.varTypes, strWidths=strWidths
+        ) as tfsWriter:
+            segStarts = [theSeg["rowStart"] for theSeg in self.segments]
+            for rowStart in range(0, max(self.nLines, 1), chunkRows):
+                rowEnd = min(rowStart + chunkRows, self.nLines)
+                if rowEnd == self.nLines:
+                    segRange = range(bisect.bisect_left(segStarts, rowStart), len(segStarts))
+                else:
+                    segRange = range(
+                        bisect.bisect_left(segStarts, rowStart),
+                        bisect.bisect_left(segStarts, rowEnd)
+                    )
+                tfsWriter.writeChunk({
+                    vN: self._decodeRows(vN, rowStart, rowEnd) for vN in self.varNames
+                }, insertLines=[
+                    (segStarts[i] - rowStart, segmentLine(self.segments[i])) for i in segRange
+                ])
+
         return
 
-    def convertToNumpy(self):
+    def convertToNumpy(self, compact=False, floatCols=None, intCols=None):
         """Convert data to NumPy arrays
+
+        With compact, the arrays are made smaller: string columns with
+        few distinct values are stored as integer codes into a
+        vocabulary in strVocab, see getColumn, and integer columns are
+        narrowed to the smallest type that holds their values. This
+        includes the listed intCols, or the INT_COLUMNS, of %le type
+        if all their values are whole numbers. The floatCols, or all
+        float columns if True, are stored as 32 bit floats.
+
+        The timing is recorded in stats, like for readFile.
         """
+        tfsStats = TableStats("convertToNumpy", self.fileName)
+        phaseStart = tfsStats.startPhase()
+        self._loadLazy()
         for i in range(len(self.varNames)):
 
             vN = self.varNames[i]
             vT = self.varTypes[i]
 
-            if vT.endswith("d"):
+            if vN in self.strVocab:
+                continue
+            elif vT.endswith("d"):
                 self.Data[vN] = np.asarray(self.Data[vN], dtype="int")
             elif vT.endswith("le"):
                 self.Data[vN] = np.asarray(self.Data[vN], dtype="float")
@@ -147,70 +586,612 @@ class TableFS:
                 self.Data[vN] = np.asarray(self.Data[vN], dtype="str")
             else:
                 logger.error("Unknown type '%s' for variable '%s'" % (vT, vN))
+        tfsStats.endPhase("convert", phaseStart)
+        tfsStats.updateColBytes(self.Data)
+
+        if compact:
+            phaseStart = tfsStats.startPhase()
+            self._compactData(floatCols, intCols)
+            tfsStats.endPhase("compact", phaseStart)
+
+        self._emitStats(tfsStats)
 
         return
 
-    def shiftSeq(self, newFirst):
+    def getColumn(self, columnName):
+        """Return a data column, decoding it if it is stored as codes
+        into a vocabulary by convertToNumpy.
+        """
+        if columnName in self.strVocab:
+            return self.strVocab[columnName][self.Data[columnName]]
+        return self.Data[columnName]
+
+    def recordDType(self, columnNames=None, strLen=None):
+        """Return the dtype of a structured array for the columns, for
+        preallocating the outRecords array of readFile. Only the header
+        is needed, see the headerOnly option of readFile. String columns
+        are strLen characters long, or Python objects if strLen is None.
+        """
+        return recordDType(self.varNames, self.varTypes, useCols=columnNames, strLen=strLen)
+
+    def toRecords(self, columnNames=None):
+        """Return the data as a single NumPy structured array with one
+        field per column, in the order of columnNames, or of varNames.
+        If the columns are still the fields of the array filled by
+        readFile with outRecords, that array, or a view of it, is
+        returned without copying. Otherwise the columns are copied into
+        a new array. Compact columns are returned as stored in Data, and
+        tables read without fastParse must be converted with
+        convertToNumpy first.
+        """
+        colNames = self._selectNames(columnNames)
+        self._loadLazy(colNames)
+        recData = self._recData
+        if recData is not None and all(
+            self._isRecordField(self.Data[vN], recData, vN) for vN in colNames
+        ):
+            if tuple(colNames) == recData.dtype.names:
+                return recData
+            return recData[colNames]
+
+        colArrays = [np.asarray(self.Data[vN]) for vN in colNames]
+        outRecords = np.empty(self.nLines, dtype=[
+            (vN, colArr.dtype) for vN, colArr in zip(colNames, colArrays)
+        ])
+        for vN, colArr in zip(colNames, colArrays):
+            outRecords[vN] = colArr
+        logger.debug("Copied %d columns into a record array" % len(colNames))
+
+        return outRecords
+
+    def toDataFrame(self, columnNames=None):
+        """Return the data as a pandas DataFrame, with the columns in
+        the order of columnNames, or of varNames. NumPy columns are
+        passed to pandas without copying, so the DataFrame shares memory
+        with Data. Requires pandas.
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError("The pandas package is required for toDataFrame") from None
+
+        colNames = self._selectNames(columnNames)
+        self._loadLazy(colNames)
+        return pandas.DataFrame(
+            {vN: np.asarray(self.Data[vN]) for vN in colNames}, columns=colNames, copy=False
+        )
+
+    def shiftSeq(self, newFirst, inPlace=False):
         """Shift the sequence such that the element newFirst is the
         first in the sequence.
+
+        By default, each data array is replaced by a rotated copy. With
+        inPlace, the arrays are rotated within their own memory, which
+        avoids allocating a new table for each shift. Read-only arrays
+        are still copied. The accumulated shift since the file was read
+        is kept in seqShift.
         """
         if not self.hasNAME:
             raise TypeError("This TFS table is not indexed by NAME")
 
-        if not isinstance(self.Data["S"][0], float):
+        self._loadLazy()
+        if not (isinstance(self.Data["S"], np.ndarray) and self.Data["S"].dtype.kind == "f"):
             raise ValueError("S column is not a number. Please run convertToNumpy().")
 
         # Find the index of the first element:
-        idx = -1
-        for (i, name) in zip(range(self.nLines), self.Data["NAME"]):
-            if name == newFirst:
-                idx = i
-                break
-
-        if idx == -1:
-            raise KeyError("No element named '%s' found" % newFirst)
+        idx = self.findName(newFirst)
 
         # Shift all the data arrays
         for d in self.Data:
-            self.Data[d] = np.roll(self.Data[d], -idx)
+            if inPlace and isinstance(self.Data[d], np.ndarray) and self.Data[d].flags.writeable:
+                self._rotateArray(self.Data[d], idx)
+            else:
+                self.Data[d] = np.roll(self.Data[d], -idx)
 
-        # Rezero S
-        s0 = self.Data["S"][0]
+        self.seqShift = (self.seqShift + idx) % self.nLines
+        self._searchCache = {}
+        self._sIndex = None
 
-        for i in range(self.nLines):
-            self.Data["S"][i] -= s0
-            if self.Data["S"][i] < 0:
-                self.Data["S"][i] += self.metaData["LENGTH"]
+        # Rezero S
+        sData = self.Data["S"]
+        sData -= sData[0]
+        sData[sData < 0] += self.metaData["LENGTH"]
 
-        if self.Data["S"][-1] == 0.0:
+        if sData[-1] == 0.0:
             logger.warning("Shifting last element from 0.0 to %d" % self.metaData["LENGTH"])
-            self.Data["S"][-1] = self.metaData["LENGTH"]
+            sData[-1] = self.metaData["LENGTH"]
 
         # Kill elements array which is no longer valid
         self.sliceElem = None
 
         return
 
+    def getSegment(self, segIdx):
+        """Return the data rows of a '#segment' block of a trackone file
+        as a dictionary of arrays. The segment is given by its position
+        in the segments list. For NumPy data, the arrays are views.
+        """
+        theSeg = self.segments[segIdx]
+        self._loadLazy()
+        return {
+            vN: self.Data[vN][theSeg["rowStart"]:theSeg["rowEnd"]] for vN in self.varNames
+        }
+
+    def getObservation(self, obsNumber):
+        """Return all data rows recorded at an observation point of a
+        trackone file as a dictionary of arrays. Observation points are
+        numbered from 1 in order of first appearance, like the obsNNNN
+        files. If the observation point has a single segment, the
+        arrays are views, otherwise the segments are concatenated.
+        """
+        obsSegs = [theSeg for theSeg in self.segments if theSeg["obsNumber"] == obsNumber]
+        if not obsSegs:
+            raise KeyError("No observation point number %d found" % obsNumber)
+
+        if len(obsSegs) == 1:
+            return self.getSegment(self.segments.index(obsSegs[0]))
+
+        self._loadLazy()
+        obsRows = np.concatenate([
+            np.arange(theSeg["rowStart"], theSeg["rowEnd"]) for theSeg in obsSegs
+        ])
+        return {vN: np.asarray(self.Data[vN])[obsRows] for vN in self.varNames}
+
+    def interpolateAt(self, sPos, columnNames, method="linear"):
+        """Look up the values of one or more columns at an array of S
+        positions in a single vectorised call. Returns an array if
+        columnNames is a single name, otherwise a dictionary of arrays.
+
+        With method 'linear', the values are interpolated linearly
+        between the rows on either side of each position. At the S of
+        a thin element, the value after the element is returned. With
+        method 'element', the value of the element that ends at or after
+        each position is returned, which also works for string columns.
+
+        If the metadata has a LENGTH, the positions are wrapped into the
+        range 0 to LENGTH and the columns are treated as periodic. The
+        sorted S index is cached until the table is changed, for
+        instance by shiftSeq.
+        """
+        if isinstance(columnNames, str):
+            return self.interpolateAt(sPos, [columnNames], method=method)[columnNames]
+        if method not in ("linear", "element"):
+            raise ValueError("Unknown interpolation method '%s'" % method)
+
+        self._loadLazy([vN for vN in ["S"] + list(columnNames) if vN in self.varNames])
+        theValues = {}
+        if method == "element":
+            rowIdx = self.findElementAt(sPos)
+            for vN in columnNames:
+                theValues[vN] = np.asarray(self.getColumn(vN))[rowIdx]
+            return theValues
+
+        sOrder, sSorted, sLength = self._getSIndex()
+        sPos = np.asarray(sPos, dtype="float")
+        if sLength is not None:
+            sPos = np.mod(sPos, sLength)
+            sSorted = np.concatenate([
+                [sSorted[-1] - sLength], sSorted, [sSorted[0] + sLength]
+            ])
+            sOrder = np.concatenate([[sOrder[-1]], sOrder, [sOrder[0]]])
+
+        # The interval and weight of each position are shared by all
+        # columns, like np.interp, but with a single search
+        if len(sSorted) > 1:
+            leftIdx = np.searchsorted(sSorted, sPos, side="right") - 1
+            leftIdx = np.clip(leftIdx, 0, len(sSorted) - 2)
+            sStep = sSorted[leftIdx + 1] - sSorted[leftIdx]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                theWeight = np.where(sStep > 0.0, (sPos - sSorted[leftIdx])/sStep, 0.0)
+            theWeight = np.clip(theWeight, 0.0, 1.0)
+        else:
+            leftIdx = np.zeros(sPos.shape, dtype="int")
+            theWeight = np.zeros(sPos.shape)
+        leftRows = sOrder[leftIdx]
+        rightRows = sOrder[np.minimum(leftIdx + 1, len(sOrder) - 1)]
+
+        for vN in columnNames:
+            colData = np.asarray(self.getColumn(vN))
+            if colData.dtype.kind not in "fiu":
+                raise ValueError("Column '%s' is not a number and can not be interpolated" % vN)
+            leftData = colData[leftRows].astype("float")
+            theValues[vN] = leftData + theWeight*(colData[rightRows] - leftData)
+
+        return theValues
+
+    def findElementAt(self, sPos):
+        """Return the row indices of the elements that end at or after
+        each of an array of S positions, see interpolateAt.
+        """
+        sOrder, sSorted, sLength = self._getSIndex()
+        sPos = np.asarray(sPos, dtype="float")
+        if sLength is not None:
+            # Past the last element, the next one is the first of the
+            # following turn
+            sPos = np.mod(sPos, sLength)
+            return sOrder[np.searchsorted(sSorted, sPos) % len(sOrder)]
+
+        return sOrder[np.minimum(np.searchsorted(sSorted, sPos), len(sOrder) - 1)]
+
+    def findName(self, elemName):
+        """Return the row index of the first element with a given name.
+        The lookup uses a name index that is built on first use, and is
+        kept valid when the sequence is shifted.
+        """
+        if not self.hasNAME:
+            raise TypeError("This TFS table is not indexed by NAME")
+
+        if self._nameIndex is None:
+            self._buildNameIndex()
+
+        firstRows, dupeRows = self._nameIndex
+        if elemName in dupeRows:
+            return int(np.min((dupeRows[elemName] - self.seqShift) % self.nLines))
+        if elemName in firstRows:
+            return (firstRows[elemName] - self.seqShift) % self.nLines
+
+        raise KeyError("No element named '%s' found" % elemName)
+
+    def findDataMask(self, columnName, searchPattern):
+        """Match a regular expression against the start of each value in
+        a string column, and return a boolean array of the matches. The
+        pattern is only tested once per distinct value, and the result
+        is cached for repeated searches until the data is re-read or
+        shifted.
+        """
+        if columnName not in self._searchCache:
+            if columnName in self.strVocab:
+                uniqVals, uniqInv = self.strVocab[columnName], self.Data[columnName]
+            else:
+                uniqVals, uniqInv = np.unique(
+                    np.asarray(self.Data[columnName]), return_inverse=True
+                )
+            self._searchCache[columnName] = (uniqVals, uniqInv.ravel(), {})
+
+        uniqVals, uniqInv, theMatches = self._searchCache[columnName]
+        if searchPattern not in theMatches:
+            searchRx = re.compile(searchPattern)
+            theMatches[searchPattern] = np.fromiter(
+                (searchRx.match(uVal) is not None for uVal in uniqVals),
+                dtype="bool", count=len(uniqVals)
+            )
+
+        return theMatches[searchPattern][uniqInv]
+
     def findDataIndex(self, columnName, searchPattern):
         """Search a data column for a specific pattern
         """
-        retVal = []
-        for i in range(self.nLines):
-            if re.match(searchPattern, self.Data[columnName][i]):
-                retVal.append(i)
-
-        return retVal
+        return np.flatnonzero(self.findDataMask(columnName, searchPattern)).tolist()
 
     ##
     #  Internal Functions
     ##
 
+    def _readFileFast(self, useCols=None, tfsStats=None, outRecords=None, rowFilter=None):
+        """Read the file with the vectorised parser, into outRecords if
+        given, and keeping only the rows that pass rowFilter if given.
+        """
+        if tfsStats is None:
+            tfsStats = TableStats("readFile", self.fileName)
+        tfsStats.nBytes = os.path.getsize(self.fileName)
+        with openTableFile(self.fileName) as tfsFile:
+            phaseStart = tfsStats.startPhase()
+            self.metaData, self.varNames, self.varTypes, firstLine = readHeader(tfsFile)
+            tfsStats.endPhase("header", phaseStart)
+            tfsLines = timedLines(tfsFile, tfsStats)
+            if firstLine is not None:
+                tfsLines = itertools.chain([firstLine], tfsLines)
+            keptIdx = None
+            if rowFilter is not None:
+                self.Data, keptIdx = parseFilteredLines(
+                    self._trackSegments(tfsLines), self.varNames, self.varTypes, rowFilter,
+                    useCols=useCols, tfsStats=tfsStats
+                )
+            elif outRecords is None:
+                self.Data = parseDataLines(
+                    self._trackSegments(tfsLines), self.varNames, self.varTypes,
+                    useCols=useCols, tfsStats=tfsStats
+                )
+            else:
+                nRows = fillRecords(
+                    self._trackSegments(tfsLines), outRecords, self.varNames, self.varTypes,
+                    tfsStats=tfsStats
+                )
+                useCols = outRecords.dtype.names
+                self._recData = outRecords[:nRows]
+                self.Data = {vN: self._recData[vN] for vN in useCols}
+
+        self._selectVars(useCols)
+        self._updateLines()
+        phaseStart = tfsStats.startPhase()
+        if keptIdx is None:
+            closeSegments(self.segments, self.nLines)
+        else:
+            closeSegments(self.segments, int(keptIdx[-1]) + 1 if len(keptIdx) > 0 else 0)
+            self.segments = filterSegments(self.segments, keptIdx)
+        tfsStats.endPhase("segments", phaseStart)
+        logger.info("%d lines of data read" % self.nLines)
+
+        return
+
+    def _readFileLazy(self, useCols=None, tfsStats=None):
+        """Scan the file for its header, line count and segments, and
+        set up the data columns to be parsed on first access.
+        """
+        if tfsStats is None:
+            tfsStats = TableStats("readFile", self.fileName)
+        tfsStats.nBytes = os.path.getsize(self.fileName)
+        with openTableFile(self.fileName, threaded=False) as tfsFile:
+            phaseStart = tfsStats.startPhase()
+            self.metaData, self.varNames, self.varTypes, firstLine = readHeader(tfsFile)
+            dataPos = tfsFile.tell()
+            tfsStats.endPhase("header", phaseStart)
+            phaseStart = tfsStats.startPhase()
+            if firstLine is not None:
+                tfsLines = itertools.chain([firstLine], timedLines(tfsFile, tfsStats))
+                for tfsLine in self._trackSegments(tfsLines):
+                    if not (tfsLine.startswith("#") or tfsLine.isspace()):
+                        self.nLines += 1
+            tfsStats.endPhase("scan", phaseStart)
+
+        closeSegments(self.segments, self.nLines)
+
+        self._selectVars(useCols)
+
+        fileName = self.fileName
+        fileStat = os.stat(fileName)
+        fileId = (fileStat.st_size, fileStat.st_mtime_ns)
+        varNames = list(self.varNames)
+        varTypes = list(self.varTypes)
+
+        def loadColumns(colNames):
+            fileStat = os.stat(fileName)
+            if (fileStat.st_size, fileStat.st_mtime_ns) != fileId:
+                raise OSError("File '%s' has changed since it was scanned" % fileName)
+            if firstLine is None:
+                return parseDataLines([], varNames, varTypes, useCols=colNames)
+            with openTableFile(fileName, threaded=False) as tfsFile:
+                tfsFile.seek(dataPos)
+                tfsLines = itertools.chain([firstLine], tfsFile)
+                return parseDataLines(tfsLines, varNames, varTypes, useCols=colNames)
+
+        self.Data = LazyColumns(self.varNames, loadColumns)
+        self.hasNAME = "NAME" in self.Data
+        logger.info("%d lines of data found" % self.nLines)
+
+        return
+
+    def _buildNameIndex(self):
+        """Build the name to row index. Names that appear more than once
+        keep a list of all their rows. The rows are stored as they were
+        before any shift of the sequence, see seqShift.
+        """
+        allNames = np.roll(np.asarray(self.getColumn("NAME")), self.seqShift)
+        nameOrder = np.argsort(allNames, kind="stable")
+        uniqNames, groupStarts, nameCounts = np.unique(
+            allNames[nameOrder], return_index=True, return_counts=True
+        )
+        firstRows = dict(zip(uniqNames.tolist(), nameOrder[groupStarts].tolist()))
+        isDupe = nameCounts > 1
+        dupeRows = dict(zip(
+            uniqNames[isDupe].tolist(),
+            [g for g, d in zip(np.split(nameOrder, groupStarts[1:]), isDupe) if d]
+        ))
+        self._nameIndex = (firstRows, dupeRows)
+
+        return
+
+    def _getSIndex(self):
+        """Return the row order that sorts S, the sorted S values, and
+        the sequence length if known. The index is cached.
+        """
+        if self._sIndex is None:
+            if "S" not in self.Data:
+                raise KeyError("No column named 'S' found")
+            sData = self.Data["S"]
+            if not (isinstance(sData, np.ndarray) and sData.dtype.kind == "f"):
+                raise ValueError("S column is not a number. Please run convertToNumpy().")
+            if len(sData) == 0:
+                raise ValueError("The table has no rows")
+
+            sOrder = np.argsort(sData, kind="stable")
+            sLength = self.metaData.get("LENGTH")
+            self._sIndex = (
+                sOrder, sData[sOrder].astype("float"),
+                float(sLength) if sLength else None
+            )
+
+        return self._sIndex
+
+    @staticmethod
+    def _appendBuffer(theBuffers, vN, newData, nRows):
+        """Append data to the growth buffer of a column after its first
+        nRows rows, and return a view of the filled part. The buffer is
+        reallocated with at least double the size when it is full, or
+        with a wider type if a new string does not fit.
+        """
+        theBuffer = theBuffers.get(vN)
+        nTotal = nRows + len(newData)
+        if theBuffer is None:
+            theBuffer = np.empty(max(nTotal, 1024), dtype=newData.dtype)
+        elif nTotal > len(theBuffer) or np.result_type(theBuffer, newData) != theBuffer.dtype:
+            newBuffer = np.empty(
+                max(nTotal, 2*len(theBuffer)), dtype=np.result_type(theBuffer, newData)
+            )
+            newBuffer[:nRows] = theBuffer[:nRows]
+            theBuffer = newBuffer
+        theBuffer[nRows:nTotal] = newData
+        theBuffers[vN] = theBuffer
+
+        return theBuffer[:nTotal]
+
+    @staticmethod
+    def _rotateArray(theArray, idx):
+        """Rotate a 1D array in place such that element idx becomes the
+        first. Only the shorter of the two parts is buffered.
+        """
+        nRows = len(theArray)
+        if idx == 0:
+            return
+        if idx <= nRows - idx:
+            tmpData = theArray[:idx].copy()
+            theArray[:nRows-idx] = theArray[idx:]
+            theArray[nRows-idx:] = tmpData
+        else:
+            tmpData = theArray[idx:].copy()
+            theArray[nRows-idx:] = theArray[:idx]
+            theArray[:nRows-idx] = tmpData
+
+        return
+
+    def _compactData(self, floatCols, intCols):
+        """Dictionary encode string columns and narrow numeric columns.
+        """
+        if floatCols is True:
+            floatCols = [vN for vN, vT in zip(self.varNames, self.varTypes) if vT.endswith("le")]
+        if intCols is None:
+            intCols = self.INT_COLUMNS
+
+        for vN, vT in zip(self.varNames, self.varTypes):
+            colData = self.Data[vN]
+            if not isinstance(colData, np.ndarray):
+                continue
+
+            if colData.dtype.kind == "U" and vN not in self.strVocab:
+                strVocab, strCodes = np.unique(colData, return_inverse=True)
+                if len(strVocab) <= self.VOCAB_FRACTION*len(colData):
+                    self.strVocab[vN] = strVocab
+                    self.Data[vN] = strCodes.ravel().astype(np.min_scalar_type(len(strVocab)))
+            elif colData.dtype.kind == "i":
+                self.Data[vN] = self._narrowInt(colData)
+            elif colData.dtype.kind == "f":
+                if vN in intCols and np.all(np.mod(colData, 1.0) == 0.0):
+                    self.Data[vN] = self._narrowInt(colData)
+                elif floatCols is not None and vN in floatCols:
+                    self.Data[vN] = colData.astype("float32")
+
+        self._searchCache = {}
+        self._sIndex = None
+
+        return
+
+    def _decodeRows(self, columnName, rowStart, rowEnd):
+        """Return a range of rows of a column, decoded if needed.
+        """
+        if columnName in self.strVocab:
+            return self.strVocab[columnName][self.Data[columnName][rowStart:rowEnd]]
+        return self.Data[columnName][rowStart:rowEnd]
+
+    @staticmethod
+    def _narrowInt(colData):
+        """Convert a column to the smallest integer type for its range.
+        """
+        minVal = int(colData.min()) if len(colData) > 0 else 0
+        maxVal = int(colData.max()) if len(colData) > 0 else 0
+        for theType in ("int8", "int16", "int32"):
+            if np.iinfo(theType).min <= minVal and maxVal <= np.iinfo(theType).max:
+                return colData.astype(theType)
+        return colData.astype("int64")
+
+    def _emitStats(self, tfsStats, nRows=None):
+        """Finish the statistics of an operation, log them, and pass
+        them to the hook. The number of rows defaults to all rows.
+        """
+        tfsStats.nRows = self.nLines if nRows is None else nRows
+        tfsStats.updateColBytes(self.Data)
+        tfsStats.finish()
+        self.stats = tfsStats
+        logger.debug(str(tfsStats))
+        if self.statsHook is not None:
+            self.statsHook(tfsStats)
+
+        return
+
+    def _readLastTurn(self):
+        """Return the turn of the last data row of the file, or None if
+        it has no data rows. Only the TURN column is parsed, in chunks.
+        """
+        lastTurn = None
+        with openTableFile(self.fileName) as tfsFile:
+            _, varNames, varTypes, firstLine = readHeader(tfsFile)
+            if "TURN" not in varNames:
+                raise KeyError("No column named 'TURN' found")
+            if firstLine is not None:
+                for colData in iterDataChunks(
+                    itertools.chain([firstLine], tfsFile), varNames, varTypes, 100000,
+                    useCols=["TURN"]
+                ):
+                    lastTurn = int(colData["TURN"][-1])
+
+        return lastTurn
+
+    def _loadLazy(self, columnNames=None):
+        """Load the columns of a lazy table in a single scan before they
+        are accessed one at a time. All columns are loaded if
+        columnNames is None.
+        """
+        if isinstance(self.Data, LazyColumns):
+            self.Data.materialize(columnNames)
+
+        return
+
+    def _selectVars(self, useCols):
+        """Keep only the columns in useCols in the variable lists, in
+        the order of the file, and in the data if it has been read.
+        Unknown column names raise a KeyError.
+        """
+        if useCols is None:
+            return
+
+        colIdx = selectColumns(self.varNames, useCols)
+        self.varNames = [self.varNames[i] for i in colIdx]
+        self.varTypes = [self.varTypes[i] for i in colIdx]
+        self.Data = {vN: self.Data[vN] for vN in self.varNames if vN in self.Data}
+
+        return
+
+    def _selectNames(self, columnNames):
+        """Return the list of column names to export.
+        """
+        if columnNames is None:
+            return list(self.varNames)
+
+        colNames = list(columnNames)
+        for vN in colNames:
+            if vN not in self.varNames:
+                raise KeyError("No column named '%s' found" % vN)
+
+        return colNames
+
+    @staticmethod
+    def _isRecordField(colData, recData, vN):
+        """Check if a column is the field vN of a record array.
+        """
+        if not isinstance(colData, np.ndarray):
+            return False
+
+        recField = recData[vN]
+        colLayout = (colData.__array_interface__["data"][0], colData.strides, colData.dtype)
+        recLayout = (recField.__array_interface__["data"][0], recField.strides, recField.dtype)
+        return colData.shape == recField.shape and colLayout == recLayout
+
+    def _trackSegments(self, tfsLines):
+        """Wrap data lines to record '#segment' lines in self.segments.
+        """
+        turnCol = self.varNames.index("TURN") if "TURN" in self.varNames else None
+        return trackSegments(tfsLines, self.segments, turnCol=turnCol)
+
+    def _updateLines(self):
+        """Update the line count and NAME flag from typed data arrays.
+        """
+        self.nLines = len(self.Data[self.varNames[0]]) if self.varNames else 0
+        self.hasNAME = "NAME" in self.Data
+
+        return
+
     def _stripQuotes(self, sVar):
         """Remove wrapping quotes from string.
         """
-        if (sVar[0] == sVar[-1]) and sVar.startswith(("'", '"')):
-            return sVar[1:-1]
-
-        return sVar
+        return stripQuotes(sVar)
 
 ## End Class TableFS
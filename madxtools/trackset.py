@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Tracking File Sets
+==============================
+Parallel loading of per observation point and particle tracking files
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import glob
+import logging
+import itertools
+
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .fileio import openTableFile
+from .header import readHeader
+from .parser import parseDataLines
+
+logger = logging.getLogger(__name__)
+
+TRACK_FILE_RX = re.compile(r"\.obs(\d+)\.p(\d+)$")
+
+# Metadata written separately for each file, which is not compared
+FILE_META_KEYS = ("NAME", "DATE", "TIME")
+
+class TrackSet:
+    """Tracking data from the files written by MAD-X TRACK with
+    onetable=false, stacked into arrays of shape (observation point,
+    particle, row). Rows beyond the length of each file are padded, see
+    nRows and getMask.
+    """
+
+    def __init__(self):
+
+        self.fileNames   = []
+        self.metaData    = {}
+        self.varNames    = []
+        self.varTypes    = []
+        self.obsNumbers  = np.zeros(0, dtype="int")
+        self.partNumbers = np.zeros(0, dtype="int")
+        self.nRows       = np.zeros((0, 0), dtype="int")
+        self.Data        = {}
+
+        return
+
+    def getMask(self):
+        """Return a boolean array that is True for the rows that exist
+        in the source files.
+        """
+        maxRows = self.nRows.max(initial=0)
+        return np.arange(maxRows) < self.nRows[:, :, np.newaxis]
+
+    def getTrack(self, obsNumber, partNumber):
+        """Return the data of a single observation point and particle
+        as a dictionary of array views.
+        """
+        iObs = np.searchsorted(self.obsNumbers, obsNumber)
+        iPart = np.searchsorted(self.partNumbers, partNumber)
+        if iObs >= len(self.obsNumbers) or self.obsNumbers[iObs] != obsNumber:
+            raise KeyError("No observation point number %d found" % obsNumber)
+        if iPart >= len(self.partNumbers) or self.partNumbers[iPart] != partNumber:
+            raise KeyError("No particle number %d found" % partNumber)
+
+        nRows = self.nRows[iObs, iPart]
+        return {vN: self.Data[vN][iObs, iPart, :nRows] for vN in self.varNames}
+
+## End Class TrackSet
+
+def loadTrackSet(filePaths, nWorkers=None, ignoreMeta=FILE_META_KEYS):
+    """Load a set of tracking files into a TrackSet. The files can be
+    given as a list, a glob pattern, or a folder which is searched for
+    files ending with .obsNNNN.pNNNN. The files are parsed in a pool of
+    nWorkers processes, which defaults to the number of CPUs. With
+    nWorkers=1, the files are parsed in the calling process.
+
+    The metadata of all files must be identical, as must the columns.
+    The keys in ignoreMeta, which by default are those MAD-X writes for
+    each file, are not compared and are left out of the metadata of the
+    set.
+    """
+    if isinstance(filePaths, str):
+        if os.path.isdir(filePaths):
+            filePaths = glob.glob(os.path.join(filePaths, "*.obs*.p*"))
+        else:
+            filePaths = glob.glob(filePaths)
+
+    fileIndex = {}
+    for filePath in filePaths:
+        fileMatch = TRACK_FILE_RX.search(filePath)
+        if fileMatch is None:
+            logger.debug("Skipping file '%s'" % filePath)
+            continue
+        fileIndex[(int(fileMatch.group(1)), int(fileMatch.group(2)))] = filePath
+
+    if not fileIndex:
+        raise ValueError("No tracking files found")
+
+    trackSet = TrackSet()
+    trackSet.obsNumbers = np.array(sorted(set(k[0] for k in fileIndex)), dtype="int")
+    trackSet.partNumbers = np.array(sorted(set(k[1] for k in fileIndex)), dtype="int")
+    trackSet.nRows = np.zeros((len(trackSet.obsNumbers), len(trackSet.partNumbers)), dtype="int")
+
+    fileKeys = sorted(fileIndex)
+    trackSet.fileNames = [fileIndex[k] for k in fileKeys]
+    if nWorkers is None:
+        nWorkers = os.cpu_count() or 1
+    if nWorkers == 1:
+        tableList = [_loadTrackFile(fileName) for fileName in trackSet.fileNames]
+    else:
+        chunkSize = max(1, len(fileKeys)//(4*nWorkers))
+        with ProcessPoolExecutor(max_workers=nWorkers) as executor:
+            tableList = list(executor.map(_loadTrackFile, trackSet.fileNames, chunksize=chunkSize))
+
+    # Check the shared metadata against the first file
+    metaData, varNames, varTypes, _ = tableList[0]
+    trackSet.metaData = {k: v for k, v in metaData.items() if k not in ignoreMeta}
+    trackSet.varNames = varNames
+    trackSet.varTypes = varTypes
+    for fileName, (metaData, varNames, varTypes, _) in zip(trackSet.fileNames, tableList):
+        metaData = {k: v for k, v in metaData.items() if k not in ignoreMeta}
+        if metaData != trackSet.metaData:
+            raise ValueError("Metadata of file '%s' differs from the set" % fileName)
+        if varNames != trackSet.varNames or varTypes != trackSet.varTypes:
+            raise ValueError("Columns of file '%s' differ from the set" % fileName)
+
+    # Stack the columns
+    maxRows = max(len(colData[trackSet.varNames[0]]) for _, _, _, colData in tableList)
+    theShape = trackSet.nRows.shape + (maxRows,)
+    for vN in trackSet.varNames:
+        vType = np.result_type(*[colData[vN].dtype for _, _, _, colData in tableList])
+        if vType.kind == "f":
+            trackSet.Data[vN] = np.full(theShape, np.nan, dtype=vType)
+        else:
+            trackSet.Data[vN] = np.zeros(theShape, dtype=vType)
+
+    iObs = np.searchsorted(trackSet.obsNumbers, [k[0] for k in fileKeys])
+    iPart = np.searchsorted(trackSet.partNumbers, [k[1] for k in fileKeys])
+    for i, j, (_, _, _, colData) in zip(iObs, iPart, tableList):
+        nRows = len(colData[trackSet.varNames[0]])
+        trackSet.nRows[i, j] = nRows
+        for vN in trackSet.varNames:
+            trackSet.Data[vN][i, j, :nRows] = colData[vN]
+
+    logger.info("Loaded %d tracking files" % len(fileKeys))
+
+    return trackSet
+
+##
+#  Internal Functions
+##
+
+def _loadTrackFile(fileName):
+    """Parse a single tracking file. This runs in the worker processes.
+    """
+    with openTableFile(fileName) as tfsFile:
+        metaData, varNames, varTypes, firstLine = readHeader(tfsFile)
+        tfsLines = tfsFile if firstLine is None else itertools.chain([firstLine], tfsFile)
+        colData = parseDataLines(tfsLines, varNames, varTypes)
+
+    return metaData, varNames, varTypes, colData
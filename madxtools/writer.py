@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : TFS File Writer
+===========================
+Writes TFS files from NumPy columns
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import logging
+import functools
+import fractions
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class TFSWriter:
+    """Writes a TFS file in blocks of rows. The metadata and column
+    header are written when the file is opened, and each call to
+    writeChunk appends a dictionary of columns. The columns are
+    formatted with vectorised NumPy operations into a byte buffer for
+    the whole block, rather than row by row. Floats are written in
+    scientific notation with sigDigits significant digits, and string
+    columns are padded to the width in strWidths, if given. Instead of
+    a file name, an open binary file object can be given, which is then
+    not closed by the writer.
+    """
+
+    INT_WIDTH = 12
+    STR_WIDTH = 18
+
+    def __init__(self, fileName, metaData, varNames, varTypes, strWidths=None, sigDigits=15):
+
+        self.fileName  = fileName
+        self.varNames  = list(varNames)
+        self.varTypes  = list(varTypes)
+        self.sigDigits = sigDigits
+        self.nLines    = 0
+
+        if len(self.varNames) != len(self.varTypes):
+            raise IndexError("Mismatch between variable names and types")
+        if not 1 <= sigDigits <= 15:
+            raise ValueError("The number of significant digits must be between 1 and 15")
+
+        self._colWidths = []
+        headFmts = []
+        strWidths = strWidths or {}
+        for vN, vT in zip(self.varNames, self.varTypes):
+            if vT.endswith("d"):
+                colWidth = max(self.INT_WIDTH, len(vN))
+                headFmts.append("%%%ds" % colWidth)
+            elif vT.endswith("le"):
+                colWidth = max(sigDigits + 8, len(vN))
+                headFmts.append("%%%ds" % colWidth)
+            else:
+                colWidth = max(strWidths.get(vN, self.STR_WIDTH), len(vN))
+                headFmts.append("%%-%ds" % colWidth)
+            self._colWidths.append(colWidth)
+
+        self._ownFile = not hasattr(fileName, "write")
+        self._outFile = open(fileName, mode="wb") if self._ownFile else fileName
+        try:
+            self._writeHeader(metaData, " ".join(headFmts))
+        except Exception:
+            self.close()
+            raise
+
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTrace):
+        self.close()
+        return False
+
+    def writeChunk(self, colData, insertLines=None):
+        """Append a block of rows given as a dictionary of columns. The
+        optional insertLines is a list of (row, text) tuples of lines,
+        like '#segment' lines, to insert before a row of the block.
+        """
+        allFields = []
+        nRows = None
+        for vN, vT, colWidth in zip(self.varNames, self.varTypes, self._colWidths):
+            if vT.endswith("d"):
+                colField = formatIntColumn(np.asarray(colData[vN], dtype="int"))
+            elif vT.endswith("le"):
+                colField = formatFloatColumn(
+                    np.asarray(colData[vN], dtype="float"), self.sigDigits
+                )
+            else:
+                colField = formatStrColumn(
+                    np.asarray(colData[vN], dtype="str"), quoted=vT.endswith("s")
+                )
+
+            if nRows is None:
+                nRows = colField.shape[0]
+            elif colField.shape[0] != nRows:
+                raise IndexError("Mismatch between column lengths")
+            allFields.append((colField, colWidth, not vT.endswith(("d", "le"))))
+
+        if not nRows:
+            for _, theText in insertLines or []:
+                self._writeText(theText)
+            return
+
+        rowWidth = sum(max(f.shape[1], w) + 1 for f, w, _ in allFields) + 2
+        rowBuffer = np.full((nRows, rowWidth), ord(" "), dtype="uint8")
+        rowBuffer[:, -1] = ord("\n")
+        colPos = 2
+        for colField, colWidth, leftAlign in allFields:
+            fieldWidth = max(colField.shape[1], colWidth)
+            if leftAlign:
+                rowBuffer[:, colPos:colPos+colField.shape[1]] = colField
+            else:
+                rowBuffer[:, colPos+fieldWidth-colField.shape[1]:colPos+fieldWidth] = colField
+            colPos += fieldWidth + 1
+
+        rowBytes = memoryview(rowBuffer.reshape(-1))
+        prevRow = 0
+        for theRow, theText in insertLines or []:
+            self._outFile.write(rowBytes[prevRow*rowWidth:theRow*rowWidth])
+            self._writeText(theText)
+            prevRow = theRow
+        self._outFile.write(rowBytes[prevRow*rowWidth:])
+        self.nLines += nRows
+
+        return
+
+    def writeSegment(self, theSeg):
+        """Write a '#segment' line of a trackone file, given as a
+        dictionary like the ones in TableFS.segments.
+        """
+        self._writeText(segmentLine(theSeg))
+        return
+
+    def close(self):
+        """Close the file, or flush it if it was opened by the caller.
+        """
+        if self._ownFile and not self._outFile.closed:
+            self._outFile.close()
+            logger.info("%d lines of data written" % self.nLines)
+        elif not self._ownFile:
+            self._outFile.flush()
+
+        return
+
+    ##
+    #  Internal Functions
+    ##
+
+    def _writeText(self, theText):
+        """Write a line of text to the binary file.
+        """
+        self._outFile.write(theText.encode("utf-8"))
+        return
+
+    def _writeHeader(self, metaData, headFmt):
+        """Write the metadata and the column name and type lines.
+        """
+        for mName, mValue in metaData.items():
+            if isinstance(mValue, (bool, np.bool_)):
+                mValue = int(mValue)
+            if isinstance(mValue, (int, np.integer)):
+                self._writeText("@ %-16s %-5s %d\n" % (mName, "%d", mValue))
+            elif isinstance(mValue, (float, np.floating)):
+                self._writeText("@ %-16s %-5s %r\n" % (mName, "%le", float(mValue)))
+            else:
+                mValue = str(mValue)
+                mType = "%%%02ds" % len(mValue)
+                self._writeText('@ %-16s %-5s "%s"\n' % (mName, mType, mValue))
+
+        self._writeText("* " + headFmt % tuple(self.varNames) + "\n")
+        self._writeText("$ " + headFmt % tuple(self.varTypes) + "\n")
+
+        return
+
+## End Class TFSWriter
+
+def segmentLine(theSeg):
+    """Format a '#segment' line from a segment dictionary.
+    """
+    return "#segment %7d %7d %7d %7d %s\n" % (
+        theSeg["segment"], theSeg["nSegments"], theSeg["nPart"], theSeg["elemIndex"],
+        theSeg["elemName"]
+    )
+
+def formatIntColumn(intData):
+    """Format an integer array as a (rows, width) array of ASCII bytes,
+    right aligned.
+    """
+    nRows = len(intData)
+    absData = np.abs(intData.astype("int64")).astype("uint64")
+    nDigits = len(str(int(absData.max(initial=0))))
+
+    theField = np.empty((nRows, nDigits + 1), dtype="uint8")
+    theField[:, 0] = ord(" ")
+    theField[:, 1:] = _digitBytes(absData, nDigits)
+
+    # Blank the leading zeros, and put the sign in front of the number
+    isLead = np.cumsum(theField[:, 1:] != ord("0"), axis=1) == 0
+    isLead[:, -1] = False
+    theField[:, 1:][isLead] = ord(" ")
+    isNeg = intData < 0
+    theField[np.flatnonzero(isNeg), isLead[isNeg].sum(axis=1)] = ord("-")
+
+    return theField
+
+def formatFloatColumn(floatData, sigDigits):
+    """Format a float array in scientific notation with sigDigits
+    significant digits as a (rows, width) array of ASCII bytes. The
+    mantissa is rounded from the exact product of each value and a
+    power of ten, so the output is the same as Python's '%e' format.
+    Values that can not be scaled safely, like NaN, infinity and very
+    large or small values, and values too close to halfway between two
+    mantissas to decide, are formatted by Python.
+    """
+    nRows = len(floatData)
+    absData = np.abs(floatData)
+    isSafe = np.isfinite(floatData) & ((absData > 1e-280) & (absData < 1e280) | (absData == 0.0))
+
+    theExp = np.zeros(nRows, dtype="int")
+    isNonZero = isSafe & (absData > 0.0)
+    theExp[isNonZero] = np.floor(np.log10(absData[isNonZero]))
+
+    # The integer mantissa, corrected for rounding in log10
+    theMant = np.zeros(nRows, dtype="uint64")
+    isTie = np.zeros(nRows, dtype=bool)
+    theMant[isNonZero], isTie[isNonZero] = _scaleRound(
+        absData[isNonZero], sigDigits - 1 - theExp[isNonZero]
+    )
+    isOver = theMant >= 10**sigDigits
+    isUnder = isNonZero & (theMant < 10**(sigDigits - 1))
+    theExp[isOver] += 1
+    theExp[isUnder] -= 1
+    isFix = isOver | isUnder
+    theMant[isFix], isTie[isFix] = _scaleRound(absData[isFix], sigDigits - 1 - theExp[isFix])
+    isSafe &= ~isTie
+
+    expDigits = 3 if np.abs(theExp).max(initial=0) >= 100 else 2
+    mantField = _digitBytes(theMant, sigDigits)
+
+    fieldWidth = sigDigits + expDigits + (4 if sigDigits > 1 else 3)
+    theField = np.empty((nRows, fieldWidth), dtype="uint8")
+    theField[:, 0] = np.where(np.signbit(floatData), ord("-"), ord(" "))
+    theField[:, 1] = mantField[:, 0]
+    if sigDigits > 1:
+        theField[:, 2] = ord(".")
+        theField[:, 3:sigDigits+2] = mantField[:, 1:]
+    expPos = fieldWidth - expDigits - 2
+    theField[:, expPos] = ord("e")
+    theField[:, expPos+1] = np.where(theExp < 0, ord("-"), ord("+"))
+    theField[:, expPos+2:] = _digitBytes(np.abs(theExp).astype("uint64"), expDigits)
+
+    if np.all(isSafe):
+        return theField
+
+    otherRows = np.flatnonzero(~isSafe)
+    otherValues = [("%%.%de" % (sigDigits - 1)) % floatData[i] for i in otherRows]
+    otherValues = [_padExponent(theValue, expDigits) for theValue in otherValues]
+    fullWidth = max(fieldWidth, max(len(theValue) for theValue in otherValues))
+    if fullWidth > fieldWidth:
+        theField = np.hstack([
+            np.full((nRows, fullWidth - fieldWidth), ord(" "), dtype="uint8"), theField
+        ])
+    for i, theValue in zip(otherRows, otherValues):
+        theField[i] = np.frombuffer(theValue.rjust(fullWidth).encode(), "uint8")
+
+    return theField
+
+def formatStrColumn(strData, quoted=True):
+    """Format a string array as a (rows, width) array of UTF-8 bytes,
+    left aligned, and optionally wrapped in double quotes.
+    """
+    nRows = len(strData)
+    nChars = max(strData.dtype.itemsize//4, 1)
+    codePoints = np.ascontiguousarray(strData, dtype="U%d" % nChars).view("uint32")
+    codePoints = codePoints.reshape(nRows, nChars)
+    if codePoints.max(initial=0) >= 128:
+        byteData = np.char.encode(strData, "utf-8")
+        nChars = max(byteData.dtype.itemsize, 1)
+        charData = byteData.astype("S%d" % nChars).view("uint8").reshape(nRows, nChars)
+    else:
+        charData = codePoints.astype("uint8")
+
+    if quoted:
+        theField = np.zeros((nRows, nChars + 2), dtype="uint8")
+        theField[:, 0] = ord('"')
+        theField[:, 1:-1] = charData
+        theField[np.arange(nRows), (charData != 0).sum(axis=1) + 1] = ord('"')
+    else:
+        theField = charData.copy()
+    theField[theField == 0] = ord(" ")
+
+    return theField
+
+##
+#  Internal Functions
+##
+
+_DIGITS4 = np.array([list(b"%04d" % i) for i in range(10000)], dtype="uint8").view("uint32")
+
+def _padExponent(theValue, expDigits):
+    """Pad the exponent of a number formatted by Python to expDigits.
+    """
+    if "e" not in theValue:
+        return theValue
+
+    theMant, theExp = theValue.split("e")
+    return "%se%s%0*d" % (theMant, theExp[0], expDigits, abs(int(theExp)))
+
+def _scaleRound(absData, thePow):
+    """Round absData times ten to the power thePow to the nearest
+    integer, for results below 2**53. The product is computed as the
+    exact sum of two floats, so the rounding is the same as for the
+    exact decimal value. Returns the integers, and a mask of the values
+    that are too close to halfway between two integers to decide.
+    """
+    uniqPows, powIdx = np.unique(thePow, return_inverse=True)
+    powPairs = np.array([_pow10Pair(uPow) for uPow in uniqPows.tolist()]).reshape(-1, 2)
+    powHi = powPairs[powIdx, 0]
+    powLo = powPairs[powIdx, 1]
+
+    prodHi, prodLo = _twoProduct(absData, powHi)
+    prodLo += absData*powLo
+    intPart = np.floor(prodHi)
+    fracPart = (prodHi - intPart) + prodLo
+    roundUp = np.floor(fracPart + 0.5)
+    isTie = np.abs(fracPart - roundUp + 0.5) < 1e-9
+
+    return (intPart + roundUp).astype("uint64"), isTie
+
+def _twoProduct(aData, bData):
+    """Compute the product of two float arrays as the exact sum of a
+    rounded product and its error, by Dekker's algorithm.
+    """
+    theProd = aData*bData
+    aHi, aLo = _splitFloat(aData)
+    bHi, bLo = _splitFloat(bData)
+    theErr = ((aHi*bHi - theProd) + aHi*bLo + aLo*bHi) + aLo*bLo
+
+    return theProd, theErr
+
+def _splitFloat(theData):
+    """Split floats into a high and a low part of 26 bits each.
+    """
+    theScaled = 134217729.0*theData
+    theHi = theScaled - (theScaled - theData)
+
+    return theHi, theData - theHi
+
+@functools.lru_cache(maxsize=None)
+def _pow10Pair(thePow):
+    """Return ten to the power thePow as the sum of a correctly rounded
+    float and a float of the remainder.
+    """
+    exactPow = fractions.Fraction(10)**thePow
+    powHi = float(exactPow)
+
+    return powHi, float(exactPow - fractions.Fraction(powHi))
+
+def _digitBytes(uintData, nDigits):
+    """Convert an array of unsigned integers to a (rows, nDigits) array
+    of zero padded ASCII digits, four digits at a time.
+    """
+    nGroups = -(-nDigits // 4)
+    theDigits = np.empty((len(uintData), nGroups), dtype="uint32")
+    for i in range(nGroups - 1, -1, -1):
+        theDigits[:, i] = _DIGITS4[uintData % 10000, 0]
+        uintData = uintData // 10000
+
+    return theDigits.view("uint8")[:, 4*nGroups-nDigits:]
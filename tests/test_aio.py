@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Asyncio Loading Tests
+=================================
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import asyncio
+import threading
+import pytest
+import numpy
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from madxtools import TableFS, TableLoader, gatherTables
+
+@pytest.mark.aio
+def testAio_Read(filesDir):
+    """Check loading tables from asyncio code.
+    """
+    twissFile = os.path.join(filesDir, "fodothin_90.tfs")
+    trackFile = os.path.join(filesDir, "particles.one")
+    refObj = TableFS(trackFile, fastParse=True)
+
+    async def readTables():
+        twissObj = await TableFS.aread(twissFile)
+        allTables = await gatherTables([trackFile, twissFile], fastParse=True)
+        return twissObj, allTables
+
+    twissObj, allTables = asyncio.run(readTables())
+    assert twissObj.Data["NAME"] == TableFS(twissFile).Data["NAME"]
+    assert [t.fileName for t in allTables] == [trackFile, twissFile]
+    assert numpy.array_equal(allTables[0].Data["X"], refObj.Data["X"])
+    assert allTables[1].metaData["SEQUENCE"] == "FODOTHIN"
+
+    # Errors
+    async def readMissing(returnExceptions):
+        async with TableLoader(maxConcurrent=2) as theLoader:
+            return await theLoader.gather(
+                [twissFile, os.path.join(filesDir, "missing.tfs")],
+                returnExceptions=returnExceptions
+            )
+
+    allTables = asyncio.run(readMissing(True))
+    assert isinstance(allTables[0], TableFS)
+    assert isinstance(allTables[1], OSError)
+    with pytest.raises(OSError):
+        asyncio.run(readMissing(False))
+
+    with pytest.raises(ValueError):
+        TableLoader(maxConcurrent=0)
+
+    # Process executor
+    async def readProcess():
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            theLoader = TableLoader(maxConcurrent=2, executor=executor)
+            return await TableFS.aread(trackFile, loader=theLoader, fastParse=True)
+
+    tfsObj = asyncio.run(readProcess())
+    assert numpy.array_equal(tfsObj.Data["PX"], refObj.Data["PX"])
+
+# END Test testAio_Read
+
+@pytest.mark.aio
+def testAio_Limit(filesDir):
+    """Check the concurrency limit and cancellation.
+    """
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    nRunning = [0, 0]
+    runLock = threading.Lock()
+    isFull = threading.Event()
+
+    # The executor has more threads than the limit, so only the loader
+    # keeps the number of loads in flight down. Loads are counted from
+    # submission until their future is done, and each load waits in
+    # the hook until the limit is reached, so that the loads overlap.
+    class CountingExecutor(ThreadPoolExecutor):
+        def submit(self, *subArgs, **subKwargs):
+            with runLock:
+                nRunning[0] += 1
+                nRunning[1] = max(nRunning[0], nRunning[1])
+            theFuture = super().submit(*subArgs, **subKwargs)
+            theFuture.add_done_callback(loadDone)
+            return theFuture
+
+    def loadDone(theFuture):
+        with runLock:
+            nRunning[0] -= 1
+
+    def countHook(tfsStats):
+        with runLock:
+            if nRunning[0] >= 2:
+                isFull.set()
+        isFull.wait(timeout=10.0)
+
+    async def readLimited(maxConcurrent):
+        with CountingExecutor(max_workers=6) as theExecutor:
+            async with TableLoader(maxConcurrent, executor=theExecutor) as theLoader:
+                return await theLoader.gather([testFile]*6, statsHook=countHook)
+
+    assert len(asyncio.run(readLimited(2))) == 6
+    assert isFull.is_set()
+    assert nRunning == [0, 2]
+
+    # Loads that have not started are cancelled with the task
+    nLoaded = []
+    isStarted = threading.Event()
+    isReleased = threading.Event()
+
+    def blockHook(tfsStats):
+        nLoaded.append(tfsStats)
+        isStarted.set()
+        isReleased.wait(timeout=10.0)
+
+    async def readCancelled():
+        async with TableLoader(maxConcurrent=1) as theLoader:
+            theTask = asyncio.ensure_future(
+                theLoader.gather([testFile]*10, statsHook=blockHook)
+            )
+            await asyncio.get_running_loop().run_in_executor(None, isStarted.wait, 10.0)
+            theTask.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await theTask
+            isReleased.set()
+
+            # The loader is still usable after a cancellation
+            return await theLoader.read(testFile, statsHook=blockHook)
+
+    assert isinstance(asyncio.run(readCancelled()), TableFS)
+    assert len(nLoaded) == 2
+
+# END Test testAio_Limit
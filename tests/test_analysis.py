@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Analysis Tests
+==========================
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import pytest
+import numpy
+
+from madxtools import TableFS, fftTunes, groupTurns, naffTunes, trackTensor, trackTunes
+
+def _writeTuneFile(filesDir, outFile, theTunes, nTurns, lostPart, lostTurn):
+    """Write a trackone file of particles oscillating at the given
+    tunes, with one particle lost after lostTurn.
+    """
+    with open(os.path.join(filesDir, "particles.one")) as inFile:
+        headLines = []
+        for theLine in inFile:
+            headLines.append(theLine)
+            if theLine.startswith("$"):
+                break
+
+    nPart = len(theTunes)
+    with open(outFile, mode="w") as tfsFile:
+        tfsFile.writelines(headLines)
+        for iTurn in range(nTurns):
+            partNums = [p for p in range(1, nPart+1) if p != lostPart or iTurn <= lostTurn]
+            tfsFile.write("#segment %7d %7d %7d %7d start\n" % (
+                iTurn + 1, nTurns, len(partNums), 0
+            ))
+            for p in partNums:
+                xPos = 1e-3*numpy.cos(2*numpy.pi*theTunes[p-1]*iTurn + 0.1*p)
+                yPos = 1e-3*numpy.cos(2*numpy.pi*theTunes[::-1][p-1]*iTurn)
+                tfsFile.write("%19d %18d" % (p, iTurn) + " %18.12e"*8 % (
+                    xPos, 0.0, yPos, 0.0, 0.0, 0.0, 0.0, 0.0
+                ) + "\n")
+
+    return
+
+@pytest.mark.analysis
+def testAnalysis_GroupTurns(tmpDir, filesDir):
+    """Regroup tracking data by particle and turn.
+    """
+    tuneFile = os.path.join(tmpDir, "tunes.one")
+    theTunes = [0.11, 0.23, 0.31, 0.42]
+    _writeTuneFile(filesDir, tuneFile, theTunes, 50, 3, 19)
+
+    tfsObj = TableFS(tuneFile, fastParse=True)
+    partNumbers, turnNumbers, turnData = groupTurns(tfsObj, ["X", "Y"])
+    assert numpy.array_equal(partNumbers, [1, 2, 3, 4])
+    assert numpy.array_equal(turnNumbers, numpy.arange(50))
+    assert turnData["X"].shape == (4, 50)
+    assert numpy.isnan(turnData["X"][2, 20:]).all()
+    assert not numpy.isnan(turnData["X"][2, :20]).any()
+    assert turnData["X"][1, 7] == tfsObj.Data["X"][7*4 + 1]
+
+    # Several observation points
+    tfsObj = TableFS(os.path.join(filesDir, "particles.one"), fastParse=True)
+    with pytest.raises(ValueError):
+        groupTurns(tfsObj, "X")
+    partNumbers, turnNumbers, turnData = groupTurns(tfsObj, "X", obsNumber=2)
+    assert numpy.array_equal(partNumbers, numpy.arange(1, 11))
+    assert numpy.array_equal(turnNumbers, [1])
+    assert numpy.array_equal(turnData["X"][:, 0], tfsObj.getObservation(2)["X"])
+
+    with pytest.raises(KeyError):
+        groupTurns(tfsObj, "Q", obsNumber=1)
+
+# END Test testAnalysis_GroupTurns
+
+@pytest.mark.analysis
+def testAnalysis_Tunes(tmpDir, filesDir):
+    """Compute batched FFT and NAFF tunes.
+    """
+    theRng = numpy.random.default_rng(42)
+    refTunes = theRng.uniform(0.05, 0.45, 50)
+    turnIdx = numpy.arange(1000)
+    thePhase = 2*numpy.pi*numpy.outer(refTunes, turnIdx) + theRng.uniform(0.0, 6.0, (50, 1))
+    turnData = numpy.cos(thePhase) + 0.05*theRng.standard_normal((50, 1000))
+
+    fftResult = fftTunes(turnData)
+    naffResult = naffTunes(turnData)
+    assert numpy.abs(fftResult - refTunes).max() < 1e-3
+    assert numpy.abs(naffResult - refTunes).max() < 1e-4
+    assert numpy.abs(naffResult - refTunes).mean() < numpy.abs(fftResult - refTunes).mean()
+
+    # Chunking gives the same result
+    assert numpy.allclose(naffTunes(turnData, chunkSize=7), naffResult, rtol=0.0, atol=1e-14)
+
+    # Complex signal and NaN rows
+    turnData = numpy.exp(-1j*thePhase)
+    turnData[4, 10] = numpy.nan
+    naffResult = naffTunes(turnData, window=None)
+    assert numpy.isnan(naffResult[4])
+    assert numpy.abs(numpy.delete(naffResult + refTunes - 1.0, 4)).max() < 1e-8
+
+    with pytest.raises(ValueError):
+        fftTunes(turnData, window="blackman")
+    with pytest.raises(ValueError):
+        fftTunes(turnData[:, :3])
+
+    # From a tracking file
+    tuneFile = os.path.join(tmpDir, "tunes.one")
+    refTunes = [0.11, 0.23, 0.31, 0.42]
+    _writeTuneFile(filesDir, tuneFile, refTunes, 200, 3, 99)
+
+    tfsObj = TableFS(tuneFile, fastParse=True)
+    partNumbers, theTunes = trackTunes(tfsObj)
+    assert numpy.array_equal(partNumbers, [1, 2, 3, 4])
+    assert numpy.isnan(theTunes["X"][2])
+    assert numpy.allclose(numpy.delete(theTunes["X"], 2), [0.11, 0.23, 0.42], atol=1e-6)
+    assert numpy.allclose(numpy.delete(theTunes["Y"], 2), [0.42, 0.31, 0.11], atol=1e-6)
+
+    with pytest.raises(ValueError):
+        trackTunes(tfsObj, method="spline")
+
+# END Test testAnalysis_Tunes
+
+@pytest.mark.analysis
+def testAnalysis_TrackTensor(tmpDir, filesDir):
+    """Scatter tracking data into a dense tensor.
+    """
+    tuneFile = os.path.join(tmpDir, "tensor.one")
+    _writeTuneFile(filesDir, tuneFile, [0.11, 0.23, 0.31, 0.42], 30, 2, 11)
+
+    tfsObj = TableFS(tuneFile, fastParse=True)
+    partNumbers, turnNumbers, theTensor, validMask, lossTurn = trackTensor(tfsObj)
+    assert numpy.array_equal(partNumbers, [1, 2, 3, 4])
+    assert numpy.array_equal(turnNumbers, numpy.arange(30))
+    assert theTensor.shape == (4, 30, 6)
+    assert validMask.sum() == len(tfsObj.Data["X"])
+    assert numpy.array_equal(validMask[1], numpy.arange(30) <= 11)
+    assert numpy.array_equal(lossTurn, [-1, 12, -1, -1])
+    assert numpy.isnan(theTensor[1, 12:]).all()
+
+    _, _, turnData = groupTurns(tfsObj, ["X", "PX", "Y", "PY", "T", "PT"])
+    for iCol, colName in enumerate(["X", "PX", "Y", "PY", "T", "PT"]):
+        assert numpy.array_equal(theTensor[..., iCol], turnData[colName], equal_nan=True)
+
+    # Into a memory-mapped file
+    outFile = os.path.join(tmpDir, "tensor.npy")
+    outArr = numpy.lib.format.open_memmap(outFile, mode="w+", dtype="float32", shape=(4, 30, 2))
+    _, _, theTensor, _, _ = trackTensor(tfsObj, ["X", "Y"], outArr=outArr, fillValue=0.0)
+    assert theTensor is outArr
+    outArr.flush()
+    del outArr, theTensor
+    theTensor = numpy.load(outFile)
+    assert numpy.array_equal(theTensor[..., 1], numpy.nan_to_num(turnData["Y"]).astype("float32"))
+
+    with pytest.raises(ValueError):
+        trackTensor(tfsObj, ["X", "Y"], outArr=numpy.empty((4, 30, 3)))
+
+    # Several observation points
+    tfsObj = TableFS(os.path.join(filesDir, "particles.one"), fastParse=True)
+    with pytest.raises(ValueError):
+        trackTensor(tfsObj)
+    _, _, theTensor, validMask, lossTurn = trackTensor(tfsObj, "X", obsNumber=2)
+    assert numpy.array_equal(theTensor[:, 0, 0], tfsObj.getObservation(2)["X"])
+    assert validMask.all()
+    assert (lossTurn == -1).all()
+
+# END Test testAnalysis_TrackTensor
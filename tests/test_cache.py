@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : TableCache Tests
+============================
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import time
+import shutil
+import pytest
+import numpy
+
+from madxtools import TableCache, TableFS
+
+@pytest.mark.cache
+def testCache_LoadStore(tmpDir, filesDir):
+    """Check that tables are read back from the cache.
+    """
+    cacheDir = os.path.join(tmpDir, "cache_load")
+    testFile = os.path.join(tmpDir, "cache_load.tfs")
+    shutil.copyfile(os.path.join(filesDir, "fodothin_90.tfs"), testFile)
+
+    theCache = TableCache(cacheDir)
+    assert os.path.isdir(cacheDir)
+    assert theCache.load(testFile) is None
+
+    refObj = TableFS(testFile, fastParse=True)
+    tfsObj = TableFS(testFile, cache=theCache)
+    assert len(os.listdir(cacheDir)) == 1
+    assert not isinstance(tfsObj.Data["S"], numpy.memmap)
+
+    # Second read comes from the cache
+    tfsObj = TableFS(testFile, cache=theCache)
+    assert isinstance(tfsObj.Data["S"], numpy.memmap)
+    assert tfsObj.metaData == refObj.metaData
+    assert tfsObj.varNames == refObj.varNames
+    assert tfsObj.varTypes == refObj.varTypes
+    assert tfsObj.nLines == 7
+    assert tfsObj.hasNAME is True
+    assert tfsObj.segments == []
+    for vN in refObj.varNames:
+        assert numpy.array_equal(tfsObj.Data[vN], refObj.Data[vN])
+
+    # Shifting works on read-only arrays
+    tfsObj.shiftSeq("Q2D")
+    assert tfsObj.Data["NAME"][0] == "Q2D"
+
+    # Changing the file invalidates the entry
+    with open(testFile, mode="a") as outFile:
+        outFile.write(' "EXTRA" "MARKER" 106.9 0 1 0 0 1 0 0\n')
+    assert theCache.load(testFile) is None
+    tfsObj = TableFS(testFile, cache=theCache)
+    assert tfsObj.nLines == 8
+    assert theCache.load(testFile)[3]["NAME"][-1] == "EXTRA"
+
+    theCache.clear()
+    assert os.listdir(cacheDir) == []
+
+# END Test testCache_LoadStore
+
+@pytest.mark.cache
+def testCache_Evict(tmpDir, filesDir):
+    """Check that the least recently used entries are evicted.
+    """
+    cacheDir = os.path.join(tmpDir, "cache_evict")
+    theCache = TableCache(cacheDir, maxBytes=None)
+
+    allFiles = []
+    for i in range(3):
+        testFile = os.path.join(tmpDir, "cache_evict_%d.tfs" % i)
+        shutil.copyfile(os.path.join(filesDir, "particles.one"), testFile)
+        allFiles.append(testFile)
+        _ = TableFS(testFile, cache=theCache)
+        time.sleep(0.01)
+
+    assert len(os.listdir(cacheDir)) == 3
+    tfsObj = TableFS(allFiles[2], cache=theCache)
+    assert isinstance(tfsObj.Data["X"], numpy.memmap)
+    assert tfsObj.segments == TableFS(allFiles[2], fastParse=True).segments
+    assert len(tfsObj.getObservation(2)["X"]) == 10
+    entrySize = sum(
+        e.stat().st_size for e in os.scandir(os.path.join(cacheDir, os.listdir(cacheDir)[0]))
+    )
+
+    # Use the first file, so that the second is the oldest
+    assert theCache.load(allFiles[0]) is not None
+    theCache.maxBytes = 2*entrySize
+    theCache.evict()
+    assert len(os.listdir(cacheDir)) == 2
+    assert theCache.load(allFiles[0]) is not None
+    assert theCache.load(allFiles[1]) is None
+    assert theCache.load(allFiles[2]) is not None
+
+# END Test testCache_Evict
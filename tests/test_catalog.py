@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Catalog Tests
+=========================
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import gzip
+import shutil
+import pytest
+
+from madxtools import TableCatalog, TableFS, scanHeaders
+from madxtools.catalog import _scanFile, readTableHeader
+
+@pytest.mark.catalog
+def testCatalog_ScanHeaders(tmpDir, filesDir):
+    """Check reading the headers of a folder of files.
+    """
+    scanDir = os.path.join(tmpDir, "scan_headers")
+    if os.path.isdir(scanDir):
+        shutil.rmtree(scanDir)
+    os.makedirs(os.path.join(scanDir, "sub"))
+
+    twissFile = os.path.join(filesDir, "fodothin_90.tfs")
+    trackFile = os.path.join(filesDir, "particles.one")
+    shutil.copyfile(twissFile, os.path.join(scanDir, "twiss.tfs"))
+    with open(trackFile, mode="rb") as inFile:
+        with gzip.open(os.path.join(scanDir, "sub", "track.one.gz"), mode="wb") as outFile:
+            outFile.write(inFile.read())
+    with open(os.path.join(scanDir, "notes.txt"), mode="w") as outFile:
+        outFile.write("Not a TFS file\n")
+    with open(os.path.join(scanDir, "sub", "data.bin"), mode="wb") as outFile:
+        outFile.write(b"\xff\xfe\x00\x81" * 100)
+
+    refTwiss = TableFS(twissFile)
+    refTrack = TableFS(trackFile)
+
+    # Header only read
+    tfsObj = TableFS()
+    tfsObj.readFile(twissFile, headerOnly=True)
+    assert tfsObj.metaData == refTwiss.metaData
+    assert tfsObj.varNames == refTwiss.varNames
+    assert tfsObj.varTypes == refTwiss.varTypes
+    assert tfsObj.hasNAME
+    assert tfsObj.nLines == 0
+    assert tfsObj.Data == {}
+    assert readTableHeader(trackFile) == (
+        refTrack.metaData, refTrack.varNames, refTrack.varTypes
+    )
+
+    # Scan a folder
+    theHeaders = scanHeaders(scanDir, nWorkers=4)
+    assert list(theHeaders) == [
+        os.path.join(scanDir, "sub", "track.one.gz"), os.path.join(scanDir, "twiss.tfs")
+    ]
+    metaData, varNames, varTypes = theHeaders[os.path.join(scanDir, "twiss.tfs")]
+    assert metaData["LENGTH"] == 106.9
+    assert varNames == refTwiss.varNames
+    metaData, varNames, varTypes = theHeaders[os.path.join(scanDir, "sub", "track.one.gz")]
+    assert metaData == refTrack.metaData
+    assert varTypes == refTrack.varTypes
+
+    # Scan with a file pattern, a glob, or a list
+    assert list(scanHeaders(scanDir, filePattern="*.tfs")) == [
+        os.path.join(scanDir, "twiss.tfs")
+    ]
+    assert list(scanHeaders(os.path.join(scanDir, "*.*"), nWorkers=1)) == [
+        os.path.join(scanDir, "twiss.tfs")
+    ]
+    assert list(scanHeaders([trackFile, os.path.join(scanDir, "missing.tfs")])) == [trackFile]
+
+# END Test testCatalog_ScanHeaders
+
+@pytest.mark.catalog
+def testCatalog_TableCatalog(monkeypatch, tmpDir, filesDir):
+    """Check the SQLite catalog.
+    """
+    scanDir = os.path.join(tmpDir, "table_catalog")
+    dbFile = os.path.join(tmpDir, "table_catalog.db")
+    if os.path.isdir(scanDir):
+        shutil.rmtree(scanDir)
+    if os.path.isfile(dbFile):
+        os.unlink(dbFile)
+    os.makedirs(scanDir)
+
+    twissFile = os.path.join(scanDir, "twiss.tfs")
+    trackFile = os.path.join(scanDir, "particles.one")
+    obsFile = os.path.join(scanDir, "track.obs0001.p0001")
+    shutil.copyfile(os.path.join(filesDir, "fodothin_90.tfs"), twissFile)
+    shutil.copyfile(os.path.join(filesDir, "particles.one"), trackFile)
+    shutil.copyfile(os.path.join(filesDir, "fodothintrack_90.tfs.obs0001.p0001"), obsFile)
+    with open(os.path.join(scanDir, "notes.txt"), mode="w") as outFile:
+        outFile.write("Not a TFS file\n")
+
+    with TableCatalog(dbFile) as theCat:
+        assert theCat.update(scanDir, nWorkers=2) == (3, 0)
+        assert theCat.update(scanDir, nWorkers=1) == (0, 0)
+
+        # File entries
+        twissEntry = theCat.getEntry(twissFile)
+        assert twissEntry["path"] == twissFile
+        assert twissEntry["size"] == os.path.getsize(twissFile)
+        assert twissEntry["nRows"] == 7
+        assert twissEntry["minTurn"] is None
+        assert twissEntry["metaData"] == TableFS(twissFile).metaData
+        assert twissEntry["varNames"][:3] == ["NAME", "KEYWORD", "S"]
+        assert twissEntry["varTypes"][:3] == ["%s", "%s", "%le"]
+
+        refObj = TableFS(trackFile, fastParse=True)
+        trackEntry = theCat.getEntry(trackFile)
+        assert trackEntry["nRows"] == refObj.nLines
+        assert trackEntry["minPart"] == refObj.Data["NUMBER"].min()
+        assert trackEntry["maxPart"] == refObj.Data["NUMBER"].max()
+        assert trackEntry["maxTurn"] == refObj.Data["TURN"].max()
+        assert theCat.getEntry(os.path.join(scanDir, "notes.txt")) is None
+
+        # Queries
+        assert theCat.query() == sorted([obsFile, trackFile, twissFile])
+        assert theCat.query(TYPE="TWISS", SEQUENCE="FODOTHIN", ENERGY=7000) == [twissFile]
+        assert theCat.query(TYPE="TWISS", ENERGY=6500) == []
+        assert theCat.query(ENERGY=(6000, 8000)) == [twissFile]
+        assert theCat.query(TYPE="TRACKONE") == [trackFile]
+        assert theCat.query(hasColumns=["NUMBER", "TURN"]) == sorted([obsFile, trackFile])
+        assert theCat.query(hasColumns=["BETX"], TYPE="TRACKONE") == []
+
+        # Incremental updates
+        with open(twissFile, mode="r") as inFile:
+            twissData = inFile.read()
+        with open(twissFile, mode="w") as outFile:
+            outFile.write(twissData.replace('"FODOTHIN"', '"FODOTHICK"'))
+        os.unlink(obsFile)
+        assert theCat.update(scanDir, nWorkers=1) == (1, 1)
+        assert theCat.query(SEQUENCE="FODOTHIN") == []
+        assert theCat.query(SEQUENCE="FODOTHICK") == [twissFile]
+        assert theCat.getEntry(obsFile) is None
+
+    # The catalog is persistent
+    with TableCatalog(dbFile) as theCat:
+        assert theCat.query() == sorted([trackFile, twissFile])
+
+    # Tracking files are scanned in chunks
+    with monkeypatch.context() as mp:
+        mp.setattr("madxtools.catalog.SCAN_CHUNK_ROWS", 7)
+        chunkEntry = _scanFile(trackFile)
+    for entryKey in ("nRows", "minPart", "maxPart", "minTurn", "maxTurn"):
+        assert chunkEntry[entryKey] == trackEntry[entryKey]
+
+# END Test testCatalog_TableCatalog
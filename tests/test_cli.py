@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Command Line Tool Tests
+===================================
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import sys
+import pytest
+import numpy
+import subprocess
+
+from madxtools import TableFS
+from madxtools.cli import main
+
+@pytest.mark.cli
+def testCli_Header(monkeypatch, capsys, filesDir):
+    """Print header summaries.
+    """
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    assert main(["header", testFile, "--meta"]) == 0
+    theOutput = capsys.readouterr().out
+    assert "TWISS table, 10 columns" in theOutput
+    assert "  BETX                 %le" in theOutput
+    assert "@ SEQUENCE           FODOTHIN" in theOutput
+
+    assert main(["header", os.path.join(filesDir, "missing.tfs")]) == 1
+    assert "madxtools: error:" in capsys.readouterr().err
+
+    with pytest.raises(SystemExit):
+        main(["nocommand"])
+
+    # NumPy is only loaded when a command runs
+    theCode = "import sys, madxtools.cli; print('numpy' in sys.modules)"
+    theResult = subprocess.run(
+        [sys.executable, "-c", theCode], capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(filesDir))
+    )
+    assert theResult.stdout.strip() == "False"
+
+    # Nor by printing a header
+    theCode = (
+        "import sys; from madxtools.cli import main; main(['header', sys.argv[1]]); "
+        "print('numpy' in sys.modules)"
+    )
+    theResult = subprocess.run(
+        [sys.executable, "-c", theCode, testFile], capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(filesDir))
+    )
+    assert theResult.stdout.splitlines()[-1] == "False"
+
+    # Run as a module
+    theResult = subprocess.run(
+        [sys.executable, "-m", "madxtools.cli", "header", testFile], capture_output=True,
+        text=True, cwd=os.path.dirname(os.path.dirname(filesDir))
+    )
+    assert theResult.returncode == 0
+    assert "TWISS table, 10 columns" in theResult.stdout
+
+    # Missing optional packages are reported as errors
+    def importFail(theArgs):
+        raise ImportError("No module named 'numpy'")
+
+    with monkeypatch.context() as mp:
+        mp.setattr("madxtools.cli.runHeader", importFail)
+        assert main(["header", testFile]) == 1
+    assert "madxtools: error: No module named" in capsys.readouterr().err
+
+# END Test testCli_Header
+
+@pytest.mark.cli
+def testCli_Convert(tmpDir, filesDir):
+    """Filter and convert files.
+    """
+    twissFile = os.path.join(filesDir, "fodothin_90.tfs")
+    trackFile = os.path.join(filesDir, "particles.one")
+
+    # Filter by NAME and S
+    outFile = os.path.join(tmpDir, "cli_twiss.tfs")
+    assert main([
+        "convert", twissFile, outFile, "--name", "Q|DRIFT_0", "--s-range", "0", "60",
+        "--columns", "NAME,BETX", "--chunk-rows", "2"
+    ]) == 0
+    tfsObj = TableFS(outFile, fastParse=True)
+    assert tfsObj.varNames == ["NAME", "BETX"]
+    assert tfsObj.Data["NAME"].tolist() == ["Q1F", "DRIFT_0", "Q2D"]
+
+    # Filter by TURN, with segment lines only before kept rows
+    outFile = os.path.join(tmpDir, "cli_track.one")
+    assert main([
+        "convert", trackFile, outFile, "--turn-range", "1", "1", "--chunk-rows", "7"
+    ]) == 0
+    refObj = TableFS(trackFile, fastParse=True)
+    tfsObj = TableFS(outFile, fastParse=True)
+    assert tfsObj.nLines == 20
+    assert numpy.array_equal(tfsObj.Data["X"], refObj.Data["X"][10:])
+    assert [s["elemName"] for s in tfsObj.segments] == ["ip", "clic_ff$end"]
+    assert [s["rowStart"] for s in tfsObj.segments] == [0, 10]
+
+    # Binary output
+    outFile = os.path.join(tmpDir, "cli_twiss.npy")
+    assert main(["convert", twissFile, outFile, "--columns", "NAME,S,BETY"]) == 0
+    recData = numpy.load(outFile)
+    refObj = TableFS(twissFile, fastParse=True)
+    assert recData.dtype == numpy.dtype([("NAME", "U14"), ("S", "f8"), ("BETY", "f8")])
+    assert recData["NAME"].tolist() == refObj.Data["NAME"].tolist()
+    assert numpy.array_equal(recData["BETY"], refObj.Data["BETY"])
+
+    assert main(["convert", twissFile, outFile, "--str-len", "4"]) == 1
+    assert main(["convert", trackFile, outFile, "--name", "Q"]) == 1
+    assert main(["convert", twissFile, "-", "--format", "npy"]) == 1
+
+# END Test testCli_Convert
+
+@pytest.mark.cli
+def testCli_Summary(capsys, filesDir):
+    """Print column statistics.
+    """
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    assert main(["summary", testFile, "--columns", "NAME,S", "--chunk-rows", "3"]) == 0
+    theLines = capsys.readouterr().out.splitlines()
+    assert theLines[0].endswith(": 7 rows")
+    assert theLines[2].split() == ["NAME", "-", "-", "-"]
+    sData = TableFS(testFile, fastParse=True).Data["S"]
+    assert numpy.allclose(
+        [float(x) for x in theLines[3].split()[1:]], [sData.min(), sData.max(), sData.mean()]
+    )
+
+# END Test testCli_Summary
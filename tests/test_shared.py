@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : Shared Memory Tests
+===============================
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import gc
+import os
+import sys
+import pickle
+import pytest
+import numpy
+import subprocess
+import multiprocessing
+
+from madxtools import SharedTable, TableFS, attachTable
+
+def _closeTable(sharedTab):
+    """Attach to, and close, a SharedTable inherited by a forked process.
+    """
+    tfsObj = attachTable(sharedTab.descriptor)
+    assert tfsObj.nLines > 0
+    sharedTab.close()
+
+@pytest.mark.shared
+def testShared_Attach(filesDir):
+    """Publish a table and attach to it.
+    """
+    testFile = os.path.join(filesDir, "particles.one")
+    refObj = TableFS(testFile, fastParse=True)
+
+    with SharedTable(refObj) as sharedTab:
+        tableDesc = pickle.loads(pickle.dumps(sharedTab.descriptor))
+        tfsObj = attachTable(tableDesc)
+        assert tfsObj.varNames == refObj.varNames
+        assert tfsObj.metaData == refObj.metaData
+        assert tfsObj.segments == refObj.segments
+        assert tfsObj.nLines == refObj.nLines
+        for vN in refObj.varNames:
+            assert numpy.array_equal(tfsObj.Data[vN], refObj.Data[vN])
+            assert not tfsObj.Data[vN].flags.writeable
+        assert numpy.array_equal(tfsObj.getObservation(2)["X"], refObj.getObservation(2)["X"])
+
+        # Views of the same memory
+        otherObj = attachTable(tableDesc)
+        assert otherObj.Data["X"].__array_interface__["data"][0] != refObj.Data["X"].ctypes.data
+        with pytest.raises(ValueError):
+            tfsObj.Data["X"][0] = 1.0
+
+        # A view outlives its table
+        theColumn = otherObj.Data["PX"]
+        del otherObj
+        gc.collect()
+        assert numpy.array_equal(theColumn, refObj.Data["PX"])
+
+        # A separate process attaches, and exits without removing the block
+        theCode = (
+            "import sys, pickle; from madxtools import attachTable; "
+            "t = attachTable(pickle.loads(sys.stdin.buffer.read())); "
+            "print(repr(float(t.Data['X'].sum())))"
+        )
+        theEnv = {eK: eV for eK, eV in os.environ.items() if eK != "MADXTOOLS_LOGLEVEL"}
+        theResult = subprocess.run(
+            [sys.executable, "-c", theCode], input=pickle.dumps(tableDesc), capture_output=True,
+            cwd=os.path.dirname(os.path.dirname(filesDir)), env=theEnv
+        )
+        assert float(theResult.stdout) == float(refObj.Data["X"].sum())
+        assert theResult.stderr == b""
+        assert numpy.array_equal(attachTable(tableDesc).Data["Y"], refObj.Data["Y"])
+
+    # The block is removed, but attached views remain valid
+    with pytest.raises(FileNotFoundError):
+        attachTable(tableDesc)
+    assert numpy.array_equal(tfsObj.Data["X"], refObj.Data["X"])
+    assert numpy.array_equal(theColumn, refObj.Data["PX"])
+
+# END Test testShared_Attach
+
+@pytest.mark.shared
+def testShared_Columns(filesDir):
+    """Publish compact and unconverted tables.
+    """
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    refObj = TableFS(testFile)
+    with pytest.raises(ValueError):
+        SharedTable(refObj)
+
+    refObj.convertToNumpy(compact=True)
+    sharedTab = SharedTable(refObj)
+    tfsObj = attachTable(sharedTab.descriptor)
+    assert tfsObj.getColumn("KEYWORD").tolist() == refObj.getColumn("KEYWORD").tolist()
+    assert tfsObj.Data["NAME"].tolist() == refObj.Data["NAME"].tolist()
+    assert tfsObj.Data["BETX"].dtype == refObj.Data["BETX"].dtype
+
+    blockName = sharedTab.blockName
+    del sharedTab
+    gc.collect()
+    with pytest.raises(FileNotFoundError):
+        attachTable({"blockName": blockName})
+
+# END Test testShared_Columns
+
+@pytest.mark.shared
+def testShared_Fork(filesDir):
+    """Close a published table in a forked process.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("The fork start method is not available")
+
+    testFile = os.path.join(filesDir, "particles.one")
+    refObj = TableFS(testFile, fastParse=True)
+
+    with SharedTable(refObj) as sharedTab:
+        theProc = multiprocessing.get_context("fork").Process(
+            target=_closeTable, args=(sharedTab,)
+        )
+        theProc.start()
+        theProc.join()
+        assert theProc.exitcode == 0
+
+        # Only the publisher removes the block
+        tfsObj = attachTable(sharedTab.descriptor)
+        assert numpy.array_equal(tfsObj.Data["X"], refObj.Data["X"])
+
+    with pytest.raises(FileNotFoundError):
+        attachTable(sharedTab.descriptor)
+
+# END Test testShared_Fork
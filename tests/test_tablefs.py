@@ -21,12 +21,18 @@ along with this program. If not, see <https://www.gnu.org/licenses/>.
 """
 
 import os
+import bz2
+import gzip
+import lzma
 import pytest
 import numpy
+import shutil
 
 from dummy import causeOSError
 
-from madxtools import TableFS
+from madxtools import TableCache, TableFS
+from madxtools.fileio import compressionType, findTailStart, openTableFile
+from madxtools.parser import parseDataLines
 
 @pytest.mark.tfs
 def testTFS_FileError(monkeypatch, filesDir):
@@ -238,3 +244,912 @@ def testTFS_ShiftSequence(filesDir):
     assert list(tfsObj.Data["S"]) == [0.0, 53.45, 53.45, 53.45, 53.45, 53.45, 106.9]
 
 # END Test testTFS_ShiftSequence
+
+@pytest.mark.tfs
+def testTFS_FastParse(filesDir):
+    """Check that the vectorised parser gives the same result as the
+    line by line parser followed by convertToNumpy.
+    """
+    for fileName in ("fodothin_90.tfs", "fodothintrack_90.tfs.obs0001.p0001", "particles.one"):
+        testFile = os.path.join(filesDir, fileName)
+
+        refObj = TableFS(testFile)
+        refObj.convertToNumpy()
+
+        tfsObj = TableFS(testFile, fastParse=True)
+        assert tfsObj.metaData == refObj.metaData
+        assert tfsObj.varNames == refObj.varNames
+        assert tfsObj.varTypes == refObj.varTypes
+        assert tfsObj.nLines == refObj.nLines
+        assert tfsObj.hasNAME == refObj.hasNAME
+        for vN in refObj.varNames:
+            assert tfsObj.Data[vN].dtype.kind == refObj.Data[vN].dtype.kind
+            assert numpy.array_equal(tfsObj.Data[vN], refObj.Data[vN])
+
+    # Quoted strings
+    tfsObj.readFile(os.path.join(filesDir, "fodothin_90.tfs"))
+    assert list(tfsObj.Data["KEYWORD"][:2]) == ["MARKER", "MULTIPOLE"]
+
+    # Converting again is a no-op
+    tfsObj.convertToNumpy()
+    assert isinstance(tfsObj.Data["S"][0], float)
+
+# END Test testTFS_FastParse
+
+@pytest.mark.tfs
+def testTFS_FastParseErrors(tmpDir):
+    """Check the error handling of the vectorised parser.
+    """
+    testFile = os.path.join(tmpDir, "fast_errors.tfs")
+    with open(testFile, mode="w") as outFile:
+        outFile.write(
+            "@ NAME %05s \"TWISS\"\n"
+            "* NAME KEYWORD S\n"
+            "$ %s %s %le\n"
+            " 'Q1' \"DRIFT\" 1.0\n"
+            " \"Q2\" \"DRIFT\" 2.0 3.0\n"
+        )
+
+    with pytest.raises(IndexError):
+        _ = TableFS(testFile, fastParse=True)
+
+    with open(testFile, mode="w") as outFile:
+        outFile.write(
+            "* NAME KEYWORD S\n"
+            "$ %s %s %le\n"
+            " 'Q1' \"DRIFT\" 1.0\n"
+            " \"Q2\" DRIFT 2.0\n"
+        )
+
+    tfsObj = TableFS(testFile, fastParse=True)
+    assert list(tfsObj.Data["NAME"]) == ["Q1", "Q2"]
+    assert list(tfsObj.Data["KEYWORD"]) == ["DRIFT", "DRIFT"]
+    assert list(tfsObj.Data["S"]) == [1.0, 2.0]
+
+    # Header only
+    with open(testFile, mode="w") as outFile:
+        outFile.write("* NAME S\n$ %s %le\n")
+
+    tfsObj = TableFS(testFile, fastParse=True)
+    assert tfsObj.nLines == 0
+    assert len(tfsObj.Data["S"]) == 0
+
+# END Test testTFS_FastParseErrors
+
+@pytest.mark.tfs
+def testTFS_IterChunks(filesDir):
+    """Check streaming a file in chunks.
+    """
+    testFile = os.path.join(filesDir, "particles.one")
+    refObj = TableFS(testFile, fastParse=True)
+
+    tfsObj = TableFS()
+    with pytest.raises(ValueError):
+        next(tfsObj.iterChunks(testFile, chunkRows=0))
+
+    allChunks = list(tfsObj.iterChunks(testFile, chunkRows=7))
+    assert tfsObj.metaData == refObj.metaData
+    assert tfsObj.varNames == refObj.varNames
+    assert tfsObj.varTypes == refObj.varTypes
+    assert tfsObj.Data == {}
+    assert tfsObj.nLines == 30
+    assert tfsObj.hasNAME is False
+
+    # The segment comment lines count towards the chunk size
+    assert [len(c["NUMBER"]) for c in allChunks] == [6, 6, 7, 6, 5]
+    for vN in refObj.varNames:
+        assert numpy.array_equal(numpy.concatenate([c[vN] for c in allChunks]), refObj.Data[vN])
+
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    allChunks = list(tfsObj.iterChunks(testFile))
+    assert len(allChunks) == 1
+    assert list(allChunks[0]["NAME"][:2]) == ["FODOTHIN$START", "Q1F"]
+    assert tfsObj.hasNAME is True
+
+# END Test testTFS_IterChunks
+
+@pytest.mark.tfs
+def testTFS_Segments(filesDir):
+    """Check the segment index of particles.one files.
+    """
+    testFile = os.path.join(filesDir, "particles.one")
+    for fastParse in (False, True):
+        tfsObj = TableFS(testFile, fastParse=fastParse)
+        assert tfsObj.segments == [{
+            "segment": 1, "nSegments": 2, "nPart": 10, "elemIndex": 0, "elemName": "start",
+            "obsNumber": 1, "turn": 0, "rowStart": 0, "rowEnd": 10,
+        }, {
+            "segment": 2, "nSegments": 2, "nPart": 10, "elemIndex": 7, "elemName": "ip",
+            "obsNumber": 2, "turn": 1, "rowStart": 10, "rowEnd": 20,
+        }, {
+            "segment": 3, "nSegments": 2, "nPart": 10, "elemIndex": 9,
+            "elemName": "clic_ff$end", "obsNumber": 3, "turn": 1, "rowStart": 20, "rowEnd": 30,
+        }]
+
+    # Segment data are views
+    segData = tfsObj.getSegment(1)
+    assert list(segData["S"]) == [47.3]*10
+    assert list(segData["NUMBER"]) == list(range(1, 11))
+    assert numpy.shares_memory(segData["X"], tfsObj.Data["X"])
+
+    obsData = tfsObj.getObservation(3)
+    assert list(obsData["S"]) == [50.0]*10
+    assert numpy.shares_memory(obsData["X"], tfsObj.Data["X"])
+    with pytest.raises(KeyError):
+        tfsObj.getObservation(4)
+
+    # Several segments at the same observation point are concatenated
+    tfsObj.segments[2]["obsNumber"] = 2
+    obsData = tfsObj.getObservation(2)
+    assert list(obsData["S"]) == [47.3]*10 + [50.0]*10
+
+    # Streaming records the segments too
+    refSegs = tfsObj.segments
+    refSegs[2]["obsNumber"] = 3
+    list(tfsObj.iterChunks(testFile, chunkRows=4))
+    assert tfsObj.segments == refSegs
+
+    # Files without segments
+    tfsObj = TableFS(os.path.join(filesDir, "fodothin_90.tfs"), fastParse=True)
+    assert tfsObj.segments == []
+
+# END Test testTFS_Segments
+
+@pytest.mark.tfs
+def testTFS_UseCols(filesDir):
+    """Check reading a selection of columns.
+    """
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    refObj = TableFS(testFile, fastParse=True)
+
+    with pytest.raises(KeyError):
+        _ = TableFS(testFile, useCols=["S", "STUFF"])
+    with pytest.raises(ValueError):
+        _ = TableFS(testFile, useCols=[])
+
+    # Columns are returned in file order
+    tfsObj = TableFS(testFile, useCols=["BETY", "S", "NAME"])
+    assert tfsObj.varNames == ["NAME", "S", "BETY"]
+    assert tfsObj.varTypes == ["%s", "%le", "%le"]
+    assert list(tfsObj.Data.keys()) == ["NAME", "S", "BETY"]
+    assert tfsObj.nLines == 7
+    assert tfsObj.hasNAME is True
+    for vN in tfsObj.varNames:
+        assert numpy.array_equal(tfsObj.Data[vN], refObj.Data[vN])
+
+    tfsObj.readFile(useCols=["S"])
+    assert tfsObj.hasNAME is False
+    assert list(tfsObj.Data.keys()) == ["S"]
+
+    # Streaming
+    allChunks = list(tfsObj.iterChunks(chunkRows=3, useCols=["BETX"]))
+    assert [list(c.keys()) for c in allChunks] == [["BETX"]]*3
+    assert tfsObj.varNames == ["BETX"]
+    assert tfsObj.nLines == 7
+
+    # All read paths select and order the columns the same way
+    trackFile = os.path.join(filesDir, "particles.one")
+    allReads = [
+        lambda t, c: t.readFile(trackFile, useCols=c),
+        lambda t, c: t.readFile(trackFile, useCols=c, fastParse=True),
+        lambda t, c: t.readFile(trackFile, useCols=c, lazy=True),
+        lambda t, c: list(t.iterChunks(trackFile, useCols=c)),
+        lambda t, c: t.readTurns(trackFile, turnStep=1, useCols=c),
+        lambda t, c: t.follow(trackFile, useCols=c),
+    ]
+    for readFunc in allReads:
+        with pytest.raises(KeyError):
+            readFunc(TableFS(), ["X", "STUFF"])
+        tfsObj = TableFS()
+        readFunc(tfsObj, ["PX", "TURN", "X"])
+        assert tfsObj.varNames == ["TURN", "X", "PX"]
+        assert tfsObj.varTypes == ["%le"]*3
+
+# END Test testTFS_UseCols
+
+@pytest.mark.tfs
+def testTFS_LazyColumns(monkeypatch, tmpDir, filesDir):
+    """Check parsing columns on first access.
+    """
+    testFile = os.path.join(filesDir, "particles.one")
+    refObj = TableFS(testFile, fastParse=True)
+
+    tfsObj = TableFS(testFile, lazy=True)
+    assert tfsObj.nLines == 30
+    assert tfsObj.varNames == refObj.varNames
+    assert tfsObj.segments == refObj.segments
+    assert tfsObj.hasNAME is False
+    assert "X" in tfsObj.Data
+    assert "STUFF" not in tfsObj.Data
+    assert list(tfsObj.Data) == refObj.varNames
+    assert not any(tfsObj.Data.isLoaded(vN) for vN in tfsObj.varNames)
+
+    assert numpy.array_equal(tfsObj.Data["X"], refObj.Data["X"])
+    assert tfsObj.Data.isLoaded("X")
+    assert not tfsObj.Data.isLoaded("Y")
+    assert tfsObj.Data.get("STUFF") is None
+    with pytest.raises(KeyError):
+        _ = tfsObj.Data["STUFF"]
+
+    # A loaded column is not parsed again
+    with monkeypatch.context() as mp:
+        mp.setattr("builtins.open", causeOSError)
+        assert numpy.array_equal(tfsObj.Data["X"], refObj.Data["X"])
+        with pytest.raises(OSError):
+            _ = tfsObj.Data["Y"]
+
+    tfsObj.Data.materialize(["Y", "PY"])
+    assert tfsObj.Data.isLoaded("PY")
+    for vN, vData in tfsObj.Data.items():
+        assert numpy.array_equal(vData, refObj.Data[vN])
+
+    # Methods that use all columns load them in a single scan
+    parseCalls = []
+
+    def countParse(*parseArgs, **parseKwargs):
+        parseCalls.append(parseKwargs.get("useCols"))
+        return parseDataLines(*parseArgs, **parseKwargs)
+
+    with monkeypatch.context() as mp:
+        mp.setattr("madxtools.tablefs.parseDataLines", countParse)
+        tfsObj = TableFS(testFile, lazy=True)
+        theSeg = tfsObj.getSegment(1)
+        assert len(parseCalls) == 1
+        for vN in refObj.varNames:
+            assert numpy.array_equal(theSeg[vN], refObj.getSegment(1)[vN])
+        tfsObj.getObservation(2)
+        tfsObj.writeFile(os.path.join(tmpDir, "lazy_write.one"))
+        assert len(parseCalls) == 1
+
+        tfsObj = TableFS(os.path.join(filesDir, "fodothin_90.tfs"), lazy=True)
+        tfsObj.shiftSeq("DRIFT_0")
+        assert len(parseCalls) == 2
+        assert parseCalls[1] == tfsObj.varNames
+
+    # Lazy with a column selection
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    tfsObj = TableFS(testFile, lazy=True, useCols=["NAME", "S"])
+    assert tfsObj.varNames == ["NAME", "S"]
+    assert tfsObj.hasNAME is True
+    assert list(tfsObj.Data["NAME"][:2]) == ["FODOTHIN$START", "Q1F"]
+    with pytest.raises(KeyError):
+        _ = tfsObj.Data["BETX"]
+
+    # The file must not change
+    lazyFile = os.path.join(tmpDir, "lazy_changed.tfs")
+    with open(testFile) as inFile:
+        srcText = inFile.read()
+    with open(lazyFile, mode="w") as outFile:
+        outFile.write(srcText)
+    tfsObj = TableFS(lazyFile, lazy=True)
+    with open(lazyFile, mode="a") as outFile:
+        outFile.write(srcText.splitlines(True)[-1])
+    with pytest.raises(OSError):
+        _ = tfsObj.Data["S"]
+
+# END Test testTFS_LazyColumns
+
+@pytest.mark.tfs
+def testTFS_NameIndex(tmpDir, filesDir):
+    """Check the name index and the cached column search.
+    """
+    testFile = os.path.join(filesDir, "fodothintrack_90.tfs.obs0001.p0001")
+    tfsObj = TableFS(testFile)
+    with pytest.raises(TypeError):
+        tfsObj.findName("Q1F")
+
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    tfsObj = TableFS(testFile, fastParse=True)
+    assert tfsObj.findName("FODOTHIN$START") == 0
+    assert tfsObj.findName("Q2D") == 3
+    with pytest.raises(KeyError):
+        tfsObj.findName("STUFF")
+
+    # The index follows the shifts
+    tfsObj.shiftSeq("Q2D")
+    assert tfsObj.findName("Q2D") == 0
+    assert tfsObj.findName("FODOTHIN$START") == 4
+    tfsObj.shiftSeq("Q1F")
+    assert tfsObj.findName("Q1F") == 0
+    assert tfsObj.findName("Q2D") == 2
+    for i, elemName in enumerate(tfsObj.Data["NAME"]):
+        assert tfsObj.findName(elemName) == i
+
+    # Re-reading resets the index
+    tfsObj.readFile()
+    assert tfsObj.findName("Q2D") == 3
+
+    # Duplicate names return the first in the current order
+    dupeFile = os.path.join(tmpDir, "dupe_names.tfs")
+    with open(dupeFile, mode="w") as outFile:
+        outFile.write(
+            "@ LENGTH %le 4.0\n"
+            "* NAME S\n"
+            "$ %s %le\n"
+            " \"M\" 0.0\n \"D\" 1.0\n \"M\" 2.0\n \"Q\" 3.0\n"
+        )
+    tfsObj = TableFS(dupeFile, fastParse=True)
+    assert tfsObj.findName("M") == 0
+    tfsObj.shiftSeq("D")
+    assert list(tfsObj.Data["NAME"]) == ["D", "M", "Q", "M"]
+    assert tfsObj.findName("M") == 1
+    tfsObj.shiftSeq("Q")
+    assert tfsObj.findName("M") == 1
+
+    # Many repeated names
+    with open(dupeFile, mode="w") as outFile:
+        outFile.write("@ LENGTH %le 5000.0\n* NAME S\n$ %s %le\n")
+        for i in range(5000):
+            outFile.write(" \"E%04d\" %.1f\n" % ((i*7) % 1000, i))
+    tfsObj = TableFS(dupeFile, fastParse=True)
+    allNames = tfsObj.Data["NAME"].tolist()
+    for elemName in ("E0000", "E0007", "E0500", "E0999"):
+        assert tfsObj.findName(elemName) == allNames.index(elemName)
+    tfsObj.shiftSeq("E0003")
+    allNames = tfsObj.Data["NAME"].tolist()
+    for elemName in ("E0000", "E0007", "E0500", "E0999"):
+        assert tfsObj.findName(elemName) == allNames.index(elemName)
+
+# END Test testTFS_NameIndex
+
+@pytest.mark.tfs
+def testTFS_DataMask(filesDir):
+    """Check the batched column search.
+    """
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    tfsObj = TableFS(testFile, fastParse=True)
+
+    theMask = tfsObj.findDataMask("KEYWORD", "MULTI")
+    assert theMask.tolist() == [False, True, False, True, False, True, False]
+    assert "MULTI" in tfsObj._searchCache["KEYWORD"][2]
+    assert tfsObj.findDataMask("KEYWORD", "MULTI").tolist() == theMask.tolist()
+    assert tfsObj.findDataIndex("NAME", "^Q.*") == [1, 3, 5]
+    assert tfsObj.findDataIndex("NAME", ".*END$") == [6]
+
+    # Shifting clears the cache
+    tfsObj.shiftSeq("Q2D")
+    assert tfsObj._searchCache == {}
+    assert tfsObj.findDataIndex("NAME", "^Q.*") == [0, 2, 5]
+
+# END Test testTFS_DataMask
+
+@pytest.mark.tfs
+def testTFS_ShiftSequenceInPlace(filesDir):
+    """Rotate the elements in the lattice without copying the arrays.
+    """
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    refObj = TableFS(testFile, fastParse=True)
+    tfsObj = TableFS(testFile, fastParse=True)
+    sData = tfsObj.Data["S"]
+    nameData = tfsObj.Data["NAME"]
+
+    for newFirst in ("Q2D", "DRIFT_0", "Q3F", "FODOTHIN$START", "FODOTHIN$START"):
+        refObj.shiftSeq(newFirst)
+        tfsObj.shiftSeq(newFirst, inPlace=True)
+        assert tfsObj.Data["S"] is sData
+        assert tfsObj.Data["NAME"] is nameData
+        assert tfsObj.seqShift == refObj.seqShift
+        for vN in refObj.varNames:
+            assert numpy.array_equal(tfsObj.Data[vN], refObj.Data[vN])
+        assert tfsObj.findName(newFirst) == 0
+
+    assert list(tfsObj.Data["NAME"]) == [
+        "FODOTHIN$START", "Q1F", "DRIFT_0", "Q2D", "DRIFT_1", "Q3F", "FODOTHIN$END"
+    ]
+    assert tfsObj.seqShift == 0
+
+    # Index built after a shift
+    tfsObj.shiftSeq("DRIFT_1", inPlace=True)
+    tfsObj._nameIndex = None
+    assert tfsObj.findName("DRIFT_1") == 0
+    assert tfsObj.findName("Q1F") == 4
+
+# END Test testTFS_ShiftSequenceInPlace
+
+@pytest.mark.tfs
+def testTFS_CompactData(tmpDir, filesDir):
+    """Check the compact conversion to NumPy arrays.
+    """
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    refObj = TableFS(testFile)
+    refObj.convertToNumpy()
+
+    tfsObj = TableFS(testFile)
+    tfsObj.convertToNumpy(compact=True, floatCols=["BETX", "BETY"])
+
+    # KEYWORD has three distinct values out of seven, NAME has seven
+    assert list(tfsObj.strVocab) == ["KEYWORD"]
+    assert tfsObj.strVocab["KEYWORD"].tolist() == ["DRIFT", "MARKER", "MULTIPOLE"]
+    assert tfsObj.Data["KEYWORD"].dtype == numpy.uint8
+    assert tfsObj.Data["KEYWORD"].tolist() == [1, 2, 0, 2, 0, 2, 1]
+    assert numpy.array_equal(tfsObj.getColumn("KEYWORD"), refObj.Data["KEYWORD"])
+    assert numpy.array_equal(tfsObj.getColumn("NAME"), refObj.Data["NAME"])
+    assert tfsObj.Data["BETX"].dtype == numpy.float32
+    assert tfsObj.Data["ALFX"].dtype == numpy.float64
+    assert numpy.allclose(tfsObj.Data["BETX"], refObj.Data["BETX"], rtol=1e-7)
+
+    # Searching, shifting and writing work on encoded data
+    assert tfsObj.findDataIndex("KEYWORD", "MULTI") == [1, 3, 5]
+    tfsObj.shiftSeq("Q2D")
+    refObj.shiftSeq("Q2D")
+    assert numpy.array_equal(tfsObj.getColumn("KEYWORD"), refObj.Data["KEYWORD"])
+    assert tfsObj.findDataIndex("KEYWORD", "MARKER") == [3, 4]
+
+    outFile = os.path.join(tmpDir, "compact_data.tfs")
+    tfsObj.writeFile(outFile)
+    newObj = TableFS(outFile, fastParse=True)
+    assert numpy.array_equal(newObj.Data["KEYWORD"], refObj.Data["KEYWORD"])
+
+    # Converting again keeps the encoding
+    tfsObj.convertToNumpy()
+    assert tfsObj.Data["KEYWORD"].dtype == numpy.uint8
+    assert tfsObj.Data["BETX"].dtype == numpy.float64
+
+    # Integer columns of tracking files
+    testFile = os.path.join(filesDir, "particles.one")
+    refObj = TableFS(testFile, fastParse=True)
+    tfsObj = TableFS(testFile, fastParse=True)
+    tfsObj.convertToNumpy(compact=True, floatCols=True)
+    assert tfsObj.Data["NUMBER"].dtype == numpy.int8
+    assert tfsObj.Data["TURN"].dtype == numpy.int8
+    assert tfsObj.Data["X"].dtype == numpy.float32
+    assert tfsObj.Data["NUMBER"].tolist() == refObj.Data["NUMBER"].tolist()
+
+    testFile = os.path.join(filesDir, "fodothintrack_90.tfs.obs0001.p0001")
+    tfsObj = TableFS(testFile, fastParse=True)
+    tfsObj.Data["NUMBER"][0] = -200
+    tfsObj.convertToNumpy(compact=True, intCols=["NUMBER"])
+    assert tfsObj.Data["NUMBER"].dtype == numpy.int16
+    assert tfsObj.Data["TURN"].dtype == numpy.int8
+    assert tfsObj.Data["X"].dtype == numpy.float64
+
+# END Test testTFS_CompactData
+
+@pytest.mark.tfs
+def testTFS_Stats(filesDir):
+    """Check the timing statistics of reads and conversions.
+    """
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    fileSize = os.path.getsize(testFile)
+    allStats = []
+
+    # Default parser
+    tfsObj = TableFS(testFile, statsHook=allStats.append)
+    assert len(allStats) == 1
+    assert tfsObj.stats is allStats[0]
+    assert tfsObj.stats.operation == "readFile"
+    assert tfsObj.stats.nRows == 7
+    assert tfsObj.stats.nBytes == fileSize
+    assert set(tfsObj.stats.phaseTimes) == {"io", "parse", "segments"}
+    assert tfsObj.stats.peakColBytes == 0
+
+    tfsObj.convertToNumpy(compact=True)
+    assert len(allStats) == 2
+    assert tfsObj.stats.operation == "convertToNumpy"
+    assert set(tfsObj.stats.phaseTimes) == {"convert", "compact"}
+    assert tfsObj.stats.peakColBytes >= sum(d.nbytes for d in tfsObj.Data.values())
+
+    # Fast parser
+    tfsObj.readFile(fastParse=True)
+    assert len(allStats) == 3
+    assert set(tfsObj.stats.phaseTimes) == {
+        "header", "io", "tokenize", "convert", "quotes", "segments"
+    }
+    assert tfsObj.stats.peakColBytes == sum(d.nbytes for d in tfsObj.Data.values())
+    assert tfsObj.stats.wallTime >= sum(tfsObj.stats.phaseTimes.values())
+    assert tfsObj.stats.rowsPerSec() > 0.0
+    assert tfsObj.stats.bytesPerSec() > 0.0
+
+    statsDict = tfsObj.stats.asDict()
+    assert statsDict["nRows"] == 7
+    assert statsDict["fileName"] == testFile
+
+    # Lazy and chunked reads
+    tfsObj.readFile(lazy=True)
+    assert set(tfsObj.stats.phaseTimes) == {"header", "io", "scan"}
+    assert tfsObj.stats.peakColBytes == 0
+
+    tfsObj = TableFS(statsHook=allStats.append)
+    assert len(list(tfsObj.iterChunks(testFile, chunkRows=3))) == 3
+    assert tfsObj.stats.operation == "iterChunks"
+    assert tfsObj.stats.nRows == 7
+    assert len(allStats) == 5
+
+# END Test testTFS_Stats
+
+@pytest.mark.tfs
+def testTFS_Compressed(tmpDir, filesDir):
+    """Check reading compressed files.
+    """
+    refFile = os.path.join(filesDir, "particles.one")
+    refObj = TableFS(refFile, fastParse=True)
+    with open(refFile, mode="rb") as inFile:
+        rawData = inFile.read()
+
+    compFiles = {
+        "gz": os.path.join(tmpDir, "compressed.one.gz"),
+        "bz2": os.path.join(tmpDir, "compressed.one.bz2"),
+        "xz": os.path.join(tmpDir, "compressed.one.xz"),
+    }
+    with gzip.open(compFiles["gz"], mode="wb") as outFile:
+        outFile.write(rawData)
+    with bz2.open(compFiles["bz2"], mode="wb") as outFile:
+        outFile.write(rawData)
+    with lzma.open(compFiles["xz"], mode="wb") as outFile:
+        outFile.write(rawData)
+
+    # Detected by magic bytes, regardless of suffix
+    noSuffix = os.path.join(tmpDir, "compressed_one")
+    shutil.copyfile(compFiles["xz"], noSuffix)
+    assert compressionType(noSuffix) == "xz"
+    assert compressionType(refFile) is None
+
+    for compType, compFile in compFiles.items():
+        assert compressionType(compFile) == compType
+
+        slowObj = TableFS(compFile)
+        assert slowObj.metaData == refObj.metaData
+        assert slowObj.Data["X"] == TableFS(refFile).Data["X"]
+        assert len(slowObj.segments) == 3
+
+        for tfsObj in (TableFS(compFile, fastParse=True), TableFS(compFile, lazy=True)):
+            assert tfsObj.metaData == refObj.metaData
+            assert tfsObj.segments == refObj.segments
+            for vN in refObj.varNames:
+                assert numpy.array_equal(tfsObj.Data[vN], refObj.Data[vN])
+
+        tfsObj = TableFS()
+        allChunks = list(tfsObj.iterChunks(compFile, chunkRows=10))
+        assert numpy.array_equal(
+            numpy.concatenate([c["PX"] for c in allChunks]), refObj.Data["PX"]
+        )
+
+    # The reader thread stops if the file is closed early
+    with openTableFile(noSuffix) as tfsFile:
+        assert tfsFile.readline().startswith("@ NAME")
+
+    # Decompression errors reach the caller
+    with open(compFiles["gz"], mode="rb") as inFile:
+        badData = inFile.read()
+    badFile = os.path.join(tmpDir, "compressed_bad.one.gz")
+    with open(badFile, mode="wb") as outFile:
+        outFile.write(badData[:len(badData)//2])
+    with pytest.raises(EOFError):
+        TableFS(badFile, fastParse=True)
+
+# END Test testTFS_Compressed
+
+@pytest.mark.tfs
+def testTFS_Follow(tmpDir, filesDir):
+    """Check following a file that is being written.
+    """
+    refFile = os.path.join(filesDir, "particles.one")
+    testFile = os.path.join(tmpDir, "follow_particles.one")
+    refObj = TableFS(refFile, fastParse=True)
+    with open(refFile, mode="rb") as inFile:
+        rawData = inFile.read()
+
+    tfsObj = TableFS()
+    with pytest.raises(ValueError):
+        tfsObj.refresh()
+
+    # Write the file in pieces, cutting lines in the middle
+    headEnd = rawData.index(b"\n#segment")
+    allCuts = [headEnd//2, headEnd + 1, headEnd + 150, rawData.index(b"\n#segment", headEnd + 1)]
+    allCuts += [len(rawData) - 40, len(rawData)]
+    with open(testFile, mode="wb") as outFile:
+        outFile.write(rawData[:allCuts[0]])
+    assert tfsObj.follow(testFile) == 0
+    assert tfsObj.varNames == []
+
+    colRefs = {}
+    prevCut = allCuts[0]
+    for theCut in allCuts[1:]:
+        with open(testFile, mode="ab") as outFile:
+            outFile.write(rawData[prevCut:theCut])
+        prevCut = theCut
+        nOld = tfsObj.nLines
+        nNew = tfsObj.refresh()
+        assert tfsObj.nLines == nOld + nNew
+        assert tfsObj.stats.nRows == nNew
+        for vN in refObj.varNames:
+            assert numpy.array_equal(tfsObj.Data[vN], refObj.Data[vN][:tfsObj.nLines])
+        if tfsObj.nLines > 0:
+            colRefs[theCut] = tfsObj.Data["X"]
+
+    assert tfsObj.metaData == refObj.metaData
+    assert tfsObj.varTypes == refObj.varTypes
+    assert tfsObj.nLines == refObj.nLines
+    assert tfsObj.segments == refObj.segments
+    assert tfsObj.refresh() == 0
+
+    # The buffers are only reallocated when they are full
+    assert len(set(id(d.base) for d in colRefs.values())) == 1
+
+    # Selected columns
+    tfsObj = TableFS()
+    tfsObj.follow(testFile, useCols=["TURN", "X"])
+    assert tfsObj.varNames == ["TURN", "X"]
+    assert numpy.array_equal(tfsObj.Data["X"], refObj.Data["X"])
+    assert tfsObj.segments == refObj.segments
+
+    # A file that shrinks is read again
+    with open(testFile, mode="wb") as outFile:
+        outFile.write(rawData[:allCuts[3] + 1])
+    tfsObj.refresh()
+    assert tfsObj.nLines == 10
+    assert len(tfsObj.segments) == 1
+    assert numpy.array_equal(tfsObj.Data["X"], refObj.Data["X"][:10])
+
+    # Reading the file ends following it
+    tfsObj.readFile(testFile)
+    with pytest.raises(ValueError):
+        tfsObj.refresh()
+
+# END Test testTFS_Follow
+
+@pytest.mark.tfs
+def testTFS_InterpolateAt(tmpDir, filesDir):
+    """Check looking up optics at S positions.
+    """
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    tfsObj = TableFS(testFile, fastParse=True)
+    sPos = numpy.array([0.0, 10.0, 53.45, 80.0, 106.9, 120.0, -10.0])
+
+    # Linear interpolation
+    betX = tfsObj.Data["BETX"]
+    theValues = tfsObj.interpolateAt(sPos, ["BETX", "MUX"])
+    assert numpy.allclose(theValues["BETX"][:5], [
+        betX[1], betX[1] + (betX[2] - betX[1])*10.0/53.45, betX[3],
+        betX[3] + (betX[4] - betX[3])*26.55/53.45, betX[1],
+    ])
+    assert numpy.allclose(theValues["BETX"][5], betX[1] + (betX[2] - betX[1])*13.1/53.45)
+    assert numpy.allclose(
+        theValues["BETX"][6], tfsObj.interpolateAt(96.9, "BETX")
+    )
+    assert numpy.allclose(theValues["MUX"][2], tfsObj.Data["MUX"][3])
+
+    # Element lookup
+    assert tfsObj.findElementAt(sPos).tolist() == [0, 2, 2, 4, 0, 2, 4]
+    assert tfsObj.interpolateAt(sPos, "NAME", method="element").tolist() == [
+        "FODOTHIN$START", "DRIFT_0", "DRIFT_0", "DRIFT_1", "FODOTHIN$START", "DRIFT_0", "DRIFT_1"
+    ]
+    with pytest.raises(ValueError):
+        tfsObj.interpolateAt(sPos, "NAME")
+    with pytest.raises(ValueError):
+        tfsObj.interpolateAt(sPos, "BETX", method="spline")
+
+    # A table that stops short of LENGTH wraps to the first element
+    shortFile = os.path.join(tmpDir, "fodothin_short.tfs")
+    with open(testFile, mode="r") as inFile:
+        fileLines = inFile.readlines()
+    with open(shortFile, mode="w") as outFile:
+        outFile.writelines(fileLines[:-3])
+    shortObj = TableFS(shortFile, fastParse=True)
+    assert shortObj.metaData["LENGTH"] == 106.9
+    assert shortObj.findElementAt([50.0, 53.45, 80.0, 106.0]).tolist() == [2, 2, 0, 0]
+
+    # A shifted sequence gives the same optics at the same place
+    refValues = tfsObj.interpolateAt(sPos + 53.45, ["BETX", "BETY", "ALFX"])
+    tfsObj.shiftSeq("Q2D")
+    theValues = tfsObj.interpolateAt(sPos, ["BETX", "BETY", "ALFX"])
+    for vN in theValues:
+        assert numpy.allclose(theValues[vN], refValues[vN])
+    assert tfsObj.interpolateAt(sPos, "NAME", method="element")[1] == "DRIFT_1"
+
+    # Needs numeric S
+    tfsObj = TableFS(testFile)
+    with pytest.raises(ValueError):
+        tfsObj.interpolateAt(sPos, "BETX")
+
+# END Test testTFS_InterpolateAt
+
+@pytest.mark.tfs
+def testTFS_Records(filesDir):
+    """Check exporting to a record array, and parsing into one.
+    """
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    refObj = TableFS(testFile, fastParse=True)
+
+    # Copy from separate columns
+    recData = refObj.toRecords()
+    assert recData.dtype.names == tuple(refObj.varNames)
+    assert recData["NAME"].tolist() == refObj.Data["NAME"].tolist()
+    assert numpy.array_equal(recData["BETX"], refObj.Data["BETX"])
+    assert refObj.toRecords(["S", "NAME"]).dtype.names == ("S", "NAME")
+    with pytest.raises(KeyError):
+        refObj.toRecords(["Q"])
+
+    # Parse into a preallocated array
+    tfsObj = TableFS()
+    tfsObj.readFile(testFile, headerOnly=True)
+    recType = tfsObj.recordDType(["NAME", "S", "BETX"], strLen=16)
+    assert recType == numpy.dtype([("NAME", "U16"), ("S", "f8"), ("BETX", "f8")])
+    outRecords = numpy.zeros(20, dtype=recType)
+    tfsObj.readFile(testFile, outRecords=outRecords)
+    assert tfsObj.nLines == 7
+    assert tfsObj.varNames == ["NAME", "S", "BETX"]
+    assert numpy.array_equal(outRecords["BETX"][:7], refObj.Data["BETX"])
+    assert numpy.shares_memory(tfsObj.Data["S"], outRecords)
+
+    # Exported without copying, until a column is replaced
+    assert tfsObj.toRecords().base is outRecords
+    assert numpy.shares_memory(tfsObj.toRecords(["BETX", "NAME"]), outRecords)
+    tfsObj.Data["S"] = tfsObj.Data["S"].copy()
+    assert not numpy.shares_memory(tfsObj.toRecords(), outRecords)
+    assert numpy.shares_memory(tfsObj.toRecords(["NAME"]), outRecords)
+
+    # Too small arrays
+    with pytest.raises(ValueError):
+        tfsObj.readFile(testFile, outRecords=numpy.zeros(20, dtype=[("NAME", "U4")]))
+    with pytest.raises(IndexError):
+        tfsObj.readFile(testFile, outRecords=numpy.zeros(5, dtype=[("S", "f8")]))
+    with pytest.raises(TypeError):
+        tfsObj.readFile(testFile, outRecords=numpy.zeros(20))
+
+# END Test testTFS_Records
+
+@pytest.mark.tfs
+def testTFS_DataFrame(filesDir):
+    """Check exporting to a pandas DataFrame.
+    """
+    pandas = pytest.importorskip("pandas")
+    testFile = os.path.join(filesDir, "fodothin_90.tfs")
+    tfsObj = TableFS(testFile, fastParse=True)
+
+    theFrame = tfsObj.toDataFrame(["NAME", "BETX"])
+    assert isinstance(theFrame, pandas.DataFrame)
+    assert list(theFrame.columns) == ["NAME", "BETX"]
+    assert theFrame["NAME"].tolist() == tfsObj.Data["NAME"].tolist()
+    assert numpy.array_equal(theFrame["BETX"].to_numpy(), tfsObj.Data["BETX"])
+
+# END Test testTFS_DataFrame
+
+@pytest.mark.tfs
+def testTFS_RowFilter(tmpDir, filesDir):
+    """Check dropping rows while parsing.
+    """
+    trackFile = os.path.join(filesDir, "particles.one")
+    twissFile = os.path.join(filesDir, "fodothin_90.tfs")
+    refObj = TableFS(trackFile, fastParse=True)
+
+    # Particles and turns, on columns that are not stored
+    rowFilter = {"NUMBER": ("in", [2, 5, 9]), "TURN": ("every", 2, 1)}
+    tfsObj = TableFS(trackFile, useCols=["X", "PX"], rowFilter=rowFilter)
+    rowMask = numpy.isin(refObj.Data["NUMBER"], [2, 5, 9]) & (refObj.Data["TURN"] == 1)
+    assert tfsObj.varNames == ["X", "PX"]
+    assert tfsObj.nLines == 6
+    assert numpy.array_equal(tfsObj.Data["X"], refObj.Data["X"][rowMask])
+    assert [(s["rowStart"], s["rowEnd"]) for s in tfsObj.segments] == [(0, 3), (3, 6)]
+    assert [s["obsNumber"] for s in tfsObj.segments] == [2, 3]
+    assert numpy.array_equal(tfsObj.getObservation(3)["PX"], refObj.getObservation(3)["PX"][
+        [1, 4, 8]
+    ])
+
+    # Several conditions on a column
+    tfsObj = TableFS()
+    tfsObj.readFile(twissFile, rowFilter={
+        "NAME": ("match", "Q|DRIFT"), "S": [("range", 10.0, None), ("range", None, 110.0)]
+    })
+    assert tfsObj.Data["NAME"].tolist() == ["DRIFT_0", "Q2D", "DRIFT_1", "Q3F"]
+    assert tfsObj.segments == []
+
+    # Through the cache
+    cacheObj = TableCache(os.path.join(tmpDir, "rowfilter_cache"))
+    for _ in range(2):
+        tfsObj = TableFS(trackFile, cache=cacheObj, rowFilter=rowFilter)
+        assert numpy.array_equal(tfsObj.Data["X"], refObj.Data["X"][rowMask])
+        assert [(s["rowStart"], s["rowEnd"]) for s in tfsObj.segments] == [(0, 3), (3, 6)]
+
+    # Errors
+    with pytest.raises(KeyError):
+        TableFS(twissFile, rowFilter={"Q": ("in", [1])})
+    with pytest.raises(ValueError):
+        TableFS(twissFile, rowFilter={"S": ("above", 1.0)})
+    with pytest.raises(ValueError):
+        TableFS(twissFile, rowFilter={"S": ("range", 1.0)})
+    with pytest.raises(ValueError):
+        TableFS(twissFile, rowFilter={"S": ("match", "1")})
+    with pytest.raises(ValueError):
+        TableFS(twissFile, rowFilter={"S": ("in", [0.0])}, lazy=True)
+
+# END Test testTFS_RowFilter
+
+def _writeTurnFile(filesDir, outFile, nTurns, nPart):
+    """Write a trackone file with two observation points per turn.
+    """
+    with open(os.path.join(filesDir, "particles.one")) as inFile:
+        headLines = [theLine for theLine in inFile if theLine[0] in "@*$"]
+
+    with open(outFile, mode="w") as tfsFile:
+        tfsFile.writelines(headLines)
+        for iTurn in range(nTurns):
+            for iObs, obsName in ((0, "start"), (7, "ip")):
+                tfsFile.write("#segment %7d %7d %7d %7d %s\n" % (
+                    2*iTurn + 1 + (iObs > 0), 2*nTurns, nPart, iObs, obsName
+                ))
+                for p in range(1, nPart+1):
+                    tfsFile.write("%19d %18d" % (p, iTurn) + " %18.10e"*8 % (
+                        (p + iTurn + iObs)*1e-4, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
+                    ) + "\n")
+
+    return
+
+@pytest.mark.tfs
+def testTFS_ReadTurns(tmpDir, filesDir):
+    """Check reading a subset of turns.
+    """
+    turnFile = os.path.join(tmpDir, "turns.one")
+    _writeTurnFile(filesDir, turnFile, 30, 4)
+    refObj = TableFS(turnFile, fastParse=True)
+
+    # Stride and list
+    tfsObj = TableFS()
+    tfsObj.readTurns(turnFile, turnStep=10, useCols=["X"])
+    assert tfsObj.varNames == ["X"]
+    assert numpy.array_equal(tfsObj.Data["X"], refObj.Data["X"][refObj.Data["TURN"] % 10 == 0])
+    assert [s["turn"] for s in tfsObj.segments] == [0, 0, 10, 10, 20, 20]
+    tfsObj.readTurns(turnFile, turnList=[1, 2, 4, 8, 16])
+    assert numpy.unique(tfsObj.Data["TURN"]).tolist() == [1, 2, 4, 8, 16]
+
+    # Tail window, read from the end
+    rowMask = refObj.Data["TURN"] >= 25
+    tfsObj.readTurns(turnFile, lastTurns=5, useCols=["NUMBER", "X"])
+    assert tfsObj.nLines == 40
+    assert tfsObj.stats.nBytes < os.path.getsize(turnFile)/5
+    assert numpy.array_equal(tfsObj.Data["X"], refObj.Data["X"][rowMask])
+    assert [(s["turn"], s["obsNumber"], s["rowStart"]) for s in tfsObj.segments[:3]] == [
+        (25, 1, 0), (25, 2, 4), (26, 1, 8)
+    ]
+    assert numpy.array_equal(tfsObj.getObservation(2)["X"], refObj.getObservation(2)["X"][-20:])
+
+    tfsObj.readTurns(turnFile, lastTurns=100)
+    assert tfsObj.nLines == refObj.nLines
+    assert tfsObj.segments == refObj.segments
+
+    # Small blocks when seeking
+    with open(turnFile, mode="rb") as inFile:
+        fileData = inFile.read()
+    dataPos = fileData.index(b"#segment")
+    for blockSize in (50, 97, 1000):
+        tailPos = findTailStart(turnFile, dataPos, 1, 5, blockSize=blockSize)
+        assert fileData[tailPos:].startswith(b"#segment      51")
+    assert findTailStart(turnFile, dataPos, 1, 30, blockSize=50) == dataPos
+
+    # Compressed files are filtered instead
+    gzipFile = os.path.join(tmpDir, "turns.one.gz")
+    with open(turnFile, mode="rb") as inFile, gzip.open(gzipFile, mode="wb") as outFile:
+        shutil.copyfileobj(inFile, outFile)
+    gzObj = TableFS()
+    gzObj.readTurns(gzipFile, lastTurns=5, useCols=["NUMBER", "X"])
+    assert gzObj.varNames == ["NUMBER", "X"]
+    assert numpy.array_equal(gzObj.Data["X"], refObj.Data["X"][rowMask])
+    assert gzObj.segments == TableFS(turnFile, rowFilter={"TURN": ("range", 25, None)}).segments
+
+    gzObj = TableFS()
+    gzObj.readTurns(gzipFile, lastTurns=3)
+    tfsObj.readTurns(turnFile, lastTurns=3)
+    assert gzObj.varNames == refObj.varNames
+    assert gzObj.nLines == tfsObj.nLines == 24
+    assert gzObj.segments == tfsObj.segments
+    for vN in refObj.varNames:
+        assert numpy.array_equal(gzObj.Data[vN], tfsObj.Data[vN])
+
+    gzipFile = os.path.join(tmpDir, "turns_twiss.tfs.gz")
+    with open(os.path.join(filesDir, "fodothin_90.tfs"), mode="rb") as inFile:
+        with gzip.open(gzipFile, mode="wb") as outFile:
+            shutil.copyfileobj(inFile, outFile)
+    with pytest.raises(KeyError):
+        TableFS().readTurns(gzipFile, lastTurns=3)
+
+    # Errors
+    with pytest.raises(ValueError):
+        tfsObj.readTurns(turnFile)
+    with pytest.raises(ValueError):
+        tfsObj.readTurns(turnFile, turnStep=2, lastTurns=3)
+    with pytest.raises(ValueError):
+        tfsObj.readTurns(turnFile, lastTurns=0)
+    with pytest.raises(KeyError):
+        tfsObj.readTurns(os.path.join(filesDir, "fodothin_90.tfs"), lastTurns=3)
+
+# END Test testTFS_ReadTurns
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : TrackSet Tests
+==========================
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import pytest
+import numpy
+
+from madxtools import TableFS, loadTrackSet
+
+def _writeTrackFiles(filesDir, setDir, nObs, nPart):
+    """Write a set of tracking files based on the test file, with one
+    turn less for each particle number.
+    """
+    if not os.path.isdir(setDir):
+        os.mkdir(setDir)
+
+    with open(os.path.join(filesDir, "fodothintrack_90.tfs.obs0001.p0001")) as inFile:
+        srcLines = inFile.readlines()
+
+    for i in range(1, nObs+1):
+        for j in range(1, nPart+1):
+            trackFile = os.path.join(setDir, "track.tfs.obs%04d.p%04d" % (i, j))
+            with open(trackFile, mode="w") as outFile:
+                for srcLine in srcLines[:len(srcLines) - j + 1]:
+                    if srcLine.startswith("@ NAME"):
+                        srcLine = '@ NAME %%19s "TRACK.OBS%04d.P%04d"\n' % (i, j)
+                    outFile.write(srcLine)
+
+    return
+
+@pytest.mark.trackset
+def testTrackSet_Load(tmpDir, filesDir):
+    """Check loading and stacking a set of tracking files.
+    """
+    setDir = os.path.join(tmpDir, "trackset_load")
+    _writeTrackFiles(filesDir, setDir, 2, 3)
+    refObj = TableFS(os.path.join(setDir, "track.tfs.obs0002.p0002"), fastParse=True)
+
+    with pytest.raises(ValueError):
+        loadTrackSet(os.path.join(tmpDir, "nosuchfile*"))
+
+    for nWorkers in (1, 2):
+        trackSet = loadTrackSet(setDir, nWorkers=nWorkers)
+        assert len(trackSet.fileNames) == 6
+        assert list(trackSet.obsNumbers) == [1, 2]
+        assert list(trackSet.partNumbers) == [1, 2, 3]
+        assert trackSet.varNames == refObj.varNames
+        assert "NAME" not in trackSet.metaData
+        assert trackSet.metaData["TYPE"] == "TRACKOBS"
+        assert trackSet.nRows.tolist() == [[9, 8, 7], [9, 8, 7]]
+        assert trackSet.Data["X"].shape == (2, 3, 9)
+        assert trackSet.getMask().sum() == 48
+
+        theTrack = trackSet.getTrack(2, 2)
+        for vN in refObj.varNames:
+            assert numpy.array_equal(theTrack[vN], refObj.Data[vN])
+        assert numpy.isnan(trackSet.Data["X"][1, 2, 7:]).all()
+
+    with pytest.raises(KeyError):
+        trackSet.getTrack(3, 1)
+    with pytest.raises(KeyError):
+        trackSet.getTrack(1, 4)
+
+    # Glob pattern and file list
+    trackSet = loadTrackSet(os.path.join(setDir, "*.obs0001.*"), nWorkers=1)
+    assert list(trackSet.obsNumbers) == [1]
+    trackSet = loadTrackSet(trackSet.fileNames[:2] + [refObj.fileName + "x"], nWorkers=1)
+    assert list(trackSet.partNumbers) == [1, 2]
+
+    # Column types are promoted across files
+    setDir = os.path.join(tmpDir, "trackset_types")
+    if not os.path.isdir(setDir):
+        os.mkdir(setDir)
+    for i, (elemName, turnValue) in enumerate([("Q1", "1"), ("MQXFA.A1R5.LONG", "2.5")]):
+        with open(os.path.join(setDir, "track.obs%04d.p0001" % (i + 1)), mode="w") as outFile:
+            outFile.write("* NAME TURN\n$ %%s %%le\n \"%s\" %s\n" % (elemName, turnValue))
+    trackSet = loadTrackSet(setDir, nWorkers=1)
+    assert trackSet.Data["NAME"][:, 0, 0].tolist() == ["Q1", "MQXFA.A1R5.LONG"]
+    assert trackSet.Data["TURN"][:, 0, 0].tolist() == [1.0, 2.5]
+
+# END Test testTrackSet_Load
+
+@pytest.mark.trackset
+def testTrackSet_Mismatch(tmpDir, filesDir):
+    """Check the metadata consistency check.
+    """
+    setDir = os.path.join(tmpDir, "trackset_mismatch")
+    _writeTrackFiles(filesDir, setDir, 1, 2)
+
+    trackFile = os.path.join(setDir, "track.tfs.obs0001.p0002")
+    with open(trackFile) as inFile:
+        srcText = inFile.read()
+    with open(trackFile, mode="w") as outFile:
+        outFile.write(srcText.replace("TRACKOBS", "TRACKONE"))
+
+    with pytest.raises(ValueError):
+        loadTrackSet(setDir, nWorkers=1)
+
+    # Files written at different times
+    with open(trackFile, mode="w") as outFile:
+        outFile.write(srcText.replace("23.40.21", "23.40.22"))
+
+    trackSet = loadTrackSet(setDir, nWorkers=1)
+    assert "TIME" not in trackSet.metaData
+    with pytest.raises(ValueError):
+        loadTrackSet(setDir, nWorkers=1, ignoreMeta=("NAME",))
+
+    with open(trackFile, mode="w") as outFile:
+        outFile.write(srcText.replace("TURN ", "TURNS "))
+
+    with pytest.raises(ValueError):
+        loadTrackSet(setDir, nWorkers=1)
+
+# END Test testTrackSet_Mismatch
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+MadXTools : TFSWriter Tests
+===========================
+
+This file is a part of MadXTools
+Copyright 2017–2021 K.N. Sjobak, V. Berglyd Olsen, University of Oslo
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import pytest
+import numpy
+
+from madxtools import TableFS, TFSWriter
+from madxtools.writer import formatFloatColumn, formatIntColumn, formatStrColumn
+
+@pytest.mark.writer
+def testWriter_RoundTrip(tmpDir, filesDir):
+    """Check that written files are read back unchanged.
+    """
+    for fileName in ("fodothin_90.tfs", "fodothintrack_90.tfs.obs0001.p0001", "particles.one"):
+        refObj = TableFS(os.path.join(filesDir, fileName), fastParse=True)
+        outFile = os.path.join(tmpDir, "roundtrip_" + fileName)
+
+        # Both the string lists and the NumPy arrays can be written
+        for fastParse in (False, True):
+            tfsObj = TableFS(os.path.join(filesDir, fileName), fastParse=fastParse)
+            tfsObj.writeFile(outFile, chunkRows=4)
+
+            newObj = TableFS(outFile, fastParse=True)
+            assert newObj.metaData == refObj.metaData
+            assert newObj.varNames == refObj.varNames
+            assert newObj.varTypes == refObj.varTypes
+            assert newObj.segments == refObj.segments
+            for vN in refObj.varNames:
+                assert numpy.array_equal(newObj.Data[vN], refObj.Data[vN])
+
+    # The header and data lines are aligned
+    with open(os.path.join(tmpDir, "roundtrip_fodothin_90.tfs")) as inFile:
+        allLines = [tfsLine for tfsLine in inFile if tfsLine[0] != "@"]
+    assert allLines[0].startswith("* NAME             KEYWORD      ")
+    assert allLines[2].startswith('  "FODOTHIN$START" "MARKER"    ')
+    assert len(set(len(tfsLine) for tfsLine in allLines)) == 1
+    assert allLines[2].index("e+00") + 3 == allLines[0].index(" S ") + 1
+
+# END Test testWriter_RoundTrip
+
+@pytest.mark.writer
+def testWriter_Stream(tmpDir):
+    """Check writing a file in blocks.
+    """
+    outFile = os.path.join(tmpDir, "writer_stream.tfs")
+    with pytest.raises(IndexError):
+        TFSWriter(outFile, {}, ["A", "B"], ["%le"])
+    with pytest.raises(ValueError):
+        TFSWriter(outFile, {}, ["A"], ["%le"], sigDigits=16)
+
+    with TFSWriter(outFile, {"N": 1, "F": 0.5, "B": True, "S": "X"}, ["I", "F", "S"],
+                   ["%d", "%le", "%s"], sigDigits=10) as tfsWriter:
+        tfsWriter.writeChunk({"I": [1, -2], "F": [0.25, 2e-300], "S": ["A", "B C"]})
+        tfsWriter.writeChunk({"I": [], "F": [], "S": []})
+        tfsWriter.writeSegment({
+            "segment": 1, "nSegments": 1, "nPart": 1, "elemIndex": 0, "elemName": "start"
+        })
+        tfsWriter.writeChunk(
+            {"I": numpy.array([3]), "F": numpy.array([numpy.nan]), "S": numpy.array(["D"])}
+        )
+        with pytest.raises(IndexError):
+            tfsWriter.writeChunk({"I": [1], "F": [1.0, 2.0], "S": ["A"]})
+        assert tfsWriter.nLines == 3
+
+    tfsObj = TableFS(outFile, fastParse=True)
+    assert tfsObj.metaData == {"N": 1, "F": 0.5, "B": 1, "S": "X"}
+    assert tfsObj.Data["I"].tolist() == [1, -2, 3]
+    assert tfsObj.Data["F"][:2].tolist() == [0.25, 2e-300]
+    assert numpy.isnan(tfsObj.Data["F"][2])
+    assert tfsObj.Data["S"].tolist() == ["A", "B C", "D"]
+    assert tfsObj.segments[0]["rowStart"] == 2
+
+# END Test testWriter_Stream
+
+@pytest.mark.writer
+def testWriter_Format():
+    """Check the vectorised column formatting.
+    """
+    def fieldText(theField):
+        return [bytes(theRow).decode() for theRow in theField]
+
+    assert fieldText(formatIntColumn(numpy.array([0, 7, -17, 123456]))) == [
+        "      0", "      7", "    -17", " 123456"
+    ]
+    assert fieldText(formatIntColumn(numpy.array([-1, 0]))) == ["-1", " 0"]
+
+    assert fieldText(formatFloatColumn(numpy.array([0.0, -1.5, 99.99, 1e-5]), 3)) == [
+        " 0.00e+00", "-1.50e+00", " 1.00e+02", " 1.00e-05"
+    ]
+    assert fieldText(formatFloatColumn(numpy.array([1e100, numpy.inf, 5e-324]), 2)) == [
+        " 1.0e+100", "      inf", " 4.9e-324"
+    ]
+    theValues = numpy.array([0.1, 0.3, 2.0/3.0, 182.0922015, -1.292443919e-16, 6.02214076e23])
+    theField = formatFloatColumn(theValues, 15)
+    assert [float(bytes(theRow)) for theRow in theField] == [
+        0.1, 0.3, 0.666666666666667, 182.0922015, -1.292443919e-16, 6.02214076e23
+    ]
+
+    # The same digits as Python, also for very small and large values
+    theRng = numpy.random.default_rng(7)
+    theValues = numpy.concatenate([
+        theRng.standard_normal(20000)*10.0**theRng.integers(-30, 30, 20000),
+        theRng.standard_normal(2000)*10.0**theRng.integers(-310, 308, 2000),
+        [2e-300, -1e-300, 1e-294, 0.125, 2.5, -0.0, 9.9999999999999999, 1e23],
+    ])
+    for sigDigits in (1, 6, 15):
+        theFormat = "%%.%de" % (sigDigits - 1)
+        theField = formatFloatColumn(theValues, sigDigits)
+        for theRow, theValue in zip(fieldText(theField), theValues):
+            theMant, theExp = (theFormat % theValue).split("e")
+            assert theRow.split() == ["%se%s%03d" % (theMant, theExp[0], abs(int(theExp)))]
+
+    assert fieldText(formatStrColumn(numpy.array(["A", "BBB", ""]))) == [
+        '"A"  ', '"BBB"', '""   '
+    ]
+    assert fieldText(formatStrColumn(numpy.array(["Ø", "AB"]), quoted=False)) == ["Ø", "AB"]
+
+# END Test testWriter_Format